@@ -0,0 +1,96 @@
+"""
+Compare serial and process-pool page-parallel text extraction on the sample pdfs in data/papers.
+
+Usage (from the repo root):
+    python -m benchmarks.extraction_benchmark --workers 4 --repeat 3
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+import fitz
+
+from src.core.analyzer.extractor.content_extractor import (
+    ContentExtractor,
+    ContentExtractorConfig,
+    extract_page_range
+)
+from src.core.storage.local_storage import LocalStorage
+
+
+def valid_pdfs(papers_dir: Path):
+    """Sample pdfs that can be opened, skipping empty or broken downloads."""
+    for path in sorted(papers_dir.glob("*.pdf")):
+        try:
+            with fitz.open(path) as doc:
+                if doc.page_count:
+                    yield path, doc.page_count
+        except Exception:
+            continue
+
+
+def time_serial(path: Path, page_count: int, format: str) -> float:
+    started_at = time.perf_counter()
+    extract_page_range(str(path), 0, page_count, format)
+    return time.perf_counter() - started_at
+
+
+async def time_parallel(extractor: ContentExtractor, path: Path, format: str) -> float:
+    started_at = time.perf_counter()
+    await extractor.extract_pages(path, format)
+    return time.perf_counter() - started_at
+
+
+async def run(args) -> list:
+    extractor = ContentExtractor(
+        LocalStorage(args.data_dir),
+        ContentExtractorConfig(max_workers=args.workers, min_pages_per_worker=args.min_pages_per_worker)
+    )
+    results = []
+    try:
+        # Start the worker processes before timing
+        pdfs = list(valid_pdfs(args.data_dir / "papers"))
+        if pdfs:
+            await extractor.extract_pages(pdfs[0][0], args.format)
+
+        for path, page_count in pdfs:
+            serial = [time_serial(path, page_count, args.format) for _ in range(args.repeat)]
+            parallel = [await time_parallel(extractor, path, args.format) for _ in range(args.repeat)]
+            results.append({
+                "paper": path.stem,
+                "pages": page_count,
+                "serial_seconds": statistics.median(serial),
+                "parallel_seconds": statistics.median(parallel),
+                "speedup": statistics.median(serial) / statistics.median(parallel)
+            })
+    finally:
+        extractor.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", type=Path, default=Path("data"))
+    parser.add_argument("--workers", type=int, default=ContentExtractorConfig().max_workers)
+    parser.add_argument("--min-pages-per-worker", type=int, default=ContentExtractorConfig().min_pages_per_worker)
+    parser.add_argument("--format", default="markdown")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'paper':<10} {'pages':>5} {'serial (s)':>11} {'parallel (s)':>13} {'speedup':>8}")
+    for result in results:
+        print(f"{result['paper']:<10} {result['pages']:>5} {result['serial_seconds']:>11.3f} "
+              f"{result['parallel_seconds']:>13.3f} {result['speedup']:>7.2f}x")
+
+    if args.json:
+        args.json.write_text(json.dumps({"workers": args.workers, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
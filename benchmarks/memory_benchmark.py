@@ -0,0 +1,115 @@
+"""
+Measure the peak RSS of the per-analysis pdf handling, reading whole files into memory (before)
+versus opening them by path / memory-mapped (after), on the sample pdfs in data/papers.
+
+Each measurement runs in a fresh process, so peak RSS isn't inflated by earlier measurements.
+
+Usage (from the repo root):
+    python -m benchmarks.memory_benchmark --json memory.json
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import resource
+from pathlib import Path
+
+import fitz
+
+from src.core.analyzer.extractor.content_extractor import extract_page_range
+from src.core.analyzer.extractor.pdf_slimmer import PdfSlimmer
+from src.core.analyzer.pdf_dump_analyzer import PdfDumpAnalyzer
+from src.core.storage.local_storage import LocalStorage
+
+
+def text_analysis_before(path: Path) -> None:
+    """Text extraction and page rendering as done before, from a copy of the whole file."""
+    with open(path, 'rb') as reader:
+        doc = fitz.open(stream=reader.read(), filetype="pdf")
+    [page.get_text("markdown") for page in doc]
+    with open(path, 'rb') as reader:
+        image_doc = fitz.open(stream=reader.read(), filetype="pdf")
+    image_doc[0].get_pixmap().tobytes("png")
+
+
+def text_analysis_after(path: Path) -> None:
+    """Text extraction and page rendering opening the document by path."""
+    with fitz.open(path) as doc:
+        page_count = doc.page_count
+    extract_page_range(str(path), 0, page_count, "markdown")
+    with fitz.open(path) as doc:
+        doc[0].get_pixmap().tobytes("png")
+
+
+def pdf_analysis_before(path: Path) -> None:
+    """Base64 payload as built before, slimmed from a copy of the whole file or encoded from that copy."""
+    with open(path, 'rb') as reader:
+        pdf_content = reader.read()
+    with fitz.open(stream=pdf_content, filetype="pdf") as doc:
+        slimmed, _ = PdfSlimmer()._slim_document(doc)
+    if len(slimmed) >= len(pdf_content):
+        slimmed = pdf_content
+    base64.standard_b64encode(slimmed).decode("utf-8")
+
+
+def pdf_analysis_after(path: Path) -> None:
+    """Base64 payload as built by the pdf analyzer, slimmed from the stored file or memory-mapped."""
+    analyzer = PdfDumpAnalyzer(LocalStorage(path.parent.parent), llm=None)
+    analyzer._get_pdf_data(path.stem)
+
+
+WORKLOADS = {
+    "text": (text_analysis_before, text_analysis_after),
+    "pdf": (pdf_analysis_before, pdf_analysis_after),
+}
+
+
+def _measure(workload, path: Path, queue) -> None:
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    workload(path)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    queue.put((peak - baseline) / 1024)
+
+
+def peak_rss_mib(workload, path: Path) -> float:
+    """Peak RSS growth of running the workload once, in MiB, measured in a fresh process."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(workload, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", type=Path, default=Path("data"))
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for path in sorted((args.data_dir / "papers").glob("*.pdf")):
+        if path.stat().st_size == 0:
+            continue
+        for name, (before, after) in WORKLOADS.items():
+            results.append({
+                "paper": path.stem,
+                "size_mib": path.stat().st_size / 2**20,
+                "workload": name,
+                "before_peak_rss_mib": peak_rss_mib(before, path),
+                "after_peak_rss_mib": peak_rss_mib(after, path)
+            })
+
+    print(f"{'paper':<10} {'size (MiB)':>10} {'workload':>8} {'before (MiB)':>13} {'after (MiB)':>12}")
+    for result in results:
+        print(f"{result['paper']:<10} {result['size_mib']:>10.1f} {result['workload']:>8} "
+              f"{result['before_peak_rss_mib']:>13.1f} {result['after_peak_rss_mib']:>12.1f}")
+
+    if args.json:
+        args.json.write_text(json.dumps({"results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+End-to-end benchmark of PaperService.get_analysis on the sample papers in data/papers and data/metadata.
+
+PMC and E-utilities are served by a local HTTP stand-in, and the LLM is a deterministic fake with a fixed
+latency and token throughput, so runs are comparable between commits. Each sample paper is served under
+--copies PMIDs, to give the higher concurrency levels enough papers.
+
+Each concurrency level runs in a fresh process with empty storage, reporting the wall time spent in each
+stage (the stage.*.seconds metrics), the throughput and the peak RSS of the process and of the extraction
+workers.
+
+Usage (from the repo root):
+    python -m benchmarks.pipeline_benchmark --concurrency 1,4,16 --json pipeline.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import re
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Type
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+import fitz
+from pydantic import BaseModel
+
+from src.core.analyzer.extractor.content_extractor import ContentExtractor, ContentExtractorConfig
+from src.core.analyzer.hybrid_analyzer import HybridAnalyzer
+from src.core.analyzer.pdf_dump_analyzer import PdfDumpAnalyzer
+from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzer
+from src.core.downloader.download_manager import DownloadManager
+from src.core.downloader.downloader import PaperSource
+from src.core.downloader.pubmed_downloader import PubMedDownloader, PubMedDownloaderConfig
+from src.core.identifier.identifier import Identifier
+from src.core.llm.base_llm import BaseLLM
+from src.core.llm.llm_usage import record_usage
+from src.core.llm.token_estimator import IMAGE_TOKENS, estimate_pdf_tokens, estimate_tokens
+from src.core.paper_service import PaperService
+from src.core.storage.local_storage import LocalStorage
+from src.utils.metrics import metrics
+from src.utils.stage_limits import StageLimits, StageLimitsConfig
+
+# Stages timed by the stage.<name>.seconds metrics, in pipeline order
+STAGES = ["identify", "metadata", "download", "extract", "prompt", "llm", "store"]
+
+EFETCH_HEADER = ('<?xml version="1.0" ?>\n<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, '
+                 '1st January 2019//EN" "https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_190101.dtd">\n')
+ELINK_HEADER = ('<?xml version="1.0" encoding="UTF-8" ?>\n<!DOCTYPE eLinkResult PUBLIC "-//NLM//DTD elink 20101123//EN" '
+                '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20101123/elink.dtd">\n')
+
+
+def sample_papers(data_dir: Path) -> List[str]:
+    """PMIDs of the sample papers with metadata and a pdf that can be opened."""
+    pmids = []
+    for path in sorted((data_dir / "papers").glob("*.pdf")):
+        if not (data_dir / "metadata" / f"{path.stem}.json").exists():
+            continue
+        try:
+            with fitz.open(path) as doc:
+                if doc.page_count:
+                    pmids.append(path.stem)
+        except Exception:
+            continue
+    return pmids
+
+
+def served_papers(pmids: List[str], copies: int) -> Dict[str, str]:
+    """Sample paper of each served PMID, every sample paper is served under copies PMIDs."""
+    return {f"{pmid}{copy:03d}": pmid for pmid in pmids for copy in range(copies)}
+
+
+class NCBIStandIn(BaseHTTPRequestHandler):
+    """Answers the efetch and elink calls and the PMC pdf downloads of the PubMed downloader from the sample papers.
+    The PMC ID of a paper is its PMID."""
+    data_dir: Path
+    papers: Dict[str, str]
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        pdf = re.fullmatch(r"/pmc/PMC(\d+)/pdf/", url.path)
+        if url.path.endswith("/efetch.fcgi"):
+            pmids = [pmid for pmid in query["id"][0].split(",") if pmid in self.papers]
+            body = (EFETCH_HEADER + "<PubmedArticleSet>" + "".join(self._article(pmid) for pmid in pmids)
+                    + "</PubmedArticleSet>").encode()
+            self._send(200, "text/xml", body)
+        elif url.path.endswith("/elink.fcgi"):
+            body = (ELINK_HEADER + "<eLinkResult>" + "".join(self._linkset(pmid) for pmid in query["id"])
+                    + "</eLinkResult>").encode()
+            self._send(200, "text/xml", body)
+        elif pdf and pdf.group(1) in self.papers:
+            self._send(200, "application/pdf", (self.data_dir / "papers" / f"{self.papers[pdf.group(1)]}.pdf").read_bytes())
+        else:
+            self._send(404, "text/html", b"Not found")
+
+    def _article(self, pmid: str) -> str:
+        metadata = json.loads((self.data_dir / "metadata" / f"{self.papers[pmid]}.json").read_text())
+        return (f'<PubmedArticle><MedlineCitation Status="MEDLINE" Owner="NLM"><PMID Version="1">{pmid}</PMID>'
+                f'<Article PubModel="Print"><ArticleTitle>{escape(metadata["title"])}</ArticleTitle>'
+                f'<Abstract><AbstractText>{escape(metadata["abstract"])}</AbstractText></Abstract>'
+                f'</Article></MedlineCitation></PubmedArticle>')
+
+    def _linkset(self, pmid: str) -> str:
+        links = (f"<LinkSetDb><DbTo>pmc</DbTo><LinkName>pubmed_pmc</LinkName><Link><Id>{pmid}</Id></Link></LinkSetDb>"
+                 if pmid in self.papers else "")
+        return f"<LinkSet><DbFrom>pubmed</DbFrom><IdList><Id>{pmid}</Id></IdList>{links}</LinkSet>"
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stand_in(data_dir: Path, papers: Dict[str, str], queue) -> None:
+    """Serve the stand-in until the process is terminated, putting its base url on the queue."""
+    handler = type("Handler", (NCBIStandIn,), {"data_dir": data_dir, "papers": papers})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    queue.put(f"http://127.0.0.1:{server.server_port}")
+    server.serve_forever()
+
+
+class FakeLLM(BaseLLM):
+    """Deterministic LLM: every call takes the latency plus its output tokens at the token throughput,
+    and reports the estimated tokens of its input as usage."""
+
+    def __init__(self, latency: float, tokens_per_second: float, output_tokens: int):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+
+    def identity(self) -> Dict[str, object]:
+        return {"provider": "fake", "latency": self.latency, "tokens_per_second": self.tokens_per_second,
+                "output_tokens": self.output_tokens}
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        await self._respond(estimate_tokens(prompt) + estimate_tokens(context or ""), self.output_tokens)
+        return self._response(response_model)
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        record_usage(estimate_tokens(prompt) + estimate_tokens(context or ""), 0, self.output_tokens)
+        await asyncio.sleep(self.latency)
+        # Ten tokens per delta
+        for start in range(0, self.output_tokens, 10):
+            tokens = min(10, self.output_tokens - start)
+            await asyncio.sleep(tokens / self.tokens_per_second)
+            yield "word " * tokens
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        await self._respond(estimate_tokens(prompt) + IMAGE_TOKENS, self.output_tokens)
+        return self._response(response_model)
+
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str],
+                            started: Optional[asyncio.Event] = None) -> Dict[str, str]:
+        await self._respond(estimate_tokens(prompt) + estimate_pdf_tokens(pdf_data), self.output_tokens, started)
+        return {key: self._text() for key in json_structure}
+
+    async def _respond(self, input_tokens: int, output_tokens: int, started: Optional[asyncio.Event] = None) -> None:
+        record_usage(input_tokens, 0, output_tokens)
+        await asyncio.sleep(self.latency)
+        if started is not None:
+            started.set()
+        await asyncio.sleep(output_tokens / self.tokens_per_second)
+
+    def _response(self, response_model: Type[BaseModel]) -> BaseModel:
+        # Numbers pick the first table candidate or page
+        return response_model(**{name: 1 if field.annotation is int else self._text()
+                                 for name, field in response_model.model_fields.items()})
+
+    def _text(self) -> str:
+        return ("word " * self.output_tokens).strip()
+
+
+def create_analyzer(name: str, storage: LocalStorage, extractor: ContentExtractor, llm: BaseLLM,
+                    stage_limits: StageLimits):
+    if name == "pdf":
+        return PdfDumpAnalyzer(storage, llm, stage_limits)
+    if name == "hybrid":
+        return HybridAnalyzer(storage, extractor, llm, stage_limits)
+    return TextDumpAnalyzer(storage, extractor, llm, stage_limits)
+
+
+async def run_pipeline(args, base_url: str, pmids: List[str], concurrency: int) -> dict:
+    """Analyze the papers with at most concurrency get_analysis calls in flight."""
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(Path(root))
+        identifier = Identifier()
+        downloader = PubMedDownloader(PubMedDownloaderConfig(
+            email="benchmark@example.com",
+            requests_per_second=args.requests_per_second,
+            eutils_base_url=f"{base_url}/eutils",
+            pmc_base_url=f"{base_url}/pmc"
+        ))
+        extractor = ContentExtractor(storage, ContentExtractorConfig(max_workers=args.workers))
+        stage_limits = StageLimits(StageLimitsConfig(
+            download=args.download_limit, extraction=args.extraction_limit, llm=args.llm_limit
+        ))
+        llm = FakeLLM(args.llm_latency, args.tokens_per_second, args.output_tokens)
+        service = PaperService(
+            DownloadManager({PaperSource.PUBMED: downloader}, storage, identifier),
+            storage, identifier, create_analyzer(args.analyzer, storage, extractor, llm, stage_limits), stage_limits
+        )
+
+        semaphore = asyncio.Semaphore(concurrency)
+        paper_seconds = []
+
+        async def analyze(pmid: str) -> None:
+            async with semaphore:
+                started_at = time.perf_counter()
+                await service.get_analysis(f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/")
+                paper_seconds.append(time.perf_counter() - started_at)
+
+        started_at = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(analyze(pmid) for pmid in pmids), return_exceptions=True)
+        finally:
+            extractor.close()
+            await downloader.close()
+        wall_seconds = time.perf_counter() - started_at
+
+    errors = [f"{pmid}: {result!r}" for pmid, result in zip(pmids, results) if isinstance(result, BaseException)]
+    snapshot = metrics.snapshot()
+    observations = snapshot["observations"]
+    ordered = sorted(paper_seconds)
+    return {
+        "concurrency": concurrency,
+        "papers": len(pmids),
+        "failed": len(errors),
+        "errors": errors[:10],
+        "wall_seconds": wall_seconds,
+        "papers_per_second": len(paper_seconds) / wall_seconds,
+        "paper_seconds": {
+            "median": statistics.median(ordered) if ordered else 0.0,
+            "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else 0.0,
+            "max": ordered[-1] if ordered else 0.0
+        },
+        # Summed over the papers, concurrent papers overlap
+        "stage_seconds": {
+            stage: {
+                "total": observations.get(f"stage.{stage}.seconds", {}).get("total", 0.0),
+                "mean": observations.get(f"stage.{stage}.seconds", {}).get("mean", 0.0),
+                "count": observations.get(f"stage.{stage}.seconds", {}).get("count", 0)
+            }
+            for stage in STAGES
+        },
+        "llm": {name: snapshot["counters"].get(f"llm.{name}", 0) for name in ("input_tokens", "output_tokens")}
+    }
+
+
+def _measure(args, base_url: str, pmids: List[str], concurrency: int, queue) -> None:
+    result = asyncio.run(run_pipeline(args, base_url, pmids, concurrency))
+    # ru_maxrss is in KiB on Linux, the children are the extraction workers, reaped when the extractor closed
+    result["peak_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result["peak_worker_rss_mib"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    queue.put(result)
+
+
+def measure(args, base_url: str, pmids: List[str], concurrency: int) -> dict:
+    """Run the pipeline at a concurrency level in a fresh process, so measurements don't affect each other."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(args, base_url, pmids, concurrency, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", type=Path, default=Path("data"))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrency levels")
+    parser.add_argument("--copies", type=int, default=4, help="PMIDs each sample paper is served under")
+    parser.add_argument("--analyzer", choices=["text", "hybrid", "pdf"], default="text")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds before the first token of a call")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="Output token throughput of a call")
+    parser.add_argument("--output-tokens", type=int, default=100, help="Output tokens of each call")
+    parser.add_argument("--requests-per-second", type=float, default=1000, help="Rate limit of the stand-in calls")
+    parser.add_argument("--workers", type=int, default=ContentExtractorConfig().max_workers)
+    parser.add_argument("--download-limit", type=int, default=StageLimitsConfig().download)
+    parser.add_argument("--extraction-limit", type=int, default=StageLimitsConfig().extraction)
+    parser.add_argument("--llm-limit", type=int, default=StageLimitsConfig().llm)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    papers = served_papers(sample_papers(args.data_dir), args.copies)
+    if not papers:
+        parser.error(f"No sample papers with metadata and a valid pdf in {args.data_dir}")
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    stand_in = context.Process(target=serve_stand_in, args=(args.data_dir, papers, queue), daemon=True)
+    stand_in.start()
+    try:
+        base_url = queue.get()
+        results = [measure(args, base_url, list(papers), int(level)) for level in args.concurrency.split(",")]
+    finally:
+        stand_in.terminate()
+        stand_in.join()
+
+    print(f"{'concurrency':>11} {'papers':>6} {'failed':>6} {'wall (s)':>9} {'papers/s':>9} {'median (s)':>10} "
+          f"{'peak RSS (MiB)':>14} {'workers (MiB)':>13}")
+    for result in results:
+        print(f"{result['concurrency']:>11} {result['papers']:>6} {result['failed']:>6} {result['wall_seconds']:>9.2f} "
+              f"{result['papers_per_second']:>9.2f} {result['paper_seconds']['median']:>10.2f} "
+              f"{result['peak_rss_mib']:>14.1f} {result['peak_worker_rss_mib']:>13.1f}")
+    print()
+    print(f"{'concurrency':>11} " + " ".join(f"{stage + ' (s)':>13}" for stage in STAGES))
+    for result in results:
+        print(f"{result['concurrency']:>11} "
+              + " ".join(f"{result['stage_seconds'][stage]['total']:>13.2f}" for stage in STAGES))
+    for result in results:
+        for error in result["errors"]:
+            print(f"concurrency {result['concurrency']}: {error}")
+
+    if args.json:
+        config = {key: str(value) if isinstance(value, Path) else value
+                  for key, value in vars(args).items() if key != "json"}
+        args.json.write_text(json.dumps({"commit": current_commit(), "config": config, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
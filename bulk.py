@@ -0,0 +1,120 @@
+"""
+Re-analyze stored papers offline through the LLM provider's batch api, at half the price of
+regular requests, e.g. nightly after a prompt or model change. Results are stored like those of the api.
+
+Every paper's summary and table prompts are collected into one batch, then the follow-up prompts
+(chunk reduction, table extraction) into the next, so a run takes a few batch rounds.
+The provider and analyzer are configured by the same environment variables as the api.
+
+Usage (from the repo root):
+    python bulk.py                      # every downloaded paper
+    python bulk.py --missing            # only the papers without a stored analysis
+    python bulk.py 38285791 39040441
+    python bulk.py --base-url http://localhost:8080   # against a local stand-in of the batch api
+"""
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from src.core.analyzer.extractor.content_extractor import ContentExtractor, ContentExtractorConfig
+from src.core.analyzer.extractor.content_pruner import ContentPruner, ContentPrunerConfig
+from src.core.analyzer.extractor.pdf_slimmer import PdfSlimmer, PdfSlimmerConfig
+from src.core.analyzer.hybrid_analyzer import HybridAnalyzer
+from src.core.analyzer.pdf_dump_analyzer import PdfDumpAnalyzer
+from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzer, TextDumpAnalyzerConfig
+from src.core.bulk_service import BulkService
+from src.core.llm.batch_llm import BatchLLM, BatchLLMConfig
+from src.core.llm.claude_llm import ClaudeBatchBackend, ClaudeLLM, ClaudeLLMConfig
+from src.core.llm.openai_llm import OpenAIBatchBackend, OpenAILLM, OpenAILLMConfig
+from src.core.storage.local_storage import LocalStorage
+from src.utils.logger import setup_logging
+from src.utils.stage_limits import StageLimits, StageLimitsConfig
+
+storage_root = Path("data")
+
+
+def create_batch_llm(base_url, poll_seconds: float) -> BatchLLM:
+    if os.getenv("OPENAI_API_KEY"):
+        backend = OpenAIBatchBackend(OpenAILLM(config=OpenAILLMConfig(api_key=os.getenv("OPENAI_API_KEY"),
+                                                                      base_url=base_url)))
+    else:
+        backend = ClaudeBatchBackend(ClaudeLLM(config=ClaudeLLMConfig(api_key=os.getenv("CLAUDE_API_KEY"),
+                                                                      base_url=base_url)))
+    return BatchLLM(backend, BatchLLMConfig(poll_seconds=poll_seconds))
+
+
+def create_analyzer(storage: LocalStorage, llm: BatchLLM, paper_count: int):
+    # Every paper waits in the llm stage at once, so all their calls go in the same batch
+    stage_limits = StageLimits(StageLimitsConfig(
+        extraction=int(os.getenv("MAX_CONCURRENT_EXTRACTIONS", 2)),
+        llm=max(1, paper_count)
+    ))
+    content_extractor = ContentExtractor(storage, ContentExtractorConfig(
+        max_workers=int(os.getenv("EXTRACTION_WORKERS", os.cpu_count() or 1))
+    ))
+    content_pruner = ContentPruner(ContentPrunerConfig(token_budgets={
+        "summary": int(os.getenv("SUMMARY_TOKEN_BUDGET", 20000)),
+        "table": int(os.getenv("TABLE_TOKEN_BUDGET", 20000))
+    }))
+    analyzer_name = os.getenv("ANALYZER", "text")
+    if analyzer_name == "hybrid":
+        analyzer = HybridAnalyzer(storage=storage, content_extractor=content_extractor, llm=llm,
+                                  stage_limits=stage_limits, content_pruner=content_pruner)
+    elif analyzer_name == "pdf":
+        pdf_slimmer = PdfSlimmer(PdfSlimmerConfig(
+            max_image_dpi=int(os.getenv("PDF_MAX_IMAGE_DPI", 150)),
+            strip_images=os.getenv("PDF_STRIP_IMAGES", "false").lower() == "true"
+        ))
+        analyzer = PdfDumpAnalyzer(storage=storage, llm=llm, stage_limits=stage_limits, pdf_slimmer=pdf_slimmer)
+    else:
+        # All chunks of a long paper go in the same batch
+        analyzer = TextDumpAnalyzer(storage=storage, content_extractor=content_extractor, llm=llm,
+                                    stage_limits=stage_limits, content_pruner=content_pruner,
+                                    config=TextDumpAnalyzerConfig(max_parallel_chunks=1000))
+    return analyzer, content_extractor
+
+
+async def run(args: argparse.Namespace) -> int:
+    storage = LocalStorage(storage_root)
+    paper_ids = args.papers or [metadata.id for metadata in storage.list_papers()
+                                if storage.check_paper_exists(metadata.id)]
+    if args.missing:
+        paper_ids = [paper_id for paper_id in paper_ids if not storage.is_paper_analyzed(paper_id)]
+    if not paper_ids:
+        print("No papers to analyze")
+        return 0
+
+    llm = create_batch_llm(args.base_url, args.poll_seconds)
+    analyzer, content_extractor = create_analyzer(storage, llm, len(paper_ids))
+    try:
+        errors = await BulkService(storage, analyzer, llm).run(paper_ids)
+    finally:
+        content_extractor.close()
+
+    failed = {paper_id: error for paper_id, error in errors.items() if error is not None}
+    for paper_id, error in failed.items():
+        print(f"{paper_id}: {error}")
+    print(f"Analyzed {len(paper_ids) - len(failed)} of {len(paper_ids)} papers")
+    return 1 if failed else 0
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("papers", nargs="*", help="IDs of stored papers, every downloaded paper by default")
+    parser.add_argument("--missing", action="store_true", help="Skip the papers with a stored analysis")
+    parser.add_argument("--poll-seconds", type=float, default=60, help="Seconds between batch status checks")
+    parser.add_argument("--base-url", default=os.getenv("LLM_BASE_URL"),
+                        help="Base url of the provider api, e.g. a local stand-in")
+    args = parser.parse_args()
+
+    setup_logging()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,48 @@ from pathlib import Path
 from dotenv import load_dotenv
 import uvicorn
 import os
+from dataclasses import replace
+from typing import Optional
 
 from src.core.paper_service import PaperService
+from src.core.batch_service import BatchService
 from src.core.downloader.download_manager import DownloadManager
+from src.core.downloader.negative_cache import NegativeCache
 from src.core.storage.local_storage import LocalStorage
 from src.core.identifier.identifier import Identifier
 from src.core.downloader.downloader import PaperSource
-from src.core.downloader.pubmed_downloader import PubMedDownloader
+from src.core.downloader.pubmed_downloader import PubMedDownloader, PubMedDownloaderConfig
 from src.core.analyzer.pdf_dump_analyzer import PdfDumpAnalyzer
-from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzer
-from src.core.analyzer.extractor.content_extractor import ContentExtractor
+from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzer, TextDumpAnalyzerConfig
+from src.core.analyzer.hybrid_analyzer import HybridAnalyzer, HybridAnalyzerConfig
+from src.core.analyzer.analysis_estimator import AnalysisEstimator, AnalysisEstimatorConfig
+from src.core.analyzer.analyzer_selector import AnalyzerSelector, AnalyzerSelectorConfig
+from src.core.analyzer.extractor.content_extractor import ContentExtractor, ContentExtractorConfig
+from src.core.analyzer.extractor.content_pruner import ContentPruner, ContentPrunerConfig
+from src.core.analyzer.extractor.pdf_slimmer import PdfSlimmer, PdfSlimmerConfig
 from src.utils.logger import setup_logging
+from src.utils.stage_limits import StageLimits, StageLimitsConfig
 from src.api.paper_handler import PaperHandler
+from src.core.llm.base_llm import BaseLLM
 from src.core.llm.openai_llm import OpenAILLM, OpenAILLMConfig
 from src.core.llm.claude_llm import ClaudeLLM, ClaudeLLMConfig
+from src.core.llm.caching_llm import CachingLLM
+from src.core.llm.llm_scheduler import LLMScheduler, LLMSchedulerConfig
+from src.core.llm.scheduled_llm import ScheduledLLM
+from src.core.llm.response_cache import ResponseCache
+from src.core.llm.routing_llm import TEXT_TASKS, LLMRoute, RoutingLLM, RoutingLLMConfig
 storage_root = Path("data")
 
+def create_llm(provider: str, name: str, scheduler_config: LLMSchedulerConfig, model: Optional[str] = None) -> BaseLLM:
+    """An LLM of the provider queued against its rate limits, which apply per model."""
+    if provider == "openai":
+        config = OpenAILLMConfig(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        llm = OpenAILLM(config=replace(config, model=model or config.model))
+    else:
+        config = ClaudeLLMConfig(api_key=os.getenv("CLAUDE_API_KEY"), max_retries=0)
+        llm = ClaudeLLM(config=replace(config, model=model or config.model))
+    return ScheduledLLM(llm, LLMScheduler(name, scheduler_config))
+
 def create_app() -> FastAPI:
     # Load environment variables
     load_dotenv()
@@ -27,29 +53,122 @@ def create_app() -> FastAPI:
     setup_logging()
     
     # Initialize dependencies
-    downloaders = {
-        PaperSource.PUBMED: PubMedDownloader(email="test@test.com")
-    }
+    pubmed_downloader = PubMedDownloader(config=PubMedDownloaderConfig(
+        email="test@test.com",
+        api_key=os.getenv("NCBI_API_KEY")
+    ))
+    downloaders = {PaperSource.PUBMED: pubmed_downloader}
     storage = LocalStorage(storage_root)
     identifier = Identifier()
-    download_manager = DownloadManager(downloaders=downloaders, storage=storage, identifier=identifier)    
+    negative_cache = NegativeCache(
+        storage_root / "negative_cache.json",
+        ttl_seconds=float(os.getenv("NEGATIVE_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+    )
+    download_manager = DownloadManager(downloaders=downloaders, storage=storage, identifier=identifier,
+                                       negative_cache=negative_cache)
 
-    if os.getenv("OPENAI_API_KEY"):
-        llm = OpenAILLM(config=OpenAILLMConfig(api_key=os.getenv("OPENAI_API_KEY")))
-    else:
-        llm = ClaudeLLM(config=ClaudeLLMConfig(api_key=os.getenv("CLAUDE_API_KEY")))
+    # Concurrency limits shared by every request, per pipeline stage
+    stage_limits = StageLimits(StageLimitsConfig(
+        download=int(os.getenv("MAX_CONCURRENT_DOWNLOADS", 4)),
+        extraction=int(os.getenv("MAX_CONCURRENT_EXTRACTIONS", 2)),
+        llm=int(os.getenv("MAX_CONCURRENT_LLM_CALLS", 4))
+    ))
+
+    # Requests are queued against the provider's rate limits, rate limited requests are retried by the
+    # scheduler instead of the client so it can adapt its concurrency
+    llm_scheduler_config = LLMSchedulerConfig(
+        requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", 50)),
+        tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", 40000)),
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+    )
+    # Every configured provider, the first one gets the calls that aren't routed elsewhere
+    providers = [provider for provider, key in (("openai", "OPENAI_API_KEY"), ("anthropic", "CLAUDE_API_KEY"))
+                 if os.getenv(key)] or ["anthropic"]
+    llms = {provider: create_llm(provider, provider, llm_scheduler_config) for provider in providers}
+    primary = providers[0]
+    # A call slower than the usual latency is also sent to the second provider, the first response wins
+    hedge = providers[1] if len(providers) > 1 and os.getenv("LLM_HEDGE", "true").lower() == "true" else None
+    routes = []
+    if "anthropic" in llms:
+        # Only claude reads pdfs
+        routes.append(LLMRoute("anthropic", tasks=("chat_with_pdf",)))
+    # Small text calls, and the tasks in LLM_SMALL_TASKS (e.g. stream for the summary) of any size,
+    # go to a faster and cheaper model of the first provider. Images stay on the main model
+    if os.getenv("LLM_SMALL_MODEL"):
+        llms["small"] = create_llm(primary, f"{primary}-small", llm_scheduler_config, os.getenv("LLM_SMALL_MODEL"))
+        routes.append(LLMRoute("small", tasks=TEXT_TASKS, max_tokens=int(os.getenv("LLM_SMALL_MAX_TOKENS", 8000)),
+                               hedge_llm=hedge))
+        small_tasks = tuple(task for task in os.getenv("LLM_SMALL_TASKS", "").split(",") if task)
+        if small_tasks:
+            routes.append(LLMRoute("small", tasks=small_tasks, hedge_llm=hedge))
+    routes.append(LLMRoute(primary, hedge_llm=hedge))
+    llm = RoutingLLM(llms, routes, RoutingLLMConfig(
+        hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+    ))
+    # Repeated LLM calls are served from disk, e.g. when a batch is run again
+    llm_cache_max_mb = int(os.getenv("LLM_CACHE_MAX_MB", 512))
+    if llm_cache_max_mb > 0:
+        llm = CachingLLM(llm, ResponseCache(
+            storage_root / "llm_cache",
+            max_bytes=llm_cache_max_mb * 1024 * 1024,
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", 30 * 24 * 60 * 60))
+        ))
 
     # Choose analyzer strategy
-    analyzer = TextDumpAnalyzer(storage=storage, content_extractor=ContentExtractor(storage), llm=llm)
-    # analyzer = PdfDumpAnalyzer(storage=storage, llm=llm)
+    content_extractor = ContentExtractor(storage, ContentExtractorConfig(
+        max_workers=int(os.getenv("EXTRACTION_WORKERS", os.cpu_count() or 1))
+    ))
+    # Estimated token budgets of the paper content in each prompt
+    content_pruner = ContentPruner(ContentPrunerConfig(token_budgets={
+        "summary": int(os.getenv("SUMMARY_TOKEN_BUDGET", 20000)),
+        "table": int(os.getenv("TABLE_TOKEN_BUDGET", 20000))
+    }))
+    # Figures are downsampled before the pdf is sent, or stripped when they are not needed
+    pdf_slimmer = PdfSlimmer(PdfSlimmerConfig(
+        max_image_dpi=int(os.getenv("PDF_MAX_IMAGE_DPI", 150)),
+        strip_images=os.getenv("PDF_STRIP_IMAGES", "false").lower() == "true"
+    ))
+    # Chunking of papers over the summary budget, shared by the text analyzers and their estimates
+    text_config = TextDumpAnalyzerConfig()
+    hybrid_config = HybridAnalyzerConfig(chunk_tokens=text_config.chunk_tokens,
+                                         max_parallel_chunks=text_config.max_parallel_chunks)
+    analyzers = {
+        "text": lambda: TextDumpAnalyzer(storage=storage, content_extractor=content_extractor, llm=llm,
+                                         stage_limits=stage_limits, content_pruner=content_pruner, config=text_config),
+        "hybrid": lambda: HybridAnalyzer(storage=storage, content_extractor=content_extractor, llm=llm,
+                                         stage_limits=stage_limits, content_pruner=content_pruner, config=hybrid_config),
+        "pdf": lambda: PdfDumpAnalyzer(storage=storage, llm=llm, stage_limits=stage_limits, pdf_slimmer=pdf_slimmer)
+    }
+    analyzer_name = os.getenv("ANALYZER", "text")
+    if analyzer_name == "auto":
+        # The first analyzer in ANALYZER_PREFERENCE whose pre-flight estimate fits the budgets analyzes each paper.
+        # Only claude reads pdfs
+        preference = os.getenv("ANALYZER_PREFERENCE", "pdf,hybrid,text" if "anthropic" in llms else "hybrid,text")
+        estimator = AnalysisEstimator(content_pruner, AnalysisEstimatorConfig(
+            input_price=float(os.getenv("LLM_INPUT_PRICE", 3.0)),
+            cached_input_price=float(os.getenv("LLM_CACHED_INPUT_PRICE", 0.3)),
+            output_price=float(os.getenv("LLM_OUTPUT_PRICE", 15.0))
+        ), text_config)
+        budgets = AnalyzerSelectorConfig(
+            max_input_tokens=int(os.getenv("ANALYSIS_MAX_INPUT_TOKENS", 150000)),
+            max_cost=float(os.getenv("ANALYSIS_MAX_COST", 0.25)),
+            max_latency_seconds=float(os.getenv("ANALYSIS_MAX_LATENCY_SECONDS", 120))
+        )
+        analyzer = AnalyzerSelector(storage, content_extractor,
+                                    {name: analyzers[name]() for name in preference.split(",") if name},
+                                    estimator, stage_limits, budgets)
+    else:
+        analyzer = analyzers.get(analyzer_name, analyzers["text"])()
     
     # Create paper service instance
     paper_service = PaperService(
         download_manager=download_manager,
         storage=storage,
         identifier=identifier,
-        analyzer=analyzer
+        analyzer=analyzer,
+        stage_limits=stage_limits
     )
+    batch_service = BatchService(paper_service=paper_service, stage_limits=stage_limits)
     
     # Create FastAPI app
     app = FastAPI(
@@ -58,8 +177,10 @@ def create_app() -> FastAPI:
     )
     
     # Setup paper handler with routes
-    paper_handler = PaperHandler(paper_service)
+    paper_handler = PaperHandler(paper_service, batch_service)
     paper_handler.register_routes(app)
+    app.add_event_handler("shutdown", content_extractor.close)
+    app.add_event_handler("shutdown", pubmed_downloader.close)
     
     return app
 
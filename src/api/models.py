@@ -23,6 +23,26 @@ class TableInfo(BaseModel):
 class PaperAnalysis(BaseModel):
     paper_id: str
     metadata: Metadata
-    summary: str
+    summary: Optional[str]
     main_table: Optional[TableInfo]
+    errors: List[str] = []
 
+
+class BatchAnalysisRequest(BaseModel):
+    urls: List[HttpUrl]
+
+class BatchAnalysisResponse(BaseModel):
+    job_id: str
+
+class BatchItemResult(BaseModel):
+    url: str
+    status: str
+    analysis: Optional[PaperAnalysis]
+    error: Optional[str]
+
+class BatchJobStatus(BaseModel):
+    job_id: str
+    total: int
+    completed: int
+    failed: int
+    items: List[BatchItemResult]
@@ -1,14 +1,25 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse, StreamingResponse
-from typing import Dict
+import json
+from typing import AsyncIterator, Optional
 from ..core.paper_service import PaperService
+from ..core.batch_service import BatchService
+from ..core.models import paper
+from ..core.models.batch import BatchItemStatus
+from ..core.models.analysis_event import AnalysisEvent, AnalysisEventType
+from ..core.llm.caching_llm import bypass_cache
 from ..utils.exceptions import UserFacingError
 from .models import (
     GetAnalysisRequest, 
     PaperAnalysis,
     Metadata,
-    TableInfo
+    TableInfo,
+    BatchAnalysisRequest,
+    BatchAnalysisResponse,
+    BatchItemResult,
+    BatchJobStatus
 )
+from ..utils.metrics import metrics
 from ..utils.logger import logger
 
 app = FastAPI(
@@ -17,9 +28,54 @@ app = FastAPI(
 )
 
 class PaperHandler:
-    def __init__(self, paper_service: PaperService):
+    def __init__(self, paper_service: PaperService, batch_service: Optional[BatchService] = None):
         self.paper_service = paper_service
+        self.batch_service = batch_service
+
+    @staticmethod
+    def _to_response_analysis(analysis: paper.PaperAnalysis) -> PaperAnalysis:
+        """Convert a paper analysis into its API response model."""
+        resp_metadata = Metadata(
+            id=analysis.metadata.id,
+            title=analysis.metadata.title,
+            abstract=analysis.metadata.abstract,
+            url=analysis.metadata.url
+        )
+
+        resp_table = None
+        if analysis.main_table:
+            resp_table = TableInfo(
+                description=analysis.main_table.description,
+                csv_content=analysis.main_table.csv_content,
+                footnotes=analysis.main_table.footnotes
+            )
+        return PaperAnalysis(
+            paper_id=analysis.paper_id,
+            metadata=resp_metadata,
+            summary=analysis.summary,
+            main_table=resp_table,
+            errors=analysis.errors
+        )
         
+    async def _to_sse(self, events: AsyncIterator[AnalysisEvent]) -> AsyncIterator[str]:
+        """Format analysis events as server-sent events. An error ends the stream with an error event."""
+        try:
+            async for event in events:
+                data = self._to_response_analysis(event.analysis).model_dump() if event.analysis else event.data
+                yield self._sse(event.type.value, data)
+        except Exception as e:
+            # The response has started, the error can't be sent as a status code
+            if isinstance(e, UserFacingError):
+                error, status_code = str(e), e.status_code
+            else:
+                logger.error(f"Internal error: {str(e)}", exc_info=True)
+                error, status_code = "An internal error occurred", 500
+            yield self._sse(AnalysisEventType.ERROR.value, {"error": error, "status_code": status_code})
+
+    @staticmethod
+    def _sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
     def register_routes(self, app: FastAPI):
         """Register all routes with the FastAPI application"""
 
@@ -42,34 +98,66 @@ class PaperHandler:
                     content={"error": "An internal error occurred"}
                 )
         
+        @app.middleware("http")
+        async def llm_cache_bypass(request, call_next):
+            """A request with a Cache-Control: no-cache header skips the cached LLM responses"""
+            if "no-cache" in request.headers.get("cache-control", "").lower():
+                with bypass_cache():
+                    return await call_next(request)
+            return await call_next(request)
+
         @app.post("/get-analysis", response_model=PaperAnalysis)
         async def get_analysis(analysis_request: GetAnalysisRequest):
             """Process a paper from a given URL"""
-            analysis = self.paper_service.get_analysis(str(analysis_request.url))
-            resp_metadata = Metadata(
-                id=analysis.metadata.id,
-                title=analysis.metadata.title,
-                abstract=analysis.metadata.abstract,
-                url=analysis.metadata.url
-            )
+            analysis = await self.paper_service.get_analysis(str(analysis_request.url))
+            return self._to_response_analysis(analysis)
 
-            resp_table = TableInfo(                
-                description=analysis.main_table.description,
-                csv_content=analysis.main_table.csv_content,
-                footnotes=analysis.main_table.footnotes
+        @app.post("/get-analysis/stream")
+        async def stream_analysis(analysis_request: GetAnalysisRequest):
+            """Process a paper from a given URL, streaming progress, summary and table as server-sent events"""
+            events = self.paper_service.stream_analysis(str(analysis_request.url))
+            return StreamingResponse(
+                self._to_sse(events),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache"}
             )
-            resp_analysis = PaperAnalysis(
-                paper_id=analysis.paper_id,
-                metadata=resp_metadata,
-                summary=analysis.summary,
-                main_table=resp_table
+
+        @app.post("/analyses/batch", response_model=BatchAnalysisResponse, status_code=202)
+        async def create_batch_analysis(batch_request: BatchAnalysisRequest):
+            """Start analyzing a batch of papers in the background"""
+            if self.batch_service is None:
+                raise HTTPException(status_code=404, detail="Batch analysis is not enabled")
+            job = self.batch_service.submit([str(url) for url in batch_request.urls])
+            return BatchAnalysisResponse(job_id=job.id)
+
+        @app.get("/analyses/batch/{job_id}", response_model=BatchJobStatus)
+        async def get_batch_analysis(job_id: str):
+            """Get per paper status and results of a batch job"""
+            if self.batch_service is None:
+                raise HTTPException(status_code=404, detail="Batch analysis is not enabled")
+            job = self.batch_service.get_job(job_id)
+
+            items = [
+                BatchItemResult(
+                    url=item.url,
+                    status=item.status.value,
+                    analysis=self._to_response_analysis(item.analysis) if item.analysis else None,
+                    error=item.error
+                )
+                for item in job.items
+            ]
+            return BatchJobStatus(
+                job_id=job.id,
+                total=len(items),
+                completed=sum(item.status == BatchItemStatus.DONE for item in job.items),
+                failed=sum(item.status == BatchItemStatus.FAILED for item in job.items),
+                items=items
             )
-            return resp_analysis
 
         @app.get("/papers/{url:path}/metadata", response_model=Metadata)
         async def get_metadata(url: str):
             """Get metadata for a paper by URL"""
-            metadata = self.paper_service.get_paper_metadata(url)
+            metadata = await self.paper_service.get_paper_metadata(url)
 
             resp_metadata = Metadata(
                 id=metadata.id,
@@ -82,11 +170,27 @@ class PaperHandler:
         @app.get("/papers/{url:path}/download")
         async def download_paper(url: str):
             """Download paper content"""
+            reader = await self.paper_service.download_paper(url)
             
             return StreamingResponse(
-                self.paper_service.download_paper(url),
+                reader,
                 media_type="application/pdf",
                 headers={
                     "Content-Disposition": f"attachment; filename=paper_{url.split('/')[-1]}.pdf"
                 }
-            ) 
\ No newline at end of file
+            )
+
+        @app.delete("/papers/unavailable")
+        async def purge_unavailable_papers():
+            """Forget every paper known to be unavailable"""
+            return {"purged": self.paper_service.purge_unavailable()}
+
+        @app.delete("/papers/{url:path}/unavailable")
+        async def purge_unavailable_paper(url: str):
+            """Forget that a paper is unavailable, so the next request looks it up again"""
+            return {"purged": self.paper_service.purge_unavailable(url)}
+
+        @app.get("/metrics")
+        async def get_metrics():
+            """Get in-process counters and observations"""
+            return metrics.snapshot()
@@ -0,0 +1,181 @@
+import math
+from dataclasses import dataclass
+from typing import List, Optional
+from .extractor.content_pruner import ContentPruner
+from .text_dump_analyzer import TextDumpAnalyzerConfig
+from ..llm.token_estimator import IMAGE_TOKENS, estimate_tokens
+from ..llm.llm_usage import LLMUsage
+from ..models.paper import PaperContent, PaperFileInfo
+
+# Analysis strategies, named like the ANALYZER setting
+TEXT = "text"
+HYBRID = "hybrid"
+PDF = "pdf"
+
+@dataclass
+class AnalysisEstimatorConfig:
+    """Prices, speed and limits of the LLM, to estimate analyses offline. Calibrate them against the logged usage."""
+    # Dollars per million input tokens, input tokens read from the prompt cache and output tokens
+    input_price: float = 3.0
+    cached_input_price: float = 0.3
+    output_price: float = 15.0
+    # Latency of a call: fixed overhead, then input tokens processed and output tokens generated per second
+    seconds_per_call: float = 1.0
+    input_tokens_per_second: float = 10000
+    output_tokens_per_second: float = 60
+    # Tokens of a prompt's instructions, besides the paper, and of the responses
+    prompt_tokens: int = 400
+    summary_output_tokens: int = 600
+    chunk_summary_output_tokens: int = 400
+    table_output_tokens: int = 800
+    # Tokens of a pdf page's image, on top of its text
+    pdf_page_image_tokens: int = 1600
+    # Context window of the model, and the pdf limits of the provider
+    max_call_tokens: int = 200000
+    max_pdf_pages: int = 100
+    max_pdf_bytes: int = 32 * 1024 * 1024
+
+@dataclass
+class AnalysisEstimate:
+    """Predicted usage of analyzing a paper with a strategy."""
+    strategy: str
+    calls: int
+    input_tokens: int
+    cached_input_tokens: int
+    output_tokens: int
+    cost: float
+    latency_seconds: float
+    # Why the strategy can't analyze the paper, None if it can
+    infeasible: Optional[str] = None
+
+    def describe(self) -> str:
+        return (f"{self.calls} calls, {self.input_tokens} input tokens ({self.cached_input_tokens} cached), "
+                f"{self.output_tokens} output tokens, ${self.cost:.3f}, {self.latency_seconds:.0f}s")
+
+@dataclass
+class _Call:
+    input_tokens: int
+    output_tokens: int
+    cached_input_tokens: int = 0
+
+class AnalysisEstimator:
+    """Predicts the input tokens, cost and latency of each analysis strategy for a paper, without any network call.
+
+    Calls are modeled as the analyzers make them: the text and hybrid analyzers send the pruned content
+    (chunked when over the summary budget), the pdf analyzer every page as text and image.
+    Calls sharing a context are sent once the first has started and read the context from the prompt cache.
+    The content pruner and chunking config are the ones of the text analyzers, so estimates follow their settings.
+    """
+
+    def __init__(self, content_pruner: ContentPruner, config: Optional[AnalysisEstimatorConfig] = None,
+                 text_config: Optional[TextDumpAnalyzerConfig] = None):
+        self.content_pruner = content_pruner
+        self.config = config or AnalysisEstimatorConfig()
+        self.text_config = text_config or TextDumpAnalyzerConfig()
+
+    def estimate(self, strategy: str, content: PaperContent, pdf_info: Optional[PaperFileInfo] = None) -> AnalysisEstimate:
+        """
+        Estimate the analysis of a paper.
+
+        Args:
+            strategy: text, hybrid or pdf
+            content: Extracted content of the paper
+            pdf_info: Stored pdf of the paper, for the pdf limits
+        """
+        if strategy == PDF:
+            return self._estimate_pdf(content, pdf_info)
+        return self._estimate_text(strategy, content)
+
+    def cost(self, usage: LLMUsage) -> float:
+        """Cost of the usage reported by the provider, in dollars."""
+        return ((usage.input_tokens - usage.cached_input_tokens) * self.config.input_price
+                + usage.cached_input_tokens * self.config.cached_input_price
+                + usage.output_tokens * self.config.output_price) / 1_000_000
+
+    def _estimate_text(self, strategy: str, content: PaperContent) -> AnalysisEstimate:
+        config = self.config
+        budgets = self.content_pruner.config.token_budgets
+        paper_tokens = self.content_pruner.estimate_tokens(content)
+        summary_context = self._fit(paper_tokens, budgets.get("summary"))
+        table_context = self._fit(paper_tokens, budgets.get("table"))
+
+        calls: List[_Call] = []
+        if summary_context < paper_tokens:
+            # Chunk summaries run a few at a time, then are reduced into the summary
+            chunk_count = math.ceil(paper_tokens / self.text_config.chunk_tokens)
+            chunk = _Call(math.ceil(paper_tokens / chunk_count) + config.prompt_tokens, config.chunk_summary_output_tokens)
+            reduce = _Call(chunk_count * config.chunk_summary_output_tokens + config.prompt_tokens,
+                           config.summary_output_tokens)
+            calls += [chunk] * chunk_count + [reduce]
+            summary_latency = (math.ceil(chunk_count / self.text_config.max_parallel_chunks) * self._latency(chunk)
+                               + self._latency(reduce))
+            table_start, cached = 0.0, 0
+        elif summary_context == table_context:
+            # The prompts share the paper, the summary call caches it and the table calls are sent once it has started
+            summary = _Call(summary_context + config.prompt_tokens, config.summary_output_tokens)
+            calls.append(summary)
+            summary_latency = self._latency(summary)
+            table_start, cached = self._start_latency(summary), table_context
+        else:
+            summary = _Call(summary_context + config.prompt_tokens, config.summary_output_tokens)
+            calls.append(summary)
+            table_start, cached, summary_latency = 0.0, 0, self._latency(summary)
+
+        if strategy == HYBRID:
+            # The table is located in the text, then read from an image of its page
+            locate = _Call(table_context + config.prompt_tokens, 50, cached)
+            image = _Call(IMAGE_TOKENS + config.prompt_tokens, config.table_output_tokens)
+            calls += [locate, image]
+            table_latency = self._latency(locate) + self._latency(image)
+        else:
+            table = _Call(table_context + config.prompt_tokens, config.table_output_tokens, cached)
+            calls.append(table)
+            table_latency = self._latency(table)
+
+        infeasible = None
+        largest = max(call.input_tokens for call in calls)
+        if largest > config.max_call_tokens:
+            infeasible = f"a prompt of {largest} tokens is over the context window of {config.max_call_tokens}"
+        return self._estimate(strategy, calls, max(summary_latency, table_start + table_latency), infeasible)
+
+    def _estimate_pdf(self, content: PaperContent, pdf_info: Optional[PaperFileInfo]) -> AnalysisEstimate:
+        config = self.config
+        page_count = pdf_info.page_count if pdf_info else len(content.page_contents)
+        pdf_tokens = (sum(estimate_tokens(page) for page in content.page_contents)
+                      + page_count * config.pdf_page_image_tokens)
+        # The summary call caches the pdf, the table call is sent once the summary has started and reads it
+        summary = _Call(pdf_tokens + config.prompt_tokens, config.summary_output_tokens)
+        table = _Call(pdf_tokens + config.prompt_tokens, config.table_output_tokens, pdf_tokens)
+        latency = max(self._latency(summary), self._start_latency(summary) + self._latency(table))
+
+        infeasible = None
+        if page_count > config.max_pdf_pages:
+            infeasible = f"{page_count} pages are over the pdf limit of {config.max_pdf_pages}"
+        elif pdf_info and pdf_info.size > config.max_pdf_bytes:
+            infeasible = f"{pdf_info.size} bytes are over the pdf limit of {config.max_pdf_bytes}"
+        elif summary.input_tokens > config.max_call_tokens:
+            infeasible = f"{summary.input_tokens} tokens are over the context window of {config.max_call_tokens}"
+        return self._estimate(PDF, [summary, table], latency, infeasible)
+
+    def _estimate(self, strategy: str, calls: List[_Call], latency: float, infeasible: Optional[str]) -> AnalysisEstimate:
+        usage = LLMUsage(
+            calls=len(calls),
+            input_tokens=sum(call.input_tokens for call in calls),
+            cached_input_tokens=sum(call.cached_input_tokens for call in calls),
+            output_tokens=sum(call.output_tokens for call in calls)
+        )
+        return AnalysisEstimate(strategy=strategy, calls=usage.calls, input_tokens=usage.input_tokens,
+                                cached_input_tokens=usage.cached_input_tokens, output_tokens=usage.output_tokens,
+                                cost=self.cost(usage), latency_seconds=latency, infeasible=infeasible)
+
+    def _latency(self, call: _Call) -> float:
+        return self._start_latency(call) + call.output_tokens / self.config.output_tokens_per_second
+
+    def _start_latency(self, call: _Call) -> float:
+        """Latency until the response starts, the prompt is cached from then on."""
+        return (self.config.seconds_per_call
+                + (call.input_tokens - call.cached_input_tokens) / self.config.input_tokens_per_second)
+
+    @staticmethod
+    def _fit(tokens: int, budget: Optional[int]) -> int:
+        return tokens if budget is None else min(tokens, budget)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional, Tuple
+from .analysis_estimator import AnalysisEstimate, AnalysisEstimator
+from .base_analyzer import ContentAnalyzer
+from .extractor.content_extractor import ContentExtractor
+from ..llm.llm_usage import LLMUsage, track_usage
+from ..models.analysis_event import AnalysisEvent
+from ..models.paper import PaperAnalysis
+from ..storage.storage import Storage, StorageError
+from ...utils.exceptions import PaperTooLargeError
+from ...utils.logger import logger
+from ...utils.metrics import metrics
+from ...utils.stage_limits import StageLimits
+
+@dataclass
+class AnalyzerSelectorConfig:
+    """Budgets the analysis of a paper must fit in, None for no limit"""
+    max_input_tokens: Optional[int] = 150000
+    # In dollars
+    max_cost: Optional[float] = 0.25
+    max_latency_seconds: Optional[float] = 120
+
+class AnalyzerSelector(ContentAnalyzer):
+    """Picks the analyzer of each paper from a pre-flight estimate of its tokens, cost and latency.
+
+    The paper is extracted locally (the analyzers reuse the cached extraction), then the analyzers are
+    tried in order of preference: the first one whose estimate fits the budgets analyzes the paper.
+    A paper that fits none is rejected before any LLM call. The estimate is logged next to the usage
+    the provider reported, to calibrate the estimator.
+    """
+
+    def __init__(self, storage: Storage, content_extractor: ContentExtractor, analyzers: Dict[str, ContentAnalyzer],
+                 estimator: AnalysisEstimator, stage_limits: Optional[StageLimits] = None,
+                 config: Optional[AnalyzerSelectorConfig] = None):
+        """
+        Args:
+            analyzers: Analyzers by strategy (text, hybrid or pdf), in order of preference
+        """
+        self.storage = storage
+        self.content_extractor = content_extractor
+        self.analyzers = analyzers
+        self.estimator = estimator
+        self.stage_limits = stage_limits or StageLimits()
+        self.config = config or AnalyzerSelectorConfig()
+
+    async def analyze_paper(self, paper_id: str, stored: Optional[PaperAnalysis] = None) -> PaperAnalysis:
+        analyzer, estimate = await self.select(paper_id)
+        started_at = time.monotonic()
+        with track_usage() as usage:
+            analysis = await analyzer.analyze_paper(paper_id, stored)
+        self._log_usage(paper_id, estimate, usage, time.monotonic() - started_at)
+        return analysis
+
+    async def stream_analysis(self, paper_id: str, stored: Optional[PaperAnalysis] = None) -> AsyncIterator[AnalysisEvent]:
+        analyzer, estimate = await self.select(paper_id)
+        started_at = time.monotonic()
+        usage = LLMUsage()
+        events = analyzer.stream_analysis(paper_id, stored)
+        try:
+            while True:
+                # Tracked per step, the consumer may resume the stream in another context
+                with track_usage(usage):
+                    event = await anext(events, None)
+                if event is None:
+                    break
+                yield event
+        finally:
+            await events.aclose()
+        self._log_usage(paper_id, estimate, usage, time.monotonic() - started_at)
+
+    async def select(self, paper_id: str) -> Tuple[ContentAnalyzer, AnalysisEstimate]:
+        """The preferred analyzer whose estimate fits the budgets, raises PaperTooLargeError if none does."""
+        async with self.stage_limits.extraction:
+            with metrics.timer("stage.extract.seconds"):
+                content = await self.content_extractor.extract_content(paper_id)
+        try:
+            pdf_info = await asyncio.to_thread(self.storage.get_paper_info, paper_id)
+        except StorageError:
+            # Stored before papers were validated, the pages are counted from the content
+            pdf_info = None
+
+        reasons = []
+        for strategy, analyzer in self.analyzers.items():
+            estimate = self.estimator.estimate(strategy, content, pdf_info)
+            reason = estimate.infeasible or self._over_budget(estimate)
+            if reason is None:
+                logger.info("Analyzing paper %s with the %s analyzer, estimated at %s",
+                            paper_id, strategy, estimate.describe())
+                metrics.increment(f"analyzer_selector.{strategy}.selected")
+                return analyzer, estimate
+            logger.info("Paper %s doesn't fit the %s analyzer: %s", paper_id, strategy, reason)
+            reasons.append(f"{strategy}: {reason}")
+
+        metrics.increment("analyzer_selector.rejected")
+        raise PaperTooLargeError(f"Paper {paper_id} is too large to analyze ({'; '.join(reasons)})")
+
+    def _over_budget(self, estimate: AnalysisEstimate) -> Optional[str]:
+        """Which budget the estimate is over, None if it fits."""
+        config = self.config
+        if config.max_input_tokens is not None and estimate.input_tokens > config.max_input_tokens:
+            return f"{estimate.input_tokens} input tokens are over the budget of {config.max_input_tokens}"
+        if config.max_cost is not None and estimate.cost > config.max_cost:
+            return f"${estimate.cost:.3f} is over the budget of ${config.max_cost:.3f}"
+        if config.max_latency_seconds is not None and estimate.latency_seconds > config.max_latency_seconds:
+            return f"{estimate.latency_seconds:.0f}s is over the budget of {config.max_latency_seconds:.0f}s"
+        return None
+
+    def _log_usage(self, paper_id: str, estimate: AnalysisEstimate, usage: LLMUsage, seconds: float) -> None:
+        """Log the estimate next to the actual usage. Calls served from the response cache report no usage."""
+        cost = self.estimator.cost(usage)
+        logger.info("Paper %s %s analysis estimated at %s, actual %d calls, %d input tokens (%d cached), "
+                    "%d output tokens, $%.3f, %.0fs", paper_id, estimate.strategy, estimate.describe(), usage.calls,
+                    usage.input_tokens, usage.cached_input_tokens, usage.output_tokens, cost, seconds)
+        if usage.calls == 0:
+            return
+        prefix = f"analyzer_selector.{estimate.strategy}"
+        if estimate.input_tokens:
+            metrics.observe(f"{prefix}.input_tokens_actual_to_estimate", usage.input_tokens / estimate.input_tokens)
+        if estimate.output_tokens:
+            metrics.observe(f"{prefix}.output_tokens_actual_to_estimate", usage.output_tokens / estimate.output_tokens)
+        if estimate.latency_seconds:
+            metrics.observe(f"{prefix}.latency_actual_to_estimate", seconds / estimate.latency_seconds)
@@ -1,10 +1,51 @@
 from abc import ABC, abstractmethod
-from ..models.paper import PaperAnalysis
+from typing import AsyncIterator, Optional, Union
+from ..models.paper import PaperAnalysis, PaperMetadata, TableInfo
+from ..models.analysis_event import AnalysisEvent, result_events
+from ...utils.exceptions import UserFacingError
+from ...utils.logger import logger
 
 class ContentAnalyzer(ABC):
     """Abstract base class for different paper content analyzers."""    
     
     @abstractmethod
-    def analyze_paper(self, paper_id: str) -> PaperAnalysis:
-        """Analyze paper content and return summary and table info."""
-        pass 
\ No newline at end of file
+    async def analyze_paper(self, paper_id: str, stored: Optional[PaperAnalysis] = None) -> PaperAnalysis:
+        """Analyze paper content and return summary and table info.
+
+        Args:
+            stored: Parts of an earlier analysis that were stored, reused instead of generated again
+        """
+        pass 
+
+    async def stream_analysis(self, paper_id: str, stored: Optional[PaperAnalysis] = None) -> AsyncIterator[AnalysisEvent]:
+        """Analyze paper content, yielding progress events and the analysis in a final done event.
+        By default the results are only sent once the whole analysis is done."""
+        analysis = await self.analyze_paper(paper_id, stored)
+        for event in result_events(analysis):
+            yield event
+
+    @staticmethod
+    def _combine_results(paper_id: str, metadata: PaperMetadata,
+                         summary: Union[str, BaseException], table: Union[Optional[TableInfo], BaseException]) -> PaperAnalysis:
+        """Combine independently generated summary and table into an analysis.
+        
+        A failed part is reported in the analysis errors, without losing the other part.
+        Raises the summary error if both parts failed.
+        """
+        errors = []
+        for name, result in (("summary", summary), ("main table", table)):
+            if isinstance(result, BaseException):
+                logger.error("Failed to generate %s for paper %s: %s", name, paper_id, result)
+                reason = result.message if isinstance(result, UserFacingError) else "An internal error occurred"
+                errors.append(f"Failed to generate {name}: {reason}")
+
+        if isinstance(summary, BaseException) and isinstance(table, BaseException):
+            raise summary
+
+        return PaperAnalysis(
+            paper_id=paper_id,
+            metadata=metadata,
+            summary=None if isinstance(summary, BaseException) else summary,
+            main_table=None if isinstance(table, BaseException) else table,
+            errors=errors
+        )
@@ -1,15 +1,80 @@
-from typing import List, Tuple
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple, Optional
 import fitz
-from ...storage.storage import Storage
-from ...models.paper import PaperContent
+from ...storage.storage import Storage, StorageError
+from ...models.paper import PaperContent, TableCandidate
+from ....utils.logger import logger
+from ....utils.metrics import metrics
+
+def extract_page_range(path: str, start: int, end: int, format: str = "markdown") -> List[str]:
+    """
+    Extract content from pages [start, end) of a pdf, one list element per page.
+    Runs in worker processes, so it opens the document by path instead of receiving its bytes.
+    
+    Args:
+        path: Local path to the pdf
+        start: 0-based index of the first page
+        end: 0-based index after the last page
+        format: Output format - one of:
+            - "plain": Simple text with minimal formatting
+            - "markdown": Text formatted as markdown                
+    """
+    with fitz.open(path) as doc:
+        return [doc[index].get_text(format) for index in range(start, min(end, doc.page_count))]
+
+# PyMuPDF's table detection keeps module-level state, so threads of a process must not run it concurrently
+_table_detection_lock = threading.Lock()
+
+def find_tables_on_pages(path: str, page_indexes: List[int]) -> List[TableCandidate]:
+    """
+    Find the tables on the given pages of a pdf with pymupdf's table detection.
+    Runs in worker processes, so it opens the document by path instead of receiving its bytes.
+    
+    Args:
+        path: Local path to the pdf
+        page_indexes: 0-based indexes of the pages to search
+    """
+    candidates = []
+    with _table_detection_lock, fitz.open(path) as doc:
+        for index in page_indexes:
+            for table in doc[index].find_tables().tables:
+                cells = [[_clean_cell(cell) for cell in row] for row in table.extract()]
+                candidates.append(TableCandidate(page_number=index + 1, bbox=tuple(table.bbox), cells=cells))
+    return candidates
+
+def _clean_cell(cell: Optional[str]) -> str:
+    """Merged cells are None, multi-line cells are joined and soft hyphens dropped."""
+    return " ".join((cell or "").replace("\xad", "").split())
+
+@dataclass
+class ContentExtractorConfig:
+    """Configuration for content extraction"""
+    # Worker processes used to extract pages in parallel, 1 extracts serially in a thread
+    max_workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+    # Papers are only split across workers in ranges of at least this many pages
+    min_pages_per_worker: int = 8
 
 class ContentExtractor:
-    """Extracts raw content from pdf files."""
+    """Extracts raw content from pdf files.
+    Parsing is CPU bound and holds the GIL, so pages are split into ranges extracted in parallel by a
+    process pool, keeping the event loop responsive.
+    Extracted text is cached in storage, keyed by the pdf's content hash, the format and the PyMuPDF version,
+    so it is only parsed again when one of those changes.
+    """
     
-    def __init__(self, storage: Storage):
+    def __init__(self, storage: Storage, config: Optional[ContentExtractorConfig] = None):
         self.storage = storage
+        self.config = config or ContentExtractorConfig()
+        self._executor: Optional[ProcessPoolExecutor] = None
         
-    def extract_content(self, paper_id: str, format: str = "markdown") -> PaperContent:
+    async def extract_content(self, paper_id: str, format: str = "markdown") -> PaperContent:
         """
         Extract all content from a pdf file.
         
@@ -17,57 +82,129 @@ class ContentExtractor:
             paper_id: ID of the paper to extract
             format: Output format for text extraction (plain/markdown)
         """
-        
-        with self.storage.get_paper_reader(paper_id) as reader:
-            metadata = self.storage.get_metadata(paper_id)
-            doc = fitz.open(stream=reader.read(), filetype="pdf")            
-            page_contents = self._extract_page_contents(doc, format)        
-            doc.close()
+        metadata = self.storage.get_metadata(paper_id)
+        cache_key = self._cache_key(paper_id, format)
+
+        page_contents = None
+        if cache_key:
+            page_contents = await asyncio.to_thread(self.storage.get_extracted_text, paper_id, cache_key)
+        if page_contents is not None:
+            metrics.increment("extraction.cache.hits")
+        else:
+            metrics.increment("extraction.cache.misses")
+            page_contents = await self.extract_pages(self.storage.get_paper_path(paper_id), format)
+            if cache_key:
+                await asyncio.to_thread(self.storage.store_extracted_text, paper_id, cache_key, page_contents)
             
-            return PaperContent(                
-                page_contents=page_contents,
-                title=metadata.title,
-                abstract=metadata.abstract
+        return PaperContent(                
+            page_contents=page_contents,
+            title=metadata.title,
+            abstract=metadata.abstract
+        )
+
+    async def extract_pages(self, path: Path, format: str = "markdown") -> List[str]:
+        """Extract content from each page of a pdf, splitting the pages across the process pool."""
+        page_count = await asyncio.to_thread(self._page_count, path)
+        workers = min(self.config.max_workers, page_count // self.config.min_pages_per_worker)
+        if workers <= 1:
+            return await asyncio.to_thread(extract_page_range, str(path), 0, page_count, format)
+
+        pages_per_worker = -(-page_count // workers)
+        loop = asyncio.get_running_loop()
+        ranges = await asyncio.gather(*(
+            loop.run_in_executor(self._get_executor(), extract_page_range, str(path), start, start + pages_per_worker, format)
+            for start in range(0, page_count, pages_per_worker)
+        ))
+        return [page for page_range in ranges for page in page_range]
+
+    async def find_table_candidates(self, paper_id: str, page_numbers: Optional[List[int]] = None) -> List[TableCandidate]:
+        """
+        Find the tables of a paper locally, with their page, bounding box and cells.
+        Table detection takes a fraction of a second per page, so the pages are split across the process pool.
+        
+        Args:
+            paper_id: ID of the paper
+            page_numbers: 1-based numbers of the pages to search, all pages by default
+        """
+        path = self.storage.get_paper_path(paper_id)
+        if page_numbers is None:
+            page_numbers = range(1, await asyncio.to_thread(self._page_count, path) + 1)
+        page_indexes = [number - 1 for number in page_numbers]
+        if not page_indexes:
+            return []
+
+        start = time.monotonic()
+        workers = min(self.config.max_workers, len(page_indexes))
+        if workers <= 1:
+            candidates = await asyncio.to_thread(find_tables_on_pages, str(path), page_indexes)
+        else:
+            loop = asyncio.get_running_loop()
+            groups = await asyncio.gather(*(
+                loop.run_in_executor(self._get_executor(), find_tables_on_pages, str(path), page_indexes[worker::workers])
+                for worker in range(workers)
+            ))
+            candidates = sorted((candidate for group in groups for candidate in group),
+                                key=lambda candidate: (candidate.page_number, candidate.bbox[1]))
+
+        logger.info("Found %d table candidates on %d pages of paper %s in %.2fs",
+                    len(candidates), len(page_indexes), paper_id, time.monotonic() - start)
+        metrics.observe("extraction.tables.seconds", time.monotonic() - start)
+        return candidates
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawn instead of fork, forking a process running an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.config.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
             )
+        return self._executor
+
+    @staticmethod
+    def _page_count(path: Path) -> int:
+        with fitz.open(path) as doc:
+            return doc.page_count
+
+    def _cache_key(self, paper_id: str, format: str) -> Optional[str]:
+        """Key identifying the extracted text, None if the paper's content hash is unknown."""
+        try:
+            paper_info = self.storage.get_paper_info(paper_id)
+        except StorageError:
+            return None
+        return f"{paper_info.sha256}:{format}:pymupdf-{fitz.VersionBind}"
     
     
-    def get_page_image(self, paper_id: str, page_number: int) -> Tuple[bytes, str]:
+    async def get_page_image(self, paper_id: str, page_number: int, zoom: float = 1.0,
+                             clip: Optional[Tuple[float, float, float, float]] = None) -> Tuple[bytes, str]:
         """
-        Get a specific page as an image at original size.
+        Get a specific page as an image, at original size by default.
         page_number: 1-based page number (first page = 1)
+        zoom: Scale factor of the rendered image, 2.0 renders at twice the original size
+        clip: Only render this region of the page, (x0, y0, x1, y1) in pdf points
         Returns a tuple of (image_bytes, mime_type)
         """
-        with self.storage.get_paper_reader(paper_id) as reader:
-            doc = fitz.open(stream=reader.read(), filetype="pdf")
-            
+        return await asyncio.to_thread(self._get_page_image, paper_id, page_number, zoom, clip)
+
+    def _get_page_image(self, paper_id: str, page_number: int, zoom: float = 1.0,
+                        clip: Optional[Tuple[float, float, float, float]] = None) -> Tuple[bytes, str]:
+        """Render a specific page as an image, blocking."""
+        # Open by path, mupdf reads the pages it needs instead of a copy of the whole file
+        with fitz.open(self.storage.get_paper_path(paper_id)) as doc:
             # Convert 1-based to 0-based indexing
             zero_based_page = page_number - 1
             
             if zero_based_page < 0 or zero_based_page >= len(doc):
-                doc.close()
                 raise ValueError(f"Page number {page_number} is out of range. Valid range: 1 to {len(doc)}")
             
             page = doc[zero_based_page]
-            mat = fitz.Matrix(1, 1)  # Use original size (1.0 zoom)
-            pix = page.get_pixmap(matrix=mat)
+            mat = fitz.Matrix(zoom, zoom)
+            pix = page.get_pixmap(matrix=mat, clip=fitz.Rect(clip) & page.rect if clip else None)
             
             img_bytes = pix.tobytes("png")
-            doc.close()
-            
-            return img_bytes, "image/png"    
-        
-    def _extract_page_contents(self, doc: fitz.Document, format: str = "markdown") -> List[str]:
-        """
-        Extract content from each page as a separate list element.
-        
-        Args:
-            doc: The PDF document
-            format: Output format - one of:
-                - "plain": Simple text with minimal formatting
-                - "markdown": Text formatted as markdown                
-        """
-        page_contents = []
-        for page in doc:        
-            text = page.get_text(format)                                
-            page_contents.append(text)
-        return page_contents
\ No newline at end of file
+            return img_bytes, "image/png"
@@ -0,0 +1,158 @@
+import re
+from collections import Counter
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Set
+from ...models.paper import PaperContent
+from ...llm.token_estimator import estimate_tokens, truncate_to_tokens
+from ....utils.logger import logger
+from ....utils.metrics import metrics
+
+# Sections that don't help summarizing a paper or finding its results
+BOILERPLATE_SECTIONS = (
+    r"references?", r"bibliography", r"literature cited", r"acknowledge?ments?",
+    r"supplementary (materials?|information|data)", r"supporting information",
+    r"conflicts? of interests?", r"competing interests?", r"declaration of (competing )?interests?",
+    r"funding( statement)?", r"author contributions?", r"data availability( statement)?",
+    r"institutional review board statement", r"informed consent statement", r"abbreviations",
+    r"disclaimer"
+)
+
+# Headings of sections that end a boilerplate section
+CONTENT_SECTIONS = (
+    r"abstract", r"introduction", r"background", r"(materials and )?methods?", r"results?",
+    r"discussion", r"conclusions?", r"appendix( [a-z0-9]+)?"
+)
+
+@dataclass
+class ContentPrunerConfig:
+    """Configuration for content pruning"""
+    # Estimated token budget of the page contents in each prompt type, None or missing for no budget
+    token_budgets: Dict[str, Optional[int]] = field(default_factory=lambda: {"summary": 20000, "table": 20000})
+    # Lines at the top and bottom of each page checked for running headers and footers
+    furniture_lines: int = 3
+    # A line is a running header or footer if it repeats on at least this fraction of the pages
+    furniture_min_page_fraction: float = 0.4
+    # Pages matching this are kept first when the table prompt is over budget
+    table_page_pattern: str = r"\bTable\s+\d+"
+
+class ContentPruner:
+    """Prunes extracted content before it is put in a prompt.
+    Drops boilerplate sections (references, acknowledgments, ...) and running headers and footers,
+    then fits the page contents in the token budget of the prompt.
+    Page numbering is kept, dropped pages are left empty.
+    """
+
+    def __init__(self, config: Optional[ContentPrunerConfig] = None):
+        self.config = config or ContentPrunerConfig()
+        self._boilerplate_heading = re.compile(
+            r"^(\d+(\.\d+)*\.?\s*)?[#*_\s]*(" + "|".join(BOILERPLATE_SECTIONS) + r")\b[*_\s]*([:.]|$)", re.IGNORECASE
+        )
+        self._content_heading = re.compile(
+            r"^(\d+(\.\d+)*\.?\s*)?[#*_\s]*(" + "|".join(CONTENT_SECTIONS) + r")[*_\s]*[:.]?[*_\s]*$", re.IGNORECASE
+        )
+        # Numbered reference entries also start with a number and a capital, but list authors separated by commas
+        self._numbered_heading = re.compile(r"^\d+(\.\d+)*\.?\s+[A-Z][^.,;]{2,80}$")
+        self._table_page = re.compile(self.config.table_page_pattern)
+
+    def prune(self, paper_id: str, content: PaperContent, prompt: str) -> PaperContent:
+        """
+        Prune the content for a prompt and report the tokens removed.
+
+        Args:
+            paper_id: ID of the paper, for reporting
+            content: Extracted content of the paper
+            prompt: Prompt type the content is for, one of the token budgets (summary/table)
+        Returns:
+            Content with the same number of pages, pruned pages left empty
+        """
+        pages = self._drop_boilerplate(content.page_contents)
+        budget = self.config.token_budgets.get(prompt)
+        if budget is not None:
+            pages = self._fit_budget(pages, budget, self._priority_pages(pages, prompt))
+
+        tokens_before = sum(estimate_tokens(page) for page in content.page_contents)
+        tokens_after = sum(estimate_tokens(page) for page in pages)
+        logger.info("Pruned %d of %d estimated tokens from paper %s for the %s prompt",
+                    tokens_before - tokens_after, tokens_before, paper_id, prompt)
+        metrics.increment(f"pruning.{prompt}.tokens_removed", tokens_before - tokens_after)
+        metrics.observe(f"pruning.{prompt}.tokens_kept", tokens_after)
+        return replace(content, page_contents=pages)
+
+    def estimate_tokens(self, content: PaperContent) -> int:
+        """Estimate the tokens of the page contents once boilerplate is dropped, before any budget."""
+        return sum(estimate_tokens(page) for page in self._drop_boilerplate(content.page_contents))
+
+    def _drop_boilerplate(self, pages: List[str]) -> List[str]:
+        return self._drop_boilerplate_sections(self._drop_page_furniture(pages))
+
+    def _drop_page_furniture(self, pages: List[str]) -> List[str]:
+        """Drop running headers and footers, lines repeated at the top or bottom of many pages."""
+        min_pages = max(3, int(len(pages) * self.config.furniture_min_page_fraction))
+        if len(pages) < min_pages:
+            return pages
+
+        page_lines = [page.splitlines() for page in pages]
+        counts = Counter()
+        for lines in page_lines:
+            # Count once per page, e.g. page numbers only differ in their digits
+            counts.update({self._normalize(line) for line in self._edge_lines(lines)})
+        furniture = {line for line, count in counts.items() if line and count >= min_pages}
+        if not furniture:
+            return pages
+
+        pruned = []
+        for lines in page_lines:
+            edges = set(range(min(self.config.furniture_lines, len(lines))))
+            edges |= set(range(max(len(lines) - self.config.furniture_lines, 0), len(lines)))
+            pruned.append("\n".join(
+                line for index, line in enumerate(lines)
+                if not (index in edges and self._normalize(line) in furniture)
+            ))
+        return pruned
+
+    def _edge_lines(self, lines: List[str]) -> List[str]:
+        n = self.config.furniture_lines
+        return lines[:n] + lines[max(len(lines) - n, n):]
+
+    @staticmethod
+    def _normalize(line: str) -> str:
+        return re.sub(r"\s+", " ", re.sub(r"\d+", "#", line)).strip().lower()
+
+    def _drop_boilerplate_sections(self, pages: List[str]) -> List[str]:
+        """Drop boilerplate sections, from their heading up to the next content section heading."""
+        dropping = False
+        pruned = []
+        for page in pages:
+            kept = []
+            for line in page.splitlines():
+                stripped = line.strip()
+                if self._boilerplate_heading.match(stripped):
+                    dropping = True
+                elif dropping and (self._content_heading.match(stripped) or self._numbered_heading.match(stripped)):
+                    dropping = False
+                if not dropping:
+                    kept.append(line)
+            pruned.append("\n".join(kept))
+        return pruned
+
+    def _priority_pages(self, pages: List[str], prompt: str) -> Set[int]:
+        """Indexes of the pages kept first when over budget."""
+        if prompt == "table":
+            return {index for index, page in enumerate(pages) if self._table_page.search(page)}
+        return set()
+
+    @staticmethod
+    def _fit_budget(pages: List[str], budget: int, priority: Set[int]) -> List[str]:
+        """Keep pages in the budget, priority pages first then in page order. The first page over budget is truncated."""
+        order = sorted(range(len(pages)), key=lambda index: (index not in priority, index))
+        fitted = [""] * len(pages)
+        remaining = budget
+        for index in order:
+            tokens = estimate_tokens(pages[index])
+            if tokens <= remaining:
+                fitted[index] = pages[index]
+                remaining -= tokens
+            else:
+                fitted[index] = truncate_to_tokens(pages[index], remaining)
+                remaining = 0
+        return fitted
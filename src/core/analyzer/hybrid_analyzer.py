@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+from .prompts import HYBRID_TABLE_PAGE_PROMPT, HYBRID_TABLE_IMAGE_PROMPT
+from .text_dump_analyzer import TextDumpAnalyzer, TextDumpAnalyzerConfig
+from ..llm.base_llm import BaseLLM
+from ..storage.storage import Storage
+from .extractor.content_extractor import ContentExtractor
+from .extractor.content_pruner import ContentPruner
+from ..models.paper import PaperContent, TableCandidate, TableInfo
+from pydantic import BaseModel
+from typing import List, Optional, Tuple
+from ...utils.stage_limits import StageLimits
+from ...utils.logger import logger
+
+@dataclass
+class HybridAnalyzerConfig(TextDumpAnalyzerConfig):
+    """Configuration for hybrid analysis"""
+    # Scale of the rendered table page, small table text is hard to read at the original size
+    page_zoom: float = 2.0
+    # Margin around a detected table when only its region is rendered, in pdf points, to keep its caption
+    clip_margin: float = 36
+
+class TablePageResponse(BaseModel):
+    page_number: int
+    table_caption: str
+
+class TableResponse(BaseModel):
+    table_description: str
+    csv_content: str
+    footnotes: str
+
+class HybridAnalyzer(TextDumpAnalyzer):
+    """Analyzes paper using its txt content, except for the main table.
+    A clean locally detected table is used as is. Otherwise the main table is located in the page-numbered txt content,
+    or by its detected region, then extracted from an image of just that page or region.
+    This keeps the table layout the txt content loses, without sending the image of every page like the PdfDumpAnalyzer.
+    """
+
+    def __init__(self, storage: Storage, content_extractor: ContentExtractor, llm: BaseLLM,
+                 stage_limits: Optional[StageLimits] = None, content_pruner: Optional[ContentPruner] = None,
+                 config: Optional[HybridAnalyzerConfig] = None):
+        super().__init__(storage, content_extractor, llm, stage_limits, content_pruner, config or HybridAnalyzerConfig())
+
+    async def _generate_main_table(self, paper_id: str, content: PaperContent, context: str,
+                                   candidates: List[TableCandidate]) -> Optional[TableInfo]:
+        """Generate the main table from the local table candidates, or from an image of its page."""
+        choice = await self._choose_table_candidate(paper_id, candidates, context)
+        if choice is not None:
+            candidate, table_info = choice
+            if self._is_clean(candidate):
+                logger.info("Using the locally extracted main table of paper %s", paper_id)
+                return table_info
+            # The table was found but its cells are garbled, read it from an image of just the table
+            x0, y0, x1, y1 = candidate.bbox
+            margin = self.config.clip_margin
+            return await self._extract_table_from_image(paper_id, content, candidate.page_number, table_info.description,
+                                                        clip=(x0 - margin, y0 - margin, x1 + margin, y1 + margin))
+
+        # Locate the page of the main table in the txt content
+        located = await self.llm.chat(HYBRID_TABLE_PAGE_PROMPT, TablePageResponse, context=context)
+
+        if located.page_number == 0:
+            logger.info("No main table found for paper: %s", paper_id)
+            return None
+        if not 1 <= located.page_number <= len(content.page_contents):
+            # The page could not be located, fall back to extracting the table from the txt content
+            logger.warning("Main table located on invalid page %d for paper %s, falling back to txt content",
+                           located.page_number, paper_id)
+            return await self._identify_main_table(context)
+
+        return await self._extract_table_from_image(paper_id, content, located.page_number, located.table_caption)
+
+    async def _extract_table_from_image(self, paper_id: str, content: PaperContent, page_number: int, caption: str,
+                                        clip: Optional[Tuple[float, float, float, float]] = None) -> TableInfo:
+        """Extract the main table from an image of its page, or of its region of the page."""
+        logger.info("Main table of paper %s is on page %d", paper_id, page_number)
+        image_data, mime_type = await self.content_extractor.get_page_image(
+            paper_id, page_number, zoom=self.config.page_zoom, clip=clip
+        )
+        prompt = HYBRID_TABLE_IMAGE_PROMPT.format(page_number=page_number, title=content.title, caption=caption)
+        res = await self.llm.chat_with_image(prompt, image_data, mime_type, TableResponse)
+        return TableInfo(
+            description=res.table_description,
+            csv_content=res.csv_content,
+            footnotes=res.footnotes
+        )
@@ -1,28 +1,85 @@
+import asyncio
 import base64
+import mmap
+from pathlib import Path
 from ..models.paper import PaperAnalysis, TableInfo
 from .prompts import PDF_SUMMARY_PROMPT, PDF_MAIN_TABLE_PROMPT
 from .base_analyzer import ContentAnalyzer
 from ..llm.base_llm import BaseLLM
 from ..storage.storage import Storage
-import os
+from .extractor.pdf_slimmer import PdfSlimmer
+from ...utils.stage_limits import StageLimits
+from ...utils.metrics import metrics
+from typing import Optional
+
+def encode_pdf_base64(path: Path) -> str:
+    """Encode a pdf in base64 from a memory-mapped view, without first reading the whole file into memory."""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        return base64.standard_b64encode(view).decode("ascii")
 
 class PdfDumpAnalyzer(ContentAnalyzer):
-    """Analyzes paper by sending the entire content to Claude LLM."""
+    """Analyzes paper by sending the entire content to Claude LLM.
+    The pdf is slimmed first. The summary prompt writes it to the prompt cache, the table prompt is sent
+    once the summary has started and reads it from there.
+    """
     
-    def __init__(self, storage: Storage, llm: BaseLLM):
+    def __init__(self, storage: Storage, llm: BaseLLM, stage_limits: Optional[StageLimits] = None,
+                 pdf_slimmer: Optional[PdfSlimmer] = None):
         self.llm = llm
         self.storage = storage
+        self.stage_limits = stage_limits or StageLimits()
+        self.pdf_slimmer = pdf_slimmer or PdfSlimmer()
     
-    def analyze_paper(self, paper_id: str) -> PaperAnalysis:
+    async def analyze_paper(self, paper_id: str, stored: Optional[PaperAnalysis] = None) -> PaperAnalysis:
         """Analyze paper content by sending PDF to LLM."""
-        pdf_data = self._get_pdf_data(paper_id)
+        stored_summary = stored.summary if stored else None
+        stored_table = stored.main_table if stored else None
+        # Slimming and encoding a large pdf takes a while, keep it off the event loop
+        with metrics.timer("stage.prompt.seconds"):
+            pdf_data = await asyncio.to_thread(self._get_pdf_data, paper_id)
         
-        # Get analysis using PDF support
-        summary = self.llm.chat_with_pdf(PDF_SUMMARY_PROMPT, pdf_data, json_structure={"summary": "Summary of the paper"})
-        print(f"Summary: {summary} \n\n")
+        async with self.stage_limits.llm:
+            with metrics.timer("stage.llm.seconds"):
+                if stored_summary is None and stored_table is None:
+                    summary, table_info = await self._generate_both(pdf_data)
+                else:
+                    summary, table_info = await asyncio.gather(
+                        self._stored(stored_summary) if stored_summary is not None else self._generate_summary(pdf_data),
+                        self._stored(stored_table) if stored_table is not None else self._identify_main_table(pdf_data),
+                        return_exceptions=True
+                    )
+
+        metadata = self.storage.get_metadata(paper_id)
+        return self._combine_results(paper_id, metadata, summary, table_info)
+
+    @staticmethod
+    async def _stored(part):
+        return part
 
-        # Get table selection
-        table_selection = self.llm.chat_with_pdf(
+    async def _generate_both(self, pdf_data: str):
+        """Summary and table are independent, but a table prompt sent together with the summary prompt
+        misses the prompt cache. It is sent once the summary prompt has cached the pdf, or has failed."""
+        started = asyncio.Event()
+        summary_task = asyncio.ensure_future(self._generate_summary(pdf_data, started))
+        started_task = asyncio.ensure_future(started.wait())
+        try:
+            await asyncio.wait([summary_task, started_task], return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            summary_task.cancel()
+            raise
+        finally:
+            started_task.cancel()
+        return await asyncio.gather(summary_task, self._identify_main_table(pdf_data), return_exceptions=True)
+
+    async def _generate_summary(self, pdf_data: str, started: Optional[asyncio.Event] = None) -> str:
+        """Generate summary of the paper using PDF support."""
+        summary = await self.llm.chat_with_pdf(PDF_SUMMARY_PROMPT, pdf_data,
+                                               json_structure={"summary": "Summary of the paper"}, started=started)
+        return summary["summary"]
+
+    async def _identify_main_table(self, pdf_data: str) -> TableInfo:
+        """Identify the main results table using PDF support."""
+        table_selection = await self.llm.chat_with_pdf(
             PDF_MAIN_TABLE_PROMPT, 
             pdf_data, 
             json_structure={
@@ -31,22 +88,17 @@ class PdfDumpAnalyzer(ContentAnalyzer):
                 "footnotes": "Any footnotes associated with the table"
             }
         )
-        print(f"Table selection: {table_selection} \n\n")
-        metadata = self.storage.get_metadata(paper_id)
-                        
-        return PaperAnalysis(
-            paper_id=paper_id,
-            metadata=metadata,
-            summary=summary["summary"],
-            main_table=TableInfo(
-                description=table_selection["table_description"],
-                csv_content=table_selection["csv_content"],
-                footnotes=table_selection["footnotes"]
-            )
+        return TableInfo(
+            description=table_selection["table_description"],
+            csv_content=table_selection["csv_content"],
+            footnotes=table_selection["footnotes"]
         )
     
     def _get_pdf_data(self, paper_id: str) -> str:
-        """Fetch PDF data and encode in base64."""
-        with self.storage.get_paper_reader(paper_id) as reader:
-            pdf_content = reader.read()
-        return base64.standard_b64encode(pdf_content).decode("utf-8")
\ No newline at end of file
+        """Fetch PDF data, slim it and encode in base64.
+        A pdf that can't be made smaller is encoded from a memory-mapped view of the stored file."""
+        path = self.storage.get_paper_path(paper_id)
+        slimmed = self.pdf_slimmer.slim(paper_id, path)
+        if slimmed is None:
+            return encode_pdf_base64(path)
+        return base64.standard_b64encode(slimmed).decode("ascii")
\ No newline at end of file
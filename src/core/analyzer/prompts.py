@@ -7,7 +7,8 @@ Do not make up any information. Only focus on the tables, not charts or other vi
 """
 
 # Text-based paper analysis prompts
-TXT_PAPER_SUMMARY_PROMPT = """You are given an academic research paper as follows:
+# The paper is sent as a context shared by the prompts below, so it is cached by the LLM provider after the first call
+PAPER_CONTEXT_PROMPT = """You are given an academic research paper as follows:
 
 Title: {title}
 
@@ -22,17 +23,53 @@ Page 2:
 
 Content of the paper:
 {content}
+"""
 
-
-Based on the content of the research paper, please generate a concise summary (around 250 words) focusing on the paper's objectives, 
+TXT_PAPER_SUMMARY_PROMPT = """Based on the content of the research paper, please generate a concise summary (around 250 words) focusing on the paper's objectives, 
 methods, and key findings.
+Respond with only the summary.
+"""
+
+TXT_PAPER_TABLE_PROMPT = """Identify and return the table that appears to be the main results table of the research paper. Focus on the existing tables. Do not create tables that are not present in the paper.
 """
 
-TXT_PAPER_TABLE_PROMPT = """Given the following research paper:
+# Chunked summarization prompts, for papers over the summary token budget
+CHUNK_SUMMARY_PROMPT = """You are given pages {first_page} to {last_page} of {page_count} of the research paper "{title}":
+{content}
+
+Summarize these pages in around 150 words, focusing on the paper's objectives, methods and key findings they contain.
+"""
+
+REDUCE_SUMMARY_PROMPT = """You are given summaries of consecutive parts of an academic research paper as follows:
 
 Title: {title}
+
 Abstract: {abstract}
-Content: {content}
 
-Identify and return the table that appears to be the main results table. Focus on the existing tables. Do not create tables that are not present in the paper.
-"""
\ No newline at end of file
+Summaries of the parts:
+{summaries}
+
+Based on these, please generate a concise summary (around 250 words) of the whole paper, focusing on the paper's objectives, 
+methods, and key findings.
+Respond with only the summary.
+"""
+
+TABLE_CANDIDATES_PROMPT = """The following tables were detected in the research paper automatically. The first rows of each, as CSV:
+
+{candidates}
+
+Identify the table among these that appears to be the main results table of the paper, and return its number along with a short description of it and its footnotes from the paper.
+If none of them is the main results table, return 0 as the number.
+"""
+
+# Hybrid analysis prompts, locate the main table in the text then extract it from an image of its page
+HYBRID_TABLE_PAGE_PROMPT = """Identify the table that appears to be the main results table of the research paper and return the number of the page it is on, along with its caption.
+Focus on the existing tables. If the paper has no tables, return 0 as the page number.
+"""
+
+HYBRID_TABLE_IMAGE_PROMPT = """The image is page {page_number} of the research paper "{title}", or the part of it with a table.
+It contains the main results table of the paper: {caption}
+
+Return this table as CSV, along with a short description and its footnotes. Transcribe the values exactly as they appear in the image.
+Do not make up any information.
+"""
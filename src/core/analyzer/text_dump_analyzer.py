@@ -1,75 +1,266 @@
-from .prompts import TXT_PAPER_SUMMARY_PROMPT, TXT_PAPER_TABLE_PROMPT
+import asyncio
+import re
+from dataclasses import dataclass, asdict
+from .prompts import (PAPER_CONTEXT_PROMPT, TXT_PAPER_SUMMARY_PROMPT, TXT_PAPER_TABLE_PROMPT, TABLE_CANDIDATES_PROMPT,
+                      CHUNK_SUMMARY_PROMPT, REDUCE_SUMMARY_PROMPT)
 from .base_analyzer import ContentAnalyzer
 from ..llm.base_llm import BaseLLM
+from ..llm.token_estimator import estimate_tokens
 from ..storage.storage import Storage
 from .extractor.content_extractor import ContentExtractor
-from ..models.paper import PaperContent, TableInfo, PaperAnalysis
+from .extractor.content_pruner import ContentPruner
+from ..models.paper import PaperContent, TableCandidate, TableInfo, PaperAnalysis
+from ..models.analysis_event import AnalysisEvent, AnalysisEventType
 from pydantic import BaseModel
-import os
+from typing import AsyncIterator, List, Optional, Tuple
+from ...utils.stage_limits import StageLimits
 from ...utils.logger import logger
+from ...utils.metrics import metrics
+
+# Pages mentioning a table are searched for table candidates
+TABLE_MENTION = re.compile(r"\bTable\s+\d+", re.IGNORECASE)
+# Candidates are shown to the LLM as their first rows, with cells cut short
+MAX_TABLE_CANDIDATES = 20
+PREVIEW_ROWS = 4
+PREVIEW_CELL_LENGTH = 40
+# Locally extracted tables with more empty cells are likely garbled, the LLM extracts them instead
+MAX_EMPTY_CELL_FRACTION = 0.2
+
+@dataclass
+class TextDumpAnalyzerConfig:
+    """Configuration for text analysis"""
+    # Papers over the summary token budget are summarized in chunks of about this many estimated tokens
+    chunk_tokens: int = 8000
+    # Chunks of a paper summarized concurrently
+    max_parallel_chunks: int = 4
 
 class TextDumpAnalyzer(ContentAnalyzer):
-    """Analyzes paper by sending the entire txt content to LLM."""
+    """Analyzes paper by sending the entire txt content to LLM.
+    Papers over the summary token budget are summarized in chunks which are then reduced into one summary,
+    instead of being truncated.
+    """
 
-    def __init__(self, storage: Storage, content_extractor: ContentExtractor, llm: BaseLLM):
+    def __init__(self, storage: Storage, content_extractor: ContentExtractor, llm: BaseLLM,
+                 stage_limits: Optional[StageLimits] = None, content_pruner: Optional[ContentPruner] = None,
+                 config: Optional[TextDumpAnalyzerConfig] = None):
         self.llm = llm
         self.storage = storage
         self.content_extractor = content_extractor
+        self.stage_limits = stage_limits or StageLimits()
+        self.content_pruner = content_pruner or ContentPruner()
+        self.config = config or TextDumpAnalyzerConfig()
     
-    def analyze_paper(self, paper_id: str) -> PaperAnalysis:
+    async def analyze_paper(self, paper_id: str, stored: Optional[PaperAnalysis] = None) -> PaperAnalysis:
         """Analyze paper content in steps to generate insights."""
+        async for event in self.stream_analysis(paper_id, stored):
+            if event.type == AnalysisEventType.DONE:
+                return event.analysis
+
+    async def stream_analysis(self, paper_id: str, stored: Optional[PaperAnalysis] = None) -> AsyncIterator[AnalysisEvent]:
+        """Analyze paper content in steps, yielding an event as each step completes and the summary as it is generated."""
+        stored_summary = stored.summary if stored else None
+        stored_table = stored.main_table if stored else None
         # Extract content
         logger.info("Extracting content for paper: %s", paper_id)
-        content = self.content_extractor.extract_content(paper_id)        
-                                
-        logger.info("Generating summary for paper: %s", paper_id)
-        summary = self._generate_summary(content)        
-                        
-        logger.info("Identifying main table for paper: %s", paper_id)
-        table_info = self._identify_main_table(content)    
+        async with self.stage_limits.extraction:
+            with metrics.timer("stage.extract.seconds"):
+                content = await self.content_extractor.extract_content(paper_id)
+                table_candidates = [] if stored_table else await self._find_table_candidates(paper_id, content)
+        yield AnalysisEvent(AnalysisEventType.EXTRACTED, {
+            "page_count": len(content.page_contents),
+            "table_candidates": len(table_candidates)
+        })
 
-        metadata = self.storage.get_metadata(paper_id)
+        with metrics.timer("stage.prompt.seconds"):
+            table_content = self.content_pruner.prune(paper_id, content, "table")
+            table_context = self._paper_context(table_content)
+            shared_context = False
+            if stored_summary is not None:
+                # Stored by an earlier, partly failed analysis, only the table is generated
+                summary_stream = self._stream_stored(stored_summary)
+            elif self._needs_chunking(paper_id, content):
+                summary_stream = self._stream_chunked_summary(paper_id, self.content_pruner.prune(paper_id, content, "chunks"))
+            else:
+                summary_content = self.content_pruner.prune(paper_id, content, "summary")
+                # The prompts share the paper context as a cached prefix unless pruning left different content
+                shared_context = table_content == summary_content and stored_table is None
+                summary_context = table_context if shared_context else self._paper_context(summary_content)
+                summary_stream = self.llm.stream(TXT_PAPER_SUMMARY_PROMPT, context=summary_context)
 
-        return PaperAnalysis(
-            paper_id=paper_id,
-            metadata=metadata,
-            summary=summary,
-            main_table=table_info
-        )
+        async with self.stage_limits.llm:
+            with metrics.timer("stage.llm.seconds"):
+                def start_table() -> asyncio.Future:
+                    return asyncio.ensure_future(
+                        self._stored(stored_table) if stored_table is not None else
+                        self._generate_main_table(paper_id, table_content, table_context, table_candidates)
+                    )
+
+                # Summary and table are independent, the table is generated while the summary streams.
+                # With a shared context it is sent once the summary has started, reading the paper from the cache
+                logger.info("Generating summary and identifying main table for paper: %s", paper_id)
+                table_task = None if shared_context else start_table()
+                try:
+                    summary = ""
+                    try:
+                        async for delta in summary_stream:
+                            if table_task is None:
+                                table_task = start_table()
+                            summary += delta
+                            yield AnalysisEvent(AnalysisEventType.SUMMARY_DELTA, {"text": delta})
+                    except Exception as e:
+                        summary = e
+                    else:
+                        summary = summary.strip()
+                        yield AnalysisEvent(AnalysisEventType.SUMMARY, {"summary": summary})
+                    if table_task is None:
+                        table_task = start_table()
+                    table_info = (await asyncio.gather(table_task, return_exceptions=True))[0]
+                finally:
+                    # Stop generating if the consumer stopped listening
+                    if table_task is not None:
+                        table_task.cancel()
+                    await summary_stream.aclose()
+
+        if not isinstance(table_info, BaseException):
+            yield AnalysisEvent(AnalysisEventType.TABLE, {"table": asdict(table_info) if table_info else None})
+
+        metadata = self.storage.get_metadata(paper_id)
+        yield AnalysisEvent(AnalysisEventType.DONE,
+                            analysis=self._combine_results(paper_id, metadata, summary, table_info))
     
-    def _generate_summary(self, content: PaperContent) -> str:
-        """Generate summary of the paper."""
-        # generate a str with the paper content
-        # format is: Title, Abstract, Page Contents
-        paper_str = f""        
-        for index, page in enumerate(content.page_contents):
-            paper_str += f"\nPage {index+1}:\n"
-            paper_str += f"{page}\n"
-        
-        # generate summary
-        prompt = TXT_PAPER_SUMMARY_PROMPT.format(title=content.title, abstract=content.abstract, content=paper_str)
+    @staticmethod
+    def _paper_context(content: PaperContent) -> str:
+        """The paper as the context of the prompts, each page preceded by its 1-based page number."""
+        paper_str = "".join(f"\nPage {index+1}:\n{page}\n" for index, page in enumerate(content.page_contents))
+        return PAPER_CONTEXT_PROMPT.format(title=content.title, abstract=content.abstract, content=paper_str)
+
+    @staticmethod
+    async def _stream_stored(summary: str) -> AsyncIterator[str]:
+        yield summary
+
+    @staticmethod
+    async def _stored(table: TableInfo) -> TableInfo:
+        return table
+
+    async def _find_table_candidates(self, paper_id: str, content: PaperContent) -> List[TableCandidate]:
+        """Find the tables of the paper locally, on the pages mentioning a table since table detection is slow."""
+        page_numbers = [index + 1 for index, page in enumerate(content.page_contents) if TABLE_MENTION.search(page)]
+        try:
+            return await self.content_extractor.find_table_candidates(paper_id, page_numbers)
+        except Exception as e:
+            logger.warning("Failed to find table candidates for paper %s: %s", paper_id, e)
+            return []
+
+    def _needs_chunking(self, paper_id: str, content: PaperContent) -> bool:
+        """Pre-flight check whether the paper is over the summary token budget."""
+        budget = self.content_pruner.config.token_budgets.get("summary")
+        estimate = self.content_pruner.estimate_tokens(content)
+        if budget is None or estimate <= budget:
+            return False
+        logger.info("Paper %s is estimated at %d tokens, over the summary budget of %d, summarizing in chunks",
+                    paper_id, estimate, budget)
+        return True
+
+    async def _stream_chunked_summary(self, paper_id: str, content: PaperContent) -> AsyncIterator[str]:
+        """Summarize token-bounded chunks of the paper concurrently, then stream their reduction into one summary."""
+        chunks = self._chunk_pages(content.page_contents, self.config.chunk_tokens)
+        semaphore = asyncio.Semaphore(self.config.max_parallel_chunks)
 
         class SummaryResponse(BaseModel):
             summary: str
 
-        return self.llm.chat(prompt, SummaryResponse).summary
+        async def summarize_chunk(first_page: int, pages: List[str]) -> str:
+            prompt = CHUNK_SUMMARY_PROMPT.format(
+                first_page=first_page, last_page=first_page + len(pages) - 1, page_count=len(content.page_contents),
+                title=content.title,
+                content="".join(f"\nPage {first_page+index}:\n{page}\n" for index, page in enumerate(pages))
+            )
+            async with semaphore:
+                return (await self.llm.chat(prompt, SummaryResponse)).summary
 
-    
-    def _identify_main_table(self, content: PaperContent) -> TableInfo:
+        logger.info("Summarizing paper %s in %d chunks", paper_id, len(chunks))
+        summaries = await asyncio.gather(*(summarize_chunk(first_page, pages) for first_page, pages in chunks))
+        prompt = REDUCE_SUMMARY_PROMPT.format(
+            title=content.title, abstract=content.abstract,
+            summaries="".join(f"\nPages {first_page} to {first_page + len(pages) - 1}:\n{summary}\n"
+                              for (first_page, pages), summary in zip(chunks, summaries))
+        )
+        async for delta in self.llm.stream(prompt):
+            yield delta
+
+    @staticmethod
+    def _chunk_pages(pages: List[str], chunk_tokens: int) -> List[Tuple[int, List[str]]]:
+        """Split the pages into chunks of consecutive pages within chunk_tokens, with their first 1-based page number.
+        A single page over chunk_tokens is its own chunk, chunks of only pruned (empty) pages are dropped."""
+        chunks = []
+        first_page, chunk, tokens = 1, [], 0
+        for index, page in enumerate(pages):
+            page_tokens = estimate_tokens(page)
+            if chunk and tokens + page_tokens > chunk_tokens:
+                if tokens:
+                    chunks.append((first_page, chunk))
+                chunk, tokens = [], 0
+            if not chunk:
+                first_page = index + 1
+            chunk.append(page)
+            tokens += page_tokens
+        if tokens:
+            chunks.append((first_page, chunk))
+        return chunks
+
+    async def _generate_main_table(self, paper_id: str, content: PaperContent, context: str,
+                                   candidates: List[TableCandidate]) -> Optional[TableInfo]:
+        """Generate the main table of the paper, from the local table candidates if one is clean."""
+        choice = await self._choose_table_candidate(paper_id, candidates, context)
+        if choice is not None and self._is_clean(choice[0]):
+            logger.info("Using the locally extracted main table of paper %s", paper_id)
+            return choice[1]
+        return await self._identify_main_table(context)
+
+    async def _choose_table_candidate(self, paper_id: str, candidates: List[TableCandidate],
+                                      context: str) -> Optional[Tuple[TableCandidate, TableInfo]]:
+        """Ask the LLM to pick the main table from previews of the candidates, None if there is none."""
+        if not candidates:
+            return None
+        candidates = candidates[:MAX_TABLE_CANDIDATES]
+        previews = "\n".join(
+            f"Table {number}: page {candidate.page_number}, {candidate.row_count} rows x {candidate.col_count} columns\n"
+            f"{candidate.to_csv(max_rows=PREVIEW_ROWS, max_cell_length=PREVIEW_CELL_LENGTH)}"
+            for number, candidate in enumerate(candidates, start=1)
+        )
+
+        class TableChoiceResponse(BaseModel):
+            table_number: int
+            table_description: str
+            footnotes: str
+
+        prompt = TABLE_CANDIDATES_PROMPT.format(candidates=previews)
+        res = await self.llm.chat(prompt, TableChoiceResponse, context=context)
+        if not 1 <= res.table_number <= len(candidates):
+            logger.info("None of the %d table candidates is the main table of paper %s", len(candidates), paper_id)
+            return None
+
+        candidate = candidates[res.table_number - 1]
+        return candidate, TableInfo(
+            description=res.table_description,
+            csv_content=candidate.to_csv(),
+            footnotes=res.footnotes
+        )
+
+    @staticmethod
+    def _is_clean(candidate: TableCandidate) -> bool:
+        """Whether the locally extracted cells can be returned as they are."""
+        return (candidate.row_count >= 2 and candidate.col_count >= 2
+                and candidate.empty_cell_fraction <= MAX_EMPTY_CELL_FRACTION)
+
+    async def _identify_main_table(self, context: str) -> TableInfo:
         """Identify the main results table."""
-        paper_str = f""        
-        for index, page in enumerate(content.page_contents):
-            paper_str += f"\nPage {index+1}:\n"
-            paper_str += f"{page}\n"
-        
-        prompt = TXT_PAPER_TABLE_PROMPT.format(title=content.title, abstract=content.abstract, content=paper_str)
-        
         class TableResponse(BaseModel):
             table_description: str
             csv_content: str
             footnotes: str
                 
-        res = self.llm.chat(prompt, TableResponse)        
+        res = await self.llm.chat(TXT_PAPER_TABLE_PROMPT, TableResponse, context=context)        
         return TableInfo(
             description=res.table_description,
             csv_content=res.csv_content,
@@ -0,0 +1,102 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import List, Dict, Set
+from .paper_service import PaperService
+from .models.batch import BatchJob, BatchItem, BatchItemStatus
+from .llm.llm_scheduler import LLMPriority, llm_priority
+from ..utils.stage_limits import StageLimits
+from ..utils.exceptions import UserFacingError
+from ..utils.logger import logger
+
+class BatchService:
+    """Service for analyzing many papers concurrently.
+    
+    Papers are fanned out over a bounded pool of tasks. The per stage limits (download, extraction, llm)
+    are enforced by the shared StageLimits used by the paper service and the analyzer, the pool only
+    needs to be large enough to keep every stage busy.
+    """
+
+    def __init__(self, paper_service: PaperService, stage_limits: StageLimits, max_jobs: int = 100):
+        self.paper_service = paper_service
+        self.max_jobs = max_jobs
+        self.workers = asyncio.Semaphore(stage_limits.total)
+        self._jobs: Dict[str, BatchJob] = {}
+        # Keep references to running jobs, so they are not garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, urls: List[str]) -> BatchJob:
+        """Create a batch job for the given URLs and start processing it in the background."""
+        if not urls:
+            raise UserFacingError("At least one URL is required")
+
+        job = BatchJob(id=uuid.uuid4().hex, items=[BatchItem(url=url) for url in urls])
+        self._evict_finished_jobs()
+        self._jobs[job.id] = job
+
+        logger.info("Submitted batch job %s with %d papers", job.id, len(job.items))
+        task = asyncio.create_task(self._run_job(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get_job(self, job_id: str) -> BatchJob:
+        """Retrieve a batch job by id."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise UserFacingError(f"Batch job not found: {job_id}", status_code=404)
+        return job
+
+    async def _run_job(self, job: BatchJob) -> None:
+        """Look up all papers of a job in bulk, then fan them out over the worker pool.
+        Their LLM calls are queued behind the interactive requests."""
+        with llm_priority(LLMPriority.BATCH):
+            await self._run_items(job)
+
+    async def _run_items(self, job: BatchJob) -> None:
+        try:
+            errors = await self.paper_service.prefetch([item.url for item in job.items])
+        except Exception as e:
+            logger.error("Batch job %s prefetch failed, papers are looked up one by one: %s", job.id, e)
+            errors = {}
+
+        pending = []
+        for item in job.items:
+            error = errors.get(item.url)
+            # Only a definite answer (invalid URL, no such article, not in PMC) fails the paper right away.
+            # A failed bulk call fails every paper of its chunk, those are looked up again one by one
+            if isinstance(error, UserFacingError):
+                item.error = self._error_message(error)
+                item.status = BatchItemStatus.FAILED
+                item.finished_at = datetime.now()
+                continue
+            pending.append(self._process_item(job.id, item))
+        await asyncio.gather(*pending)
+
+    async def _process_item(self, job_id: str, item: BatchItem) -> None:
+        """Analyze a single paper of a job, recording its outcome on the item."""
+        async with self.workers:
+            item.status = BatchItemStatus.RUNNING
+            item.started_at = datetime.now()
+            try:
+                item.analysis = await self.paper_service.get_analysis(item.url)
+                item.status = BatchItemStatus.DONE
+            except Exception as e:
+                logger.error("Batch job %s failed for %s: %s", job_id, item.url, e)
+                item.error = self._error_message(e)
+                item.status = BatchItemStatus.FAILED
+            finally:
+                item.finished_at = datetime.now()
+
+    @staticmethod
+    def _error_message(error: Exception) -> str:
+        """Message of an error that is safe to show to users."""
+        return error.message if isinstance(error, UserFacingError) else "An internal error occurred"
+
+    def _evict_finished_jobs(self) -> None:
+        """Drop the oldest finished jobs once more than max_jobs are kept."""
+        if len(self._jobs) < self.max_jobs:
+            return
+        finished = sorted((job for job in self._jobs.values() if job.is_finished), key=lambda job: job.created_at)
+        for job in finished[:len(self._jobs) - self.max_jobs + 1]:
+            del self._jobs[job.id]
@@ -0,0 +1,41 @@
+import asyncio
+from typing import Dict, List, Optional
+from .analyzer.base_analyzer import ContentAnalyzer
+from .llm.batch_llm import BatchLLM
+from .storage.storage import Storage
+from ..utils.exceptions import InternalError
+from ..utils.logger import logger
+
+class BulkService:
+    """Service for re-analyzing stored papers offline, through the provider's batch api.
+
+    Every paper is analyzed concurrently by an analyzer using a BatchLLM, so the calls of all papers
+    are collected into one batch per round of prompts. Papers must already be downloaded.
+    """
+
+    def __init__(self, storage: Storage, analyzer: ContentAnalyzer, llm: BatchLLM):
+        self.storage = storage
+        self.analyzer = analyzer
+        self.llm = llm
+
+    async def run(self, paper_ids: List[str]) -> Dict[str, Optional[Exception]]:
+        """
+        Analyze papers and store their summaries and tables.
+
+        Returns:
+            The error of each paper that failed, None for the papers analyzed in full
+        """
+        logger.info("Bulk analyzing %d papers", len(paper_ids))
+        results = await asyncio.gather(*(self._analyze(paper_id) for paper_id in paper_ids), return_exceptions=True)
+        return dict(zip(paper_ids, results))
+
+    async def _analyze(self, paper_id: str) -> None:
+        with self.llm.caller(paper_id):
+            analysis = await self.analyzer.analyze_paper(paper_id)
+        # Store what succeeded, a part that failed is generated again on the next run
+        if analysis.summary is not None:
+            self.storage.store_summary(paper_id, analysis.summary)
+        if analysis.main_table is not None:
+            self.storage.store_table(paper_id, analysis.main_table)
+        if analysis.errors:
+            raise InternalError("; ".join(analysis.errors))
@@ -1,17 +1,32 @@
-from typing import Dict, Type
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Type, List, Optional
 from .downloader import PaperDownloader, PaperMetadata
 from ..identifier.identifier import Identifier
 from .downloader import PaperSource
+from .negative_cache import NegativeCache
 from ..storage.storage import Storage
-from ...utils.exceptions import InternalError
+from ...utils.exceptions import InternalError, PaperUnavailableError
+from ...utils.logger import logger
+from ...utils.metrics import metrics
 
 class DownloadManager:
-    """Manages the paper download process and coordinates between different downloaders."""
+    """Manages the paper download process and coordinates between different downloaders.
+
+    Metadata fetched ahead of a download is kept for at most max_prefetched papers, the least recently
+    fetched are dropped first since their download may never come.
+    """
     
-    def __init__(self, downloaders: Dict[PaperSource, Type[PaperDownloader]], storage: Storage, identifier: Identifier):
+    def __init__(self, downloaders: Dict[PaperSource, Type[PaperDownloader]], storage: Storage, identifier: Identifier,
+                 negative_cache: Optional[NegativeCache] = None, max_prefetched: int = 1000):
         self.storage = storage
         self.identifier = identifier
         self.downloaders = downloaders
+        # Papers known to be unavailable fail fast, without calls to the source
+        self.negative_cache = negative_cache
+        # Metadata fetched in bulk by prefetch, used once by the following download
+        self.max_prefetched = max_prefetched
+        self._prefetched: "OrderedDict[str, PaperMetadata]" = OrderedDict()
     
     def _get_appropriate_downloader(self, url: str, source: PaperSource) -> PaperDownloader:
         """Determine the appropriate downloader based on the URL."""
@@ -22,19 +37,109 @@ class DownloadManager:
         
         raise InternalError(f"No downloader found for URL: {url}")
     
-    def download(self, url: str) -> PaperMetadata:
+    async def get_metadata(self, url: str) -> PaperMetadata:
+        """Fetch the metadata of a paper ahead of its download, which then reuses it."""
+        paper_identifier = self.identifier.from_url(url)
+        downloader = self._get_appropriate_downloader(url, paper_identifier.source)
+        self._raise_if_unavailable(paper_identifier.id)
+
+        metadata = self._prefetched.get(paper_identifier.id)
+        if metadata is None:
+            with metrics.timer("stage.metadata.seconds"):
+                metadata = await downloader.get_metadata(url)
+            self._remember_prefetched(paper_identifier.id, metadata)
+        return metadata
+
+    async def download(self, url: str) -> PaperMetadata:
         """Download and store a paper, returning its metadata."""
         paper_identifier = self.identifier.from_url(url)        
         downloader = self._get_appropriate_downloader(url, paper_identifier.source)
+        self._raise_if_unavailable(paper_identifier.id)
         
-        # Get paper metadata
-        metadata = downloader.get_metadata(url)
-        self.storage.store_metadata(paper_identifier.id, metadata)
+        # Get paper metadata, unless it was prefetched
+        metadata = self._prefetched.pop(paper_identifier.id, None)
+        if metadata is None:
+            with metrics.timer("stage.metadata.seconds"):
+                metadata = await downloader.get_metadata(url)
+        await asyncio.to_thread(self.storage.store_metadata, paper_identifier.id, metadata)
             
         # Download paper directly to storage
-        with self.storage.get_paper_writer(paper_identifier.id) as writer:                
-            downloader.download_to_writer(url, writer)
+        with metrics.timer("stage.download.seconds"):
+            writer = await asyncio.to_thread(self.storage.get_paper_writer, paper_identifier.id)
+            try:
+                await downloader.download_to_writer(url, writer)
+            except BaseException as e:
+                writer.abort()
+                if isinstance(e, PaperUnavailableError):
+                    self._remember_unavailable(paper_identifier.id, e)
+                raise
+            # Validating the pdf parses it, keep it off the event loop
+            await asyncio.to_thread(writer.commit)
                 
         return metadata                
-    
-        
\ No newline at end of file
+
+    def purge_unavailable(self, paper_id: Optional[str] = None) -> int:
+        """Forget that a paper, or every paper if no id is given, is unavailable. Returns the number of purged papers."""
+        if self.negative_cache is None:
+            return 0
+        return self.negative_cache.purge(paper_id)
+
+    def _raise_if_unavailable(self, paper_id: str) -> None:
+        """Raise the cached error if the paper is known to be unavailable."""
+        if self.negative_cache is None:
+            return
+        error = self.negative_cache.get(paper_id)
+        if error is not None:
+            logger.info("Paper %s is known to be unavailable: %s", paper_id, error.reason)
+            raise error
+
+    def _remember_prefetched(self, paper_id: str, metadata: PaperMetadata) -> None:
+        self._prefetched[paper_id] = metadata
+        self._prefetched.move_to_end(paper_id)
+        while len(self._prefetched) > self.max_prefetched:
+            self._prefetched.popitem(last=False)
+
+    def _remember_unavailable(self, paper_id: str, error: PaperUnavailableError) -> None:
+        if self.negative_cache is not None:
+            self.negative_cache.add(paper_id, error)
+
+    async def prefetch(self, urls: List[str]) -> Dict[str, Optional[Exception]]:
+        """Fetch metadata and resolve download locations of many papers in bulk.
+        
+        Downloaders batch these lookups, so a later download of each paper only needs to fetch the pdf.
+
+        Returns:
+            The error for each URL that can't be downloaded, None otherwise
+        """
+        results: Dict[str, Optional[Exception]] = {}
+        downloaders: Dict[int, PaperDownloader] = {}
+        urls_by_downloader: Dict[int, List[str]] = {}
+        for url in urls:
+            try:
+                paper_identifier = self.identifier.from_url(url)
+                downloader = self._get_appropriate_downloader(url, paper_identifier.source)
+                self._raise_if_unavailable(paper_identifier.id)
+                downloaders[id(downloader)] = downloader
+                urls_by_downloader.setdefault(id(downloader), []).append(url)
+            except Exception as e:
+                results[url] = e
+
+        for key, source_urls in urls_by_downloader.items():
+            downloader = downloaders[key]
+            metadata_results = await downloader.get_metadata_many(source_urls)
+
+            found = [url for url in source_urls if not isinstance(metadata_results[url], Exception)]
+            resolve_results = await downloader.resolve_many(found)
+
+            for url in source_urls:
+                error = metadata_results[url] if isinstance(metadata_results[url], Exception) else resolve_results[url]
+                results[url] = error
+                paper_id = self.identifier.from_url(url).id
+                if error is None:
+                    self._remember_prefetched(paper_id, metadata_results[url])
+                elif isinstance(error, PaperUnavailableError):
+                    self._remember_unavailable(paper_id, error)
+
+        failed = sum(error is not None for error in results.values())
+        logger.info("Prefetched %d papers, %d can't be downloaded", len(urls) - failed, failed)
+        return results
@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import BinaryIO
+from typing import BinaryIO, Dict, List, Optional, Union
 from ..models.paper import PaperMetadata
 
 class PaperSource(Enum):
@@ -11,7 +11,7 @@ class PaperDownloader(ABC):
     """Base class for paper downloaders."""
 
     @abstractmethod
-    def download_to_writer(self, url: str, writer: BinaryIO) -> None:
+    async def download_to_writer(self, url: str, writer: BinaryIO) -> None:
         """Download a paper directly to a writer.
         
         Args:
@@ -24,9 +24,29 @@ class PaperDownloader(ABC):
         pass
 
     @abstractmethod
-    def get_metadata(self, url: str) -> PaperMetadata:
+    async def get_metadata(self, url: str) -> PaperMetadata:
         """Retrieve metadata for a paper.        
         """
         pass
 
+    async def get_metadata_many(self, urls: List[str]) -> Dict[str, Union[PaperMetadata, Exception]]:
+        """Retrieve metadata for many papers. Downloaders with a bulk API should override this.
+        
+        Returns:
+            The metadata, or the error raised while retrieving it, keyed by URL
+        """
+        results: Dict[str, Union[PaperMetadata, Exception]] = {}
+        for url in urls:
+            try:
+                results[url] = await self.get_metadata(url)
+            except Exception as e:
+                results[url] = e
+        return results
 
+    async def resolve_many(self, urls: List[str]) -> Dict[str, Optional[Exception]]:
+        """Resolve where many papers can be downloaded from, ahead of download_to_writer.
+        
+        Returns:
+            The error for each URL that can't be downloaded, None otherwise
+        """
+        return {url: None for url in urls}
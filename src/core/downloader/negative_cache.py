@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Optional
+from ...utils.exceptions import PaperUnavailableError
+from ...utils.logger import logger
+
+@dataclass
+class NegativeCacheEntry:
+    """A paper known to be unavailable, until expires_at (unix time)."""
+    reason: str
+    message: str
+    status_code: int
+    expires_at: float
+
+    def to_error(self) -> PaperUnavailableError:
+        return PaperUnavailableError(self.message, reason=self.reason, status_code=self.status_code)
+
+class NegativeCache:
+    """Persistent cache of papers whose full text is known to be unavailable, keyed by paper id.
+    
+    Lets repeated requests for such papers fail without spending rate limited calls on the source.
+    Entries expire after ttl_seconds, as papers may become freely available later (e.g. after an embargo).
+    """
+
+    def __init__(self, path: Path, ttl_seconds: float = 7 * 24 * 60 * 60):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: Dict[str, NegativeCacheEntry] = self._load()
+
+    def get(self, paper_id: str) -> Optional[PaperUnavailableError]:
+        """Get the cached error for a paper, if it is known to be unavailable."""
+        with self._lock:
+            entry = self._entries.get(paper_id)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                del self._entries[paper_id]
+                self._save()
+                return None
+        return entry.to_error()
+
+    def add(self, paper_id: str, error: PaperUnavailableError) -> None:
+        """Remember that a paper is unavailable."""
+        with self._lock:
+            self._entries[paper_id] = NegativeCacheEntry(
+                reason=error.reason,
+                message=error.message,
+                status_code=error.status_code,
+                expires_at=time.time() + self.ttl_seconds
+            )
+            self._save()
+        logger.info("Paper %s cached as unavailable: %s", paper_id, error.reason)
+
+    def purge(self, paper_id: Optional[str] = None) -> int:
+        """Forget a paper, or every paper if no id is given. Returns the number of removed entries."""
+        with self._lock:
+            if paper_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                removed = 1 if self._entries.pop(paper_id, None) else 0
+            self._save()
+        logger.info("Purged %d papers from the negative cache", removed)
+        return removed
+
+    def _load(self) -> Dict[str, NegativeCacheEntry]:
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            now = time.time()
+            entries = {paper_id: NegativeCacheEntry(**entry) for paper_id, entry in data.items()}
+            return {paper_id: entry for paper_id, entry in entries.items() if entry.expires_at > now}
+        except (IOError, json.JSONDecodeError, TypeError) as e:
+            logger.error(f"Failed to load negative cache, starting empty: {e}")
+            return {}
+
+    def _save(self) -> None:
+        """Atomically persist all entries. Caller must hold the lock."""
+        temp_path = self.path.with_name(f"{self.path.name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({paper_id: asdict(entry) for paper_id, entry in self._entries.items()}, f, indent=2)
+            os.replace(temp_path, self.path)
+        except IOError as e:
+            # The cache is an optimization, keep serving from memory
+            temp_path.unlink(missing_ok=True)
+            logger.error(f"Failed to save negative cache: {e}")
@@ -1,27 +1,96 @@
+import asyncio
+import io
 import re
-import requests
-from typing import Optional, BinaryIO
+import threading
+import time
+import httpx
+from dataclasses import dataclass
+from typing import Optional, BinaryIO, Dict, List, Union, Tuple
 from Bio import Entrez
 
 from ..models.paper import PaperMetadata
 from .downloader import PaperDownloader
-from ...utils.exceptions import UserFacingError, InternalError
+from ...utils.exceptions import UserFacingError, InternalError, PaperUnavailableError
+from ...utils.rate_limiter import TokenBucketRateLimiter
+from ...utils.metrics import metrics
 from ...utils.logger import logger
 
+# NCBI allows 3 requests per second without an API key and 10 with one
+NCBI_REQUESTS_PER_SECOND = 3
+NCBI_REQUESTS_PER_SECOND_WITH_API_KEY = 10
+
+_ncbi_rate_limiters: Dict[float, TokenBucketRateLimiter] = {}
+_ncbi_rate_limiters_lock = threading.Lock()
+
+def ncbi_rate_limiter(requests_per_second: float) -> TokenBucketRateLimiter:
+    """Get the process-wide rate limiter for NCBI, shared by every downloader using the same rate."""
+    with _ncbi_rate_limiters_lock:
+        if requests_per_second not in _ncbi_rate_limiters:
+            _ncbi_rate_limiters[requests_per_second] = TokenBucketRateLimiter("ncbi", requests_per_second)
+        return _ncbi_rate_limiters[requests_per_second]
+
+@dataclass
+class PubMedDownloaderConfig:
+    """Configuration for PubMed downloader"""
+    email: str
+    api_key: Optional[str] = None
+    # Defaults to the NCBI limit, depending on whether an api key is set
+    requests_per_second: Optional[float] = None
+    # Number of PMIDs sent per efetch/elink call by the bulk methods
+    batch_size: int = 200
+    # Pooled keep-alive connections to PMC, shared by concurrent downloads
+    pool_size: int = 10
+    chunk_size: int = 64 * 1024
+    timeout: float = 30
+    # Interrupted pdf downloads are resumed with Range requests this many times
+    max_resume_attempts: int = 3
+    # E-utilities calls failing with a server error, 429 or a network error are retried this many times,
+    # after a backoff in seconds doubling on each retry
+    max_eutils_retries: int = 2
+    eutils_retry_backoff: float = 1.0
+    eutils_base_url: str = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+    pmc_base_url: str = "https://www.ncbi.nlm.nih.gov/pmc/articles"
+
+    @property
+    def rate_limit(self) -> float:
+        """Allowed requests per second to NCBI."""
+        if self.requests_per_second:
+            return self.requests_per_second
+        return NCBI_REQUESTS_PER_SECOND_WITH_API_KEY if self.api_key else NCBI_REQUESTS_PER_SECOND
+
 
 class PubMedDownloader(PaperDownloader):
-    """PubMed-specific implementation of the PaperDownloader interface."""
+    """PubMed-specific implementation of the PaperDownloader interface.
+    
+    Every E-utilities call and PMC PDF fetch goes through a process-wide token bucket, so concurrent
+    requests queue up at the NCBI rate limit instead of being throttled.
+    """
     
-    def __init__(self, email: str):
+    def __init__(self, config: PubMedDownloaderConfig):
         """Initialize the PubMed downloader.
         
         Args:
-            email: Email address for NCBI's E-utilities (required by their API)
+            config: Email address (required by NCBI's E-utilities), optional api key and rate limit
         """
-        Entrez.email = email
+        self.config = config
+        self.rate_limiter = ncbi_rate_limiter(config.rate_limit)
+        # PMC IDs resolved so far, keyed by PMID
+        self._pmcids: Dict[str, str] = {}
+
+        self.client = httpx.AsyncClient(
+            headers={'User-Agent': 'Mozilla/5.0'},
+            limits=httpx.Limits(max_connections=config.pool_size, max_keepalive_connections=config.pool_size),
+            timeout=config.timeout,
+            follow_redirects=True
+        )
         
-    def download_to_writer(self, pubmed_url: str, writer: BinaryIO) -> None:
+    async def close(self) -> None:
+        """Close the pooled connections."""
+        await self.client.aclose()
+
+    async def download_to_writer(self, pubmed_url: str, writer: BinaryIO) -> None:
         """Download paper from PubMed directly to a file. The idea is to not keep the entire PDF in memory 
+        The pdf is fetched over a pooled keep-alive session, interrupted transfers resume where they stopped.
         
         Args:
             identifier: Pubmed URL
@@ -39,70 +108,241 @@ class PubMedDownloader(PaperDownloader):
                 status_code=400,
             )
         
-        pmcid = self._get_pmcid(pmid) 
-        try:                         
-            pdf_url = f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{pmcid}/pdf/"
-            response = requests.get(
-                    pdf_url, 
-                    headers={'User-Agent': 'Mozilla/5.0'}, 
-                    stream=True
-                )
-                
-            if response.status_code == 200 and 'application/pdf' in response.headers.get('Content-Type', ''):
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:  # filter out keep-alive new chunks
-                        writer.write(chunk)
-                return
-            
-            # If we get here, either status code wasn't 200 or content type wasn't PDF
-            raise UserFacingError(
-                message="This article is not accessible or does not exist",
-                status_code=response.status_code
-            )
-                    
-        except requests.RequestException as e:
-            # Catch all requests exceptions and convert to appropriate error
-            if isinstance(e, requests.HTTPError) and e.response.status_code in (403, 404):
-                logger.error(f"Article not accessible: {e}")
-                raise UserFacingError(
-                    message="This article is not accessible or does not exist",
-                    status_code=e.response.status_code
-                ) from e
-                
+        pmcid = await self._get_pmcid(pmid) 
+        pdf_url = f"{self.config.pmc_base_url}/PMC{pmcid}/pdf/"
+        try:
+            await self._download_pdf(pdf_url, writer)
+        except httpx.HTTPError as e:
+            # Catch all http exceptions and convert to appropriate error
             logger.error(f"Error downloading from PMC: {e}")
             raise InternalError("Failed to download PDF due to network error") from e
 
-    def get_metadata(self, url: str) -> PaperMetadata:
+    async def _download_pdf(self, pdf_url: str, writer: BinaryIO) -> None:
+        """Stream a pdf to the writer, resuming with a Range request if the connection drops midway.
+        
+        Raises:
+            PaperUnavailableError: If the pdf doesn't exist or the response is not a pdf
+            UserFacingError: If the pdf can't be downloaded now, e.g. access is denied
+            InternalError: If the server keeps answering with a range other than the one requested
+            httpx.HTTPError: If the download still fails after max_resume_attempts
+        """
+        written = 0
+        attempts = 0
+        started_at = time.monotonic()
+        while True:
+            headers = {'Range': f'bytes={written}-'} if written else {}
+            try:
+                await self.rate_limiter.acquire()
+                async with self.client.stream("GET", pdf_url, headers=headers) as response:
+                    if written and response.status_code == 416:
+                        # Nothing left to fetch, the connection dropped right after the last byte
+                        break
+                    is_pdf = 'application/pdf' in response.headers.get('Content-Type', '')
+                    if response.status_code in (404, 410) or (response.status_code == 200 and not is_pdf):
+                        # A definite answer, the pdf is not available to us. A 403 is not, PMC also answers
+                        # it to block a client for a while, so it is raised below without being remembered
+                        raise PaperUnavailableError(
+                            message="This article is not accessible or does not exist",
+                            reason=PaperUnavailableError.NOT_ACCESSIBLE,
+                            status_code=response.status_code
+                        )
+                    if response.status_code not in (200, 206) or not is_pdf:
+                        # Either status code wasn't 200 or content type wasn't PDF
+                        raise UserFacingError(
+                            message="This article is not accessible or does not exist",
+                            status_code=response.status_code
+                        )
+                    if written and response.status_code == 200:
+                        # The server ignored the Range header and sent the whole file again
+                        writer.seek(0)
+                        writer.truncate()
+                        written = 0
+                    elif response.status_code == 206 and self._content_range_start(response) != written:
+                        # Appending a range starting elsewhere would corrupt the pdf, start over
+                        attempts += 1
+                        if attempts > self.config.max_resume_attempts:
+                            raise InternalError("Failed to download PDF, the server sent an unexpected range")
+                        logger.warning(f"Download of {pdf_url} resumed at an unexpected range "
+                                       f"{response.headers.get('Content-Range')!r}, restarting")
+                        writer.seek(0)
+                        writer.truncate()
+                        written = 0
+                        continue
+
+                    async for chunk in response.aiter_bytes(chunk_size=self.config.chunk_size):
+                        writer.write(chunk)
+                        written += len(chunk)
+                break
+            except httpx.TransportError as e:
+                attempts += 1
+                if attempts > self.config.max_resume_attempts:
+                    raise
+                logger.warning(f"Download of {pdf_url} interrupted at byte {written}, resuming (attempt {attempts}): {e}")
+                metrics.increment("pmc.download.resumes")
+
+        elapsed = time.monotonic() - started_at
+        metrics.observe("pmc.download.bytes", written)
+        metrics.observe("pmc.download.bytes_per_second", written / elapsed if elapsed else 0)
+        logger.info(f"Downloaded {pdf_url}: {written} bytes in {elapsed:.2f}s")
+
+    @staticmethod
+    def _content_range_start(response: httpx.Response) -> Optional[int]:
+        """First byte of a partial response, from a Content-Range header like "bytes 1000-1999/2000"."""
+        match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+
+    async def get_metadata(self, url: str) -> PaperMetadata:
         """Get paper metadata from PubMed."""
         identifier = self._extract_pmid(url)
 
         try:
-            handle = Entrez.efetch(db="pubmed", id=identifier, rettype="xml")
-            records = Entrez.read(handle)
-            handle.close()
+            records = await self._eutils("efetch", [("db", "pubmed"), ("id", identifier), ("rettype", "xml")])
 
-            article = records['PubmedArticle'][0]['MedlineCitation']['Article']
-            
-            # Extract abstract text properly
-            abstract = ''
-            if 'Abstract' in article and 'AbstractText' in article['Abstract']:
-                abstract_text = article['Abstract']['AbstractText']
-                if isinstance(abstract_text, list):
-                    abstract = ' '.join(str(text) for text in abstract_text)
-                else:
-                    abstract = str(abstract_text)
-
-            metadata = PaperMetadata(
-                id=identifier,
-                title=article.get('ArticleTitle', ''),
-                abstract=abstract,                
-                url=url
-            )
-            
-            return metadata
+            return self._parse_metadata(records['PubmedArticle'][0], url)
         except Exception as e:
             logger.error(f"Error fetching metadata: {e}")
             raise InternalError(f"Error fetching metadata: {e}") from e
+
+    async def get_metadata_many(self, urls: List[str]) -> Dict[str, Union[PaperMetadata, Exception]]:
+        """Get metadata for many papers, fetching up to batch_size PMIDs per efetch call.
+        
+        Args:
+            urls: PubMed URLs or PMIDs
+            
+        Returns:
+            The metadata, or the error raised while fetching it, keyed by the given URL
+        """
+        results: Dict[str, Union[PaperMetadata, Exception]] = {}
+        urls_by_pmid = self._group_by_pmid(urls, results)
+
+        for chunk in self._chunks(list(urls_by_pmid)):
+            try:
+                records = await self._eutils("efetch", [("db", "pubmed"), ("id", ",".join(chunk)), ("rettype", "xml")])
+
+                for record in records['PubmedArticle']:
+                    pmid = str(record['MedlineCitation']['PMID'])
+                    for url in urls_by_pmid.get(pmid, []):
+                        results[url] = self._parse_metadata(record, url)
+            except Exception as e:
+                logger.error(f"Error fetching metadata for PMIDs: {chunk}. Error: {e}")
+                for pmid in chunk:
+                    for url in urls_by_pmid[pmid]:
+                        results[url] = InternalError(f"Error fetching metadata: {e}")
+
+        for pmid, pmid_urls in urls_by_pmid.items():
+            for url in pmid_urls:
+                if url not in results:
+                    results[url] = UserFacingError(f"No PubMed article found for PMID: {pmid}", status_code=404)
+        return results
+
+    async def resolve_many(self, urls: List[str]) -> Dict[str, Optional[Exception]]:
+        """Resolve the PMC IDs of many papers, see resolve_pmcids."""
+        results: Dict[str, Optional[Exception]] = {}
+        urls_by_pmid = self._group_by_pmid(urls, results)
+
+        for pmid, result in (await self.resolve_pmcids(list(urls_by_pmid))).items():
+            for url in urls_by_pmid[pmid]:
+                results[url] = result if isinstance(result, Exception) else None
+        return results
+
+    async def resolve_pmcids(self, pmids: List[str]) -> Dict[str, Union[str, Exception]]:
+        """Get the PMC IDs for many PubMed IDs, linking up to batch_size PMIDs per elink call.
+        
+        Resolved PMC IDs are remembered, so downloading these papers later needs no further elink call.
+
+        Returns:
+            The PMC ID, or the error raised while resolving it, keyed by PMID
+        """
+        results: Dict[str, Union[str, Exception]] = {
+            pmid: self._pmcids[pmid] for pmid in pmids if pmid in self._pmcids
+        }
+        unresolved = [pmid for pmid in dict.fromkeys(pmids) if pmid not in results]
+
+        for chunk in self._chunks(unresolved):
+            try:
+                # One id parameter per PMID makes elink return one linkset per PMID instead of a merged one
+                linksets = await self._eutils("elink", [("dbfrom", "pubmed"), ("db", "pmc")] + [("id", pmid) for pmid in chunk])
+
+                for linkset in linksets:
+                    pmid = str(linkset['IdList'][0])
+                    pmcid = self._pmcid_from_linkset(linkset)
+                    if pmcid:
+                        self._pmcids[pmid] = pmcid
+                        results[pmid] = pmcid
+            except Exception as e:
+                logger.error(f"Error getting PMC IDs for PMIDs: {chunk}. Error: {e}")
+                for pmid in chunk:
+                    results[pmid] = InternalError(f"Error getting PMC ID for PMID: {pmid}. Error: {e}")
+
+        for pmid in unresolved:
+            if pmid not in results:
+                results[pmid] = self._no_pmcid_error(pmid)
+        return results
+
+    async def _eutils(self, endpoint: str, params: List[Tuple[str, str]]):
+        """Call an E-utilities endpoint and parse its XML response with Biopython's Entrez parser.
+        Transient failures are retried up to max_eutils_retries times, each attempt waiting for the rate limiter.
+        """
+        params = params + [("tool", "biopython"), ("email", self.config.email)]
+        if self.config.api_key:
+            params.append(("api_key", self.config.api_key))
+
+        for attempt in range(self.config.max_eutils_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                response = await self.client.get(f"{self.config.eutils_base_url}/{endpoint}.fcgi", params=params)
+                response.raise_for_status()
+                break
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                transient = (isinstance(e, httpx.TransportError)
+                             or e.response.status_code == 429 or e.response.status_code >= 500)
+                if not transient or attempt == self.config.max_eutils_retries:
+                    raise
+                backoff = self.config.eutils_retry_backoff * 2 ** attempt
+                logger.warning(f"E-utilities {endpoint} call failed, retrying in {backoff:.1f}s: {e}")
+                metrics.increment("eutils.retries")
+                await asyncio.sleep(backoff)
+        # Large multi-record responses take a while to parse, keep it off the event loop
+        return await asyncio.to_thread(Entrez.read, io.BytesIO(response.content))
+
+    def _parse_metadata(self, record: dict, url: str) -> PaperMetadata:
+        """Build paper metadata from a PubmedArticle record."""
+        article = record['MedlineCitation']['Article']
+        
+        # Extract abstract text properly
+        abstract = ''
+        if 'Abstract' in article and 'AbstractText' in article['Abstract']:
+            abstract_text = article['Abstract']['AbstractText']
+            if isinstance(abstract_text, list):
+                abstract = ' '.join(str(text) for text in abstract_text)
+            else:
+                abstract = str(abstract_text)
+
+        return PaperMetadata(
+            id=str(record['MedlineCitation']['PMID']),
+            title=article.get('ArticleTitle', ''),
+            abstract=abstract,                
+            url=url
+        )
+
+    def _group_by_pmid(self, urls: List[str], errors: Dict[str, Exception]) -> Dict[str, List[str]]:
+        """Group URLs by their PMID, recording an error for each URL without a valid PMID."""
+        urls_by_pmid: Dict[str, List[str]] = {}
+        for url in urls:
+            pmid = self._extract_pmid(url)
+            if not pmid:
+                errors[url] = UserFacingError(
+                    message=f"The URL: {url} does not point to a valid PubMed article.",
+                    status_code=400,
+                )
+                continue
+            urls_by_pmid.setdefault(pmid, []).append(url)
+        return urls_by_pmid
+
+    def _chunks(self, ids: List[str]) -> List[List[str]]:
+        """Split ids into chunks of at most batch_size."""
+        size = self.config.batch_size
+        return [ids[i:i + size] for i in range(0, len(ids), size)]
         
     def _extract_pmid(self, identifier: str) -> Optional[str]:
         """Validate and extract PMID from a PubMed identifier."""
@@ -112,30 +352,24 @@ class PubMedDownloader(PaperDownloader):
             return match.group(1) if match else None
         return identifier if identifier.isdigit() else None
 
-    def _get_pmcid(self, pmid: str) -> Optional[str]:
+    async def _get_pmcid(self, pmid: str) -> Optional[str]:
         """Get PMC ID from PubMed ID.
         
         Raises:
             UserFacingError: If the PMC ID is not found
         """
+        if pmid in self._pmcids:
+            return self._pmcids[pmid]
+
         try:
-            handle = Entrez.elink(dbfrom="pubmed", id=pmid, db="pmc")
-            result = Entrez.read(handle)
-            handle.close()
-
-            linkset = result[0]
-            if linkset.get('LinkSetDb'):
-                for linksetdb in linkset['LinkSetDb']:
-                    if linksetdb['DbTo'] == 'pmc':
-                        pmcid = linksetdb['Link'][0]['Id']
-                        if pmcid:
-                            return pmcid
+            result = await self._eutils("elink", [("dbfrom", "pubmed"), ("db", "pmc"), ("id", pmid)])
+
+            pmcid = self._pmcid_from_linkset(result[0])
+            if pmcid:
+                self._pmcids[pmid] = pmcid
+                return pmcid
             
-            logger.error(f"No PMC ID found for PMID: {pmid}")
-            raise UserFacingError(
-                message=f"No PMC ID found for PMID: {pmid}. Possible reason: Free access to the paper is not available.",
-                status_code=500,
-            )
+            raise self._no_pmcid_error(pmid)
         
         except UserFacingError as e:
             raise e
@@ -144,3 +378,22 @@ class PubMedDownloader(PaperDownloader):
             raise InternalError(
                 f"Error getting PMC ID for PMID: {pmid}. Error: {e}"
             )
+
+    def _pmcid_from_linkset(self, linkset: dict) -> Optional[str]:
+        """Get the PMC ID from an elink linkset, if the paper is in PubMed Central."""
+        if linkset.get('LinkSetDb'):
+            for linksetdb in linkset['LinkSetDb']:
+                if linksetdb['DbTo'] == 'pmc' and linksetdb['Link']:
+                    pmcid = linksetdb['Link'][0]['Id']
+                    if pmcid:
+                        return str(pmcid)
+        return None
+
+    def _no_pmcid_error(self, pmid: str) -> PaperUnavailableError:
+        """Error for a paper without a PMC ID, i.e. without free full text."""
+        logger.error(f"No PMC ID found for PMID: {pmid}")
+        return PaperUnavailableError(
+            message=f"No PMC ID found for PMID: {pmid}. Possible reason: Free access to the paper is not available.",
+            reason=PaperUnavailableError.NO_PMCID,
+            status_code=500,
+        )
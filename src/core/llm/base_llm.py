@@ -1,21 +1,57 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Type
+from typing import AsyncIterator, Dict, Optional, Type
 from pydantic import BaseModel
 
 class BaseLLM(ABC):
     """Base class for LLM implementations"""
         
     @abstractmethod
-    def chat(self, prompt: str, response_model: Type[BaseModel]) -> BaseModel:
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
         """
         Send a chat message and get response.
         
         Args:
             prompt: The message to send
+            response_model: Pydantic model class defining the response structure
+            context: Content sent ahead of the message, e.g. the paper. Calls sharing the same context
+                reuse it from the provider's prompt cache.
+        """
+        pass
+
+    @abstractmethod
+    def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Send a chat message and stream the text of the response as it is generated.
+        
+        Args:
+            prompt: The message to send
+            context: Content sent ahead of the message, as in chat
+        """
+        pass
+
+    def identity(self) -> Dict[str, object]:
+        """Settings that determine the responses besides the request, e.g. the model. Keys the cached responses."""
+        return {"provider": type(self).__name__}
+
+    @abstractmethod
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        """
+        Send a chat message together with an image and get a structured response.
+        
+        Args:
+            prompt: The message to send
+            image_data: The raw image bytes
+            mime_type: Mime type of the image, e.g. image/png
+            response_model: Pydantic model class defining the response structure
         """
         pass
 
     # hack for anthropic pdf support
-    def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str]) -> Dict[str, str]:
-        """Chat with PDF support"""
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str],
+                            started: Optional[asyncio.Event] = None) -> Dict[str, str]:
+        """Chat with PDF support.
+        started is set once the provider has read the pdf and begun answering, from then on other calls on
+        the same pdf read it from the provider's prompt cache."""
         pass
\ No newline at end of file
@@ -0,0 +1,198 @@
+import asyncio
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Set, Tuple, Type
+from pydantic import BaseModel
+from .base_llm import BaseLLM
+from ...utils.exceptions import InternalError
+from ...utils.logger import logger
+from ...utils.metrics import metrics
+
+@dataclass
+class BatchCall:
+    """An LLM call waiting for its batch. method is one of chat, text, image or pdf."""
+    method: str
+    prompt: str
+    context: Optional[str] = None
+    response_model: Optional[Type[BaseModel]] = None
+    image_data: Optional[bytes] = None
+    mime_type: Optional[str] = None
+    pdf_data: Optional[str] = None
+    json_structure: Optional[Dict[str, str]] = None
+
+class BatchBackend(ABC):
+    """Sends calls through the batch api of an LLM's provider, building the same requests as the LLM."""
+
+    def __init__(self, llm: BaseLLM):
+        self.llm = llm
+
+    @abstractmethod
+    def request(self, call: BatchCall) -> dict:
+        """The provider request of a call."""
+        pass
+
+    @abstractmethod
+    async def submit(self, requests: Dict[str, dict]) -> str:
+        """Submit requests by custom id as a batch, returning the batch id."""
+        pass
+
+    @abstractmethod
+    async def results(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Responses of an ended batch by custom id, an exception for a failed request. None while it is processing."""
+        pass
+
+    @abstractmethod
+    def parse(self, call: BatchCall, response: Any) -> Any:
+        """The result of a call from its response, as the LLM returns it."""
+        pass
+
+@dataclass
+class BatchLLMConfig:
+    """Configuration for batching LLM calls"""
+    # Seconds between checks whether a submitted batch ended
+    poll_seconds: float = 60
+    # Queued calls are submitted once every caller waits on one and no call came for settle_seconds,
+    # or once no call came for collect_seconds
+    settle_seconds: float = 1
+    collect_seconds: float = 30
+    # Calls submitted in a single batch
+    max_batch_size: int = 10000
+
+# The caller, e.g. the paper, making the calls in this context
+_caller: ContextVar[Optional[str]] = ContextVar("batch_caller", default=None)
+
+class BatchLLM(BaseLLM):
+    """Collects the calls of concurrent callers and sends them through the provider's batch api.
+
+    Batched calls cost less but take up to a day, for bulk work where latency doesn't matter.
+    Each call waits until its batch ended, so callers run unchanged in rounds: a caller
+    whose next call depends on a response makes it in the next batch.
+    """
+
+    def __init__(self, backend: BatchBackend, config: Optional[BatchLLMConfig] = None):
+        self.backend = backend
+        self.config = config or BatchLLMConfig()
+        self._queued: Dict[str, Tuple[BatchCall, asyncio.Future]] = {}
+        self._callers: Set[str] = set()
+        self._waiting: Counter = Counter()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Keep references to the polling tasks, so they are not garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    @contextmanager
+    def caller(self, name: str) -> Iterator[None]:
+        """Attribute the calls made in this context to a caller, so a batch is sent as soon as every caller waits."""
+        self._callers.add(name)
+        token = _caller.set(name)
+        try:
+            yield
+        finally:
+            _caller.reset(token)
+            self._callers.discard(name)
+            self._schedule()
+
+    def identity(self) -> Dict[str, object]:
+        return self.backend.llm.identity()
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        return await self._call(BatchCall("chat", prompt, context=context, response_model=response_model))
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """The whole response as a single delta, batches are not streamed."""
+        yield await self._call(BatchCall("text", prompt, context=context))
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        return await self._call(BatchCall("image", prompt, image_data=image_data, mime_type=mime_type,
+                                          response_model=response_model))
+
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str],
+                            started: Optional[asyncio.Event] = None) -> Dict[str, str]:
+        """Batched requests run in no particular order, nothing to wait for before sending the others."""
+        if started is not None:
+            started.set()
+        return await self._call(BatchCall("pdf", prompt, pdf_data=pdf_data, json_structure=json_structure))
+
+    async def _call(self, call: BatchCall) -> Any:
+        """Queue a call and wait for its batch."""
+        future = asyncio.get_running_loop().create_future()
+        self._queued[uuid.uuid4().hex] = (call, future)
+        caller = _caller.get()
+        self._waiting[caller] += 1
+        self._schedule()
+        try:
+            return await future
+        finally:
+            self._waiting[caller] -= 1
+
+    def _schedule(self) -> None:
+        """Submit the queued calls once the callers settled."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queued:
+            return
+        settled = self._callers and all(self._waiting[caller] > 0 for caller in self._callers)
+        delay = self.config.settle_seconds if settled else self.config.collect_seconds
+        self._timer = asyncio.get_running_loop().call_later(delay, self._flush)
+
+    def _flush(self) -> None:
+        self._timer = None
+        while self._queued:
+            ids = list(self._queued)[:self.config.max_batch_size]
+            calls = {custom_id: self._queued.pop(custom_id) for custom_id in ids}
+            task = asyncio.create_task(self._run_batch(calls))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, calls: Dict[str, Tuple[BatchCall, asyncio.Future]]) -> None:
+        """Submit calls as a batch, wait until it ended and resolve them with their responses."""
+        requests = {}
+        for custom_id, (call, future) in calls.items():
+            try:
+                requests[custom_id] = self.backend.request(call)
+            except Exception as e:
+                self._resolve(future, error=e)
+
+        try:
+            batch_id = await self.backend.submit(requests)
+            logger.info("Submitted batch %s with %d requests", batch_id, len(requests))
+            metrics.increment("llm.batch.batches")
+            metrics.increment("llm.batch.requests", len(requests))
+            while (results := await self.backend.results(batch_id)) is None:
+                await asyncio.sleep(self.config.poll_seconds)
+        except Exception as e:
+            logger.error("Batch of %d requests failed: %s", len(requests), e)
+            for custom_id in requests:
+                self._resolve(calls[custom_id][1], error=e)
+            return
+
+        failed = 0
+        for custom_id in requests:
+            call, future = calls[custom_id]
+            response = results.get(custom_id, InternalError(f"No result for batch request {custom_id}"))
+            if isinstance(response, Exception):
+                failed += 1
+                self._resolve(future, error=response)
+                continue
+            try:
+                self._resolve(future, result=self.backend.parse(call, response))
+            except Exception as e:
+                failed += 1
+                self._resolve(future, error=e)
+        logger.info("Batch %s ended, %d of %d requests failed", batch_id, failed, len(requests))
+        metrics.increment("llm.batch.failed_requests", failed)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+        # The caller may have been cancelled while waiting
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Iterator, Optional, Type
+from pydantic import BaseModel
+from .base_llm import BaseLLM
+from .response_cache import ResponseCache
+from ...utils.logger import logger
+from ...utils.metrics import metrics
+
+# Set for the requests that skip the cached responses, their responses are still cached
+_bypass = ContextVar("llm_cache_bypass", default=False)
+
+@contextmanager
+def bypass_cache() -> Iterator[None]:
+    """Send the LLM calls made in this context to the provider, refreshing their cached responses."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+class CachingLLM(BaseLLM):
+    """Serves repeated LLM calls from a persistent response cache.
+
+    Responses are keyed by the identity of the wrapped LLM (provider, model, temperature),
+    a hash of the prompt, context and image or pdf, and the response schema.
+    Only complete, parsed responses are cached, a failed call is sent again.
+    """
+
+    def __init__(self, llm: BaseLLM, cache: ResponseCache):
+        self.llm = llm
+        self.cache = cache
+
+    def identity(self) -> Dict[str, object]:
+        return self.llm.identity()
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        key = self._key("chat", prompt=prompt, context=context, schema=response_model.model_json_schema())
+        cached = await self._get(key)
+        if cached is not None:
+            return response_model.model_validate_json(cached)
+
+        response = await self.llm.chat(prompt, response_model, context=context)
+        await self._put(key, response.model_dump_json())
+        return response
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream the response, a cached response is sent as a single delta."""
+        key = self._key("stream", prompt=prompt, context=context)
+        cached = await self._get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        text = ""
+        async for delta in self.llm.stream(prompt, context=context):
+            text += delta
+            yield delta
+        await self._put(key, text)
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        key = self._key("chat_with_image", prompt=prompt, image=hashlib.sha256(image_data).hexdigest(),
+                        mime_type=mime_type, schema=response_model.model_json_schema())
+        cached = await self._get(key)
+        if cached is not None:
+            return response_model.model_validate_json(cached)
+
+        response = await self.llm.chat_with_image(prompt, image_data, mime_type, response_model)
+        await self._put(key, response.model_dump_json())
+        return response
+
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str],
+                            started: Optional[asyncio.Event] = None) -> Dict[str, str]:
+        key = self._key("chat_with_pdf", prompt=prompt, pdf=hashlib.sha256(pdf_data.encode()).hexdigest(),
+                        schema=json_structure)
+        cached = await self._get(key)
+        if cached is not None:
+            if started is not None:
+                started.set()
+            return json.loads(cached)
+
+        response = await self.llm.chat_with_pdf(prompt, pdf_data, json_structure, started)
+        await self._put(key, json.dumps(response))
+        return response
+
+    def _key(self, method: str, **request) -> str:
+        """Hash of everything that determines the response."""
+        data = json.dumps({"llm": self.llm.identity(), "method": method, **request}, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    async def _get(self, key: str) -> Optional[str]:
+        if _bypass.get():
+            metrics.increment("llm.cache.bypassed")
+            return None
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is None:
+            metrics.increment("llm.cache.misses")
+            return None
+        logger.info("LLM response cache hit: %s", key)
+        metrics.increment("llm.cache.hits")
+        return cached
+
+    async def _put(self, key: str, value: str) -> None:
+        await asyncio.to_thread(self.cache.put, key, value)
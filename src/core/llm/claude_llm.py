@@ -1,9 +1,36 @@
+import asyncio
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional, Type,Dict
-from langchain_anthropic import ChatAnthropic
+from typing import Any, AsyncIterator, Iterator, Optional, Type, Dict
 import anthropic
 from pydantic import BaseModel
+from .base_llm import BaseLLM
+from .batch_llm import BatchBackend, BatchCall
+import base64
 import json
+from ...utils.logger import logger
+from ...utils.exceptions import InternalError, LLMRateLimitError, LLMUnavailableError
+from .llm_scheduler import parse_retry_after
+from .llm_usage import record_usage
+
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+PDFS_BETA = "pdfs-2024-09-25"
+
+@contextmanager
+def _provider_errors() -> Iterator[None]:
+    """Raise rate limit and overloaded errors as LLMRateLimitError, with the wait the provider asked for,
+    and server and connection errors as LLMUnavailableError, both retried by the scheduler."""
+    try:
+        yield
+    except anthropic.APIStatusError as e:
+        if e.status_code in (429, 529):
+            raise LLMRateLimitError("The LLM provider is busy, please try again later",
+                                    retry_after=parse_retry_after(e.response.headers)) from e
+        if e.status_code >= 500:
+            raise LLMUnavailableError("The LLM provider is unavailable, please try again later") from e
+        raise
+    except anthropic.APIConnectionError as e:
+        raise LLMUnavailableError("The LLM provider is unavailable, please try again later") from e
 
 @dataclass
 class ClaudeLLMConfig:
@@ -13,57 +40,183 @@ class ClaudeLLMConfig:
     model: str = "claude-3-5-sonnet-latest" 
     max_tokens: Optional[int] = 2048
     max_retries: int = 2
+    # Another api endpoint, e.g. a local stand-in
+    base_url: Optional[str] = None
 
-class ClaudeLLM:
-    """Claude LLM implementation using LangChain"""
+class ClaudeLLM(BaseLLM):
+    """Claude LLM implementation using the anthropic client"""
     
     def __init__(self, config: ClaudeLLMConfig):
         self.config = config
-        self.model = ChatAnthropic(
-            api_key=config.api_key,
-            model=config.model,
-            temperature=config.temperature,
-            max_tokens=config.max_tokens,
-            max_retries=config.max_retries, 
-        )        
-
-        # for pdfs
-        self.client = anthropic.Anthropic(api_key=config.api_key)
+        self.client = anthropic.AsyncAnthropic(api_key=config.api_key, max_retries=config.max_retries,
+                                             base_url=config.base_url)
 
-    def chat(self, prompt: str, response_model: Type[BaseModel]) -> BaseModel:
-        """Regular chat with structured output"""
-        structured_llm = self.model.with_structured_output(response_model)
-        return structured_llm.invoke(prompt)
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        """Regular chat with structured output.
+        The context goes in the system prompt marked for prompt caching. The output is requested as json
+        in the message instead of through a tool, since tool definitions are part of the cached prefix.
+        """
+        with _provider_errors():
+            message = await self.client.beta.messages.create(
+                betas=[PROMPT_CACHING_BETA],
+                **self._chat_params(prompt, response_model, context)
+            )
+        return self._parse_chat(message, response_model)
 
-    def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str]) -> Dict[str, str]:
-        """Chat with PDF support"""
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """Chat streaming the text of the response"""
+        with _provider_errors():
+            events = await self.client.beta.messages.create(
+                betas=[PROMPT_CACHING_BETA],
+                stream=True,
+                **self._text_params(prompt, context)
+            )
+        usage = None
+        async for event in events:
+            if event.type == "message_start":
+                usage = event.message.usage
+            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                yield event.delta.text
+            elif event.type == "message_delta" and usage is not None:
+                usage.output_tokens = event.usage.output_tokens
+        if usage is not None:
+            self._log_usage(usage)
 
+    def _chat_params(self, prompt: str, response_model: Type[BaseModel], context: Optional[str]) -> dict:
         structured_prompt = f"""
         {prompt}
 
-        Provide your response in JSON format matching exactly this structure:
-        {json.dumps(json_structure, indent=2)}
+        Provide your response as a JSON object matching this JSON schema:
+        {json.dumps(response_model.model_json_schema(), indent=2)}
 
-        Your response must be valid JSON that can be parsed. Include only the JSON output.        
+        Your response must be valid JSON that can be parsed. Include only the JSON output.
         """
+        params = self._text_params(structured_prompt, context)
+        # Prefill the response so it starts with the json object
+        params["messages"].append({"role": "assistant", "content": "{"})
+        return params
+
+    def _text_params(self, prompt: str, context: Optional[str]) -> dict:
+        params = {
+            "model": self.config.model,
+            "max_tokens": self.config.max_tokens,
+            "temperature": self.config.temperature,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if context is not None:
+            params["system"] = [{"type": "text", "text": context, "cache_control": {"type": "ephemeral"}}]
+        return params
+
+    def _parse_chat(self, message, response_model: Type[BaseModel]) -> BaseModel:
+        self._log_usage(message.usage)
+        return response_model.model_validate_json("{" + message.content[0].text)
+
+    def _parse_text(self, message) -> str:
+        self._log_usage(message.usage)
+        return "".join(block.text for block in message.content if block.type == "text")
+
+    def identity(self) -> Dict[str, object]:
+        return {
+            "provider": "anthropic",
+            "model": self.config.model,
+            "temperature": self.config.temperature,
+            "max_tokens": self.config.max_tokens
+        }
 
-        message = self.client.beta.messages.create(
-            model=self.config.model,
-            betas=["pdfs-2024-09-25"],
-            max_tokens=self.config.max_tokens,
-            temperature=self.config.temperature,
-            messages=[
+    @staticmethod
+    def _log_usage(usage) -> None:
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        logger.info("Claude usage: %d input tokens, %d read from cache, %d written to cache, %d output tokens",
+                    usage.input_tokens, cache_read, cache_write, usage.output_tokens)
+        record_usage(usage.input_tokens + cache_read + cache_write, cache_read, usage.output_tokens)
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        """Chat with an image, the structured output is returned through a forced tool call"""
+        with _provider_errors():
+            message = await self.client.messages.create(**self._image_params(prompt, image_data, mime_type, response_model))
+        return self._parse_tool(message, response_model)
+
+    def _image_params(self, prompt: str, image_data: bytes, mime_type: str, response_model: Type[BaseModel]) -> dict:
+        return {
+            "model": self.config.model,
+            "max_tokens": self.config.max_tokens,
+            "temperature": self.config.temperature,
+            "tools": [{
+                "name": response_model.__name__,
+                "description": "Return the response in this structure.",
+                "input_schema": response_model.model_json_schema()
+            }],
+            "tool_choice": {"type": "tool", "name": response_model.__name__},
+            "messages": [
                 {
                     "role": "user",
                     "content": [
                         {
-                            "type": "document",
+                            "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "application/pdf",
-                                "data": pdf_data
+                                "media_type": mime_type,
+                                "data": base64.standard_b64encode(image_data).decode("ascii")
                             }
                         },
+                        {
+                            "type": "text",
+                            "text": prompt
+                        }
+                    ]
+                }
+            ]
+        }
+
+    def _parse_tool(self, message, response_model: Type[BaseModel]) -> BaseModel:
+        self._log_usage(message.usage)
+        tool_use = next(block for block in message.content if block.type == "tool_use")
+        return response_model.model_validate(tool_use.input)
+
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str],
+                            started: Optional[asyncio.Event] = None) -> Dict[str, str]:
+        """Chat with PDF support, the document is marked for prompt caching so calls on the same pdf share it.
+        The response is streamed to tell when the document is cached, i.e. once the message has started."""
+        text, usage = [], None
+        with _provider_errors():
+            events = await self.client.beta.messages.create(
+                betas=[PDFS_BETA, PROMPT_CACHING_BETA],
+                stream=True,
+                **self._pdf_params(prompt, pdf_data, json_structure)
+            )
+            async for event in events:
+                if event.type == "message_start":
+                    usage = event.message.usage
+                    if started is not None:
+                        started.set()
+                elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    text.append(event.delta.text)
+                elif event.type == "message_delta" and usage is not None:
+                    usage.output_tokens = event.usage.output_tokens
+        if usage is not None:
+            self._log_usage(usage)
+        return json.loads("".join(text))
+
+    def _pdf_params(self, prompt: str, pdf_data: str, json_structure: Dict[str, str]) -> dict:
+        structured_prompt = f"""
+        {prompt}
+
+        Provide your response in JSON format matching exactly this structure:
+        {json.dumps(json_structure, indent=2)}
+
+        Your response must be valid JSON that can be parsed. Include only the JSON output.        
+        """
+        return {
+            "model": self.config.model,
+            "max_tokens": self.config.max_tokens,
+            "temperature": self.config.temperature,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        self._cached_document(pdf_data),
                         {
                             "type": "text",
                             "text": structured_prompt
@@ -71,5 +224,66 @@ class ClaudeLLM:
                     ]
                 }
             ]
-        )
-        return json.loads(message.content[0].text) 
\ No newline at end of file
+        }
+
+    def _parse_json(self, message) -> Dict[str, str]:
+        self._log_usage(message.usage)
+        return json.loads(message.content[0].text)
+
+    @staticmethod
+    def _cached_document(pdf_data: str) -> dict:
+        return {
+            "type": "document",
+            "source": {
+                "type": "base64",
+                "media_type": "application/pdf",
+                "data": pdf_data
+            },
+            "cache_control": {"type": "ephemeral"}
+        }
+
+class ClaudeBatchBackend(BatchBackend):
+    """Sends the calls of a Claude LLM through anthropic's message batches api"""
+
+    llm: ClaudeLLM
+
+    def request(self, call: BatchCall) -> dict:
+        if call.method == "chat":
+            return self.llm._chat_params(call.prompt, call.response_model, call.context)
+        if call.method == "text":
+            return self.llm._text_params(call.prompt, call.context)
+        if call.method == "image":
+            return self.llm._image_params(call.prompt, call.image_data, call.mime_type, call.response_model)
+        if call.method == "pdf":
+            return self.llm._pdf_params(call.prompt, call.pdf_data, call.json_structure)
+        raise InternalError(f"Unsupported batch call: {call.method}")
+
+    async def submit(self, requests: Dict[str, dict]) -> str:
+        with _provider_errors():
+            batch = await self.llm.client.beta.messages.batches.create(
+                betas=[PDFS_BETA, PROMPT_CACHING_BETA],
+                requests=[{"custom_id": custom_id, "params": params} for custom_id, params in requests.items()]
+            )
+        return batch.id
+
+    async def results(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = await self.llm.client.beta.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return None
+        results = {}
+        async for entry in await self.llm.client.beta.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = entry.result.message
+            else:
+                error = getattr(entry.result, "error", None)
+                results[entry.custom_id] = InternalError(f"Batch request {entry.result.type}: {error}")
+        return results
+
+    def parse(self, call: BatchCall, response: Any) -> Any:
+        if call.method == "chat":
+            return self.llm._parse_chat(response, call.response_model)
+        if call.method == "text":
+            return self.llm._parse_text(response)
+        if call.method == "image":
+            return self.llm._parse_tool(response, call.response_model)
+        return self.llm._parse_json(response)
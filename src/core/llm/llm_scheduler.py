@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Awaitable, Callable, Iterator, List, Mapping, Optional, Tuple, TypeVar
+from ...utils.exceptions import LLMRateLimitError, LLMUnavailableError
+from ...utils.logger import logger
+from ...utils.metrics import metrics
+
+T = TypeVar("T")
+
+class LLMPriority(IntEnum):
+    """Order in which queued LLM requests are sent, lowest first."""
+    INTERACTIVE = 0
+    BATCH = 1
+
+_priority = ContextVar("llm_priority", default=LLMPriority.INTERACTIVE)
+
+@contextmanager
+def llm_priority(priority: LLMPriority) -> Iterator[None]:
+    """Queue the LLM calls made in this context at the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from the retry-after(-ms) headers of a rate limited response, None if there are none."""
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+@dataclass
+class LLMSchedulerConfig:
+    """Rate limits of an LLM provider and how the scheduler adapts to them"""
+    # Budgets per minute of the provider account, None for no limit
+    requests_per_minute: Optional[int] = 50
+    tokens_per_minute: Optional[int] = 40000
+    # Requests in flight start at initial_concurrency, grow by one per round of successes up to max_concurrency,
+    # and are multiplied by backoff_factor on a rate limit error, down to min_concurrency
+    initial_concurrency: int = 4
+    min_concurrency: int = 1
+    max_concurrency: int = 16
+    backoff_factor: float = 0.5
+    # Retries of a rate limited or failed request before the error is raised
+    max_retries: int = 5
+    # Pause after a rate limit error without a retry-after header, in seconds
+    default_retry_after: float = 10.0
+    # Wait before retrying a request failed with a server or connection error, doubling on each retry, in seconds
+    retry_backoff: float = 1.0
+    max_retry_backoff: float = 30.0
+
+class _Budget:
+    """Per-minute budget refilled continuously, up to a minute's worth."""
+
+    def __init__(self, per_minute: Optional[int]):
+        self.capacity = per_minute
+        self.level = float(per_minute or 0)
+        self.updated_at = time.monotonic()
+
+    def wait(self, amount: int, now: float) -> float:
+        """Time until amount is available, in seconds. More than the capacity waits for a full budget."""
+        if self.capacity is None:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+        return max(0.0, (min(amount, self.capacity) - self.level) * 60 / self.capacity)
+
+    def take(self, amount: int) -> None:
+        if self.capacity is not None:
+            self.level -= min(amount, self.capacity)
+
+class LLMScheduler:
+    """Sends LLM requests at the highest throughput the provider sustains, instead of alternating bursts and failures.
+
+    Requests wait in a priority queue, by priority then arrival, until the requests and estimated tokens
+    per minute budgets allow them and fewer than the current concurrency are in flight.
+    Concurrency is adapted with AIMD: it grows while requests succeed and is cut on a rate limit error,
+    at most once per round of in-flight requests. A rate limit error also pauses the queue for the
+    provider's retry-after, then the request is retried in its place in the queue.
+
+    Example:
+        summary = await scheduler.run(lambda: llm.chat(prompt, SummaryResponse), tokens=estimate_tokens(prompt))
+    """
+
+    def __init__(self, name: str, config: Optional[LLMSchedulerConfig] = None):
+        """
+        Args:
+            name: Name of the provider, used for the metrics
+            config: Rate limits of the provider
+        """
+        self.name = name
+        self.config = config or LLMSchedulerConfig()
+        self.concurrency = float(self.config.initial_concurrency)
+        self._in_flight = 0
+        self._requests = _Budget(self.config.requests_per_minute)
+        self._tokens = _Budget(self.config.tokens_per_minute)
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int) -> T:
+        """
+        Send a request once the budgets allow it, retrying it while it is rate limited or fails with a
+        server or connection error.
+
+        Args:
+            call: Sends the request, called again on each retry
+            tokens: Estimated tokens of the request
+        """
+        priority, arrival = _priority.get(), next(self._arrivals)
+        for attempt in range(self.config.max_retries + 1):
+            await self._acquire(priority, arrival, tokens)
+            started_at = time.monotonic()
+            try:
+                result = await call()
+            except LLMRateLimitError as e:
+                # Pause before the slot is released, so no request is sent in the meantime
+                self._rate_limited(started_at, e)
+                self._release()
+                if attempt == self.config.max_retries:
+                    raise
+                continue
+            except LLMUnavailableError as e:
+                # Only this request backs off, the provider isn't asking everyone to slow down
+                self._release()
+                if attempt == self.config.max_retries:
+                    raise
+                backoff = min(self.config.max_retry_backoff, self.config.retry_backoff * 2 ** attempt)
+                logger.warning("%s call failed, retrying in %.1fs: %s", self.name, backoff, e.__cause__ or e)
+                metrics.increment(f"llm_scheduler.{self.name}.retried")
+                await asyncio.sleep(backoff)
+                continue
+            except BaseException:
+                self._release()
+                raise
+            self._release()
+            self._succeeded()
+            return result
+
+    async def _acquire(self, priority: int, arrival: int, tokens: int) -> None:
+        """Wait for the turn of the request in the queue."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, arrival, tokens, future))
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot was granted just as the request was cancelled, hand it to the next one
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        metrics.observe(f"llm_scheduler.{self.name}.wait_seconds", time.monotonic() - queued_at)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Start the requests at the head of the queue that the budgets allow, or wake up once they do."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            priority, arrival, tokens, future = self._queue[0]
+            if future.done():
+                # Cancelled while queued
+                heapq.heappop(self._queue)
+                continue
+            if self._in_flight >= int(self.concurrency):
+                # A finishing request dispatches again
+                return
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._requests.wait(1, now), self._tokens.wait(tokens, now))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _succeeded(self) -> None:
+        """Additive increase, by one once a full concurrency's worth of requests succeeded."""
+        if self.concurrency < self.config.max_concurrency:
+            self.concurrency = min(self.config.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._dispatch()
+
+    def _rate_limited(self, started_at: float, error: LLMRateLimitError) -> None:
+        """Multiplicative decrease and pause. Requests sent before the last decrease don't decrease it again."""
+        now = time.monotonic()
+        retry_after = error.retry_after if error.retry_after is not None else self.config.default_retry_after
+        self._paused_until = max(self._paused_until, now + retry_after)
+        metrics.increment(f"llm_scheduler.{self.name}.rate_limited")
+        if started_at >= self._decreased_at:
+            self.concurrency = max(self.config.min_concurrency, self.concurrency * self.config.backoff_factor)
+            self._decreased_at = now
+        logger.warning("%s rate limited, pausing for %.1fs with concurrency %d",
+                       self.name, retry_after, int(self.concurrency))
+        metrics.observe(f"llm_scheduler.{self.name}.concurrency", self.concurrency)
@@ -0,0 +1,39 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from ...utils.metrics import metrics
+
+@dataclass
+class LLMUsage:
+    """Tokens the provider reported for the calls of an operation, e.g. a paper's analysis."""
+    calls: int = 0
+    # All input tokens, including those read from the prompt cache
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+
+# Usage of the operation the calls in this context belong to
+_usage: ContextVar[Optional[LLMUsage]] = ContextVar("llm_usage", default=None)
+
+@contextmanager
+def track_usage(usage: Optional[LLMUsage] = None) -> Iterator[LLMUsage]:
+    """Add up the usage of the LLM calls made in this context, including by the tasks it starts."""
+    usage = usage or LLMUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+def record_usage(input_tokens: int, cached_input_tokens: int, output_tokens: int) -> None:
+    """Count the usage of an LLM call, reported by the provider."""
+    metrics.increment("llm.input_tokens", input_tokens)
+    metrics.increment("llm.cached_input_tokens", cached_input_tokens)
+    metrics.increment("llm.output_tokens", output_tokens)
+    usage = _usage.get()
+    if usage is not None:
+        usage.calls += 1
+        usage.input_tokens += input_tokens
+        usage.cached_input_tokens += cached_input_tokens
+        usage.output_tokens += output_tokens
@@ -1,8 +1,37 @@
+import base64
+import json
 import openai
+from openai.types.chat import ChatCompletion
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Optional, Type
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Type
 from pydantic import BaseModel
 from .base_llm import BaseLLM
+from .batch_llm import BatchBackend, BatchCall
+from ...utils.logger import logger
+from ...utils.exceptions import InternalError, LLMRateLimitError, LLMUnavailableError
+from .llm_scheduler import parse_retry_after
+from .llm_usage import record_usage
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Statuses of a batch that won't change anymore
+BATCH_ENDED = ("completed", "failed", "expired", "cancelled")
+
+@contextmanager
+def _provider_errors() -> Iterator[None]:
+    """Raise rate limit errors as LLMRateLimitError, with the wait the provider asked for,
+    and server and connection errors as LLMUnavailableError, both retried by the scheduler."""
+    try:
+        yield
+    except openai.APIStatusError as e:
+        if e.status_code == 429:
+            raise LLMRateLimitError("The LLM provider is busy, please try again later",
+                                    retry_after=parse_retry_after(e.response.headers)) from e
+        if e.status_code >= 500:
+            raise LLMUnavailableError("The LLM provider is unavailable, please try again later") from e
+        raise
+    except openai.APIConnectionError as e:
+        raise LLMUnavailableError("The LLM provider is unavailable, please try again later") from e
 
 @dataclass
 class OpenAILLMConfig:
@@ -11,40 +40,184 @@ class OpenAILLMConfig:
     temperature: float = 0.3
     model: str = "gpt-4o"
     max_tokens: Optional[int] = 4096
+    max_retries: int = 2
+    # Another api endpoint, e.g. a local stand-in
+    base_url: Optional[str] = None
 
 class OpenAILLM(BaseLLM):
     """OpenAI LLM implementation"""
     
     def __init__(self, config: OpenAILLMConfig):
         self.config = config
-        self.client = openai.OpenAI(api_key=config.api_key)
+        self.client = openai.AsyncOpenAI(api_key=config.api_key, max_retries=config.max_retries,
+                                         base_url=config.base_url)
 
-    def chat(self, prompt: str, response_model: Type[BaseModel]) -> BaseModel:
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
         """
         Chat with structured response using Pydantic models
         
         Args:
             prompt: The input prompt
             response_model: Pydantic model class defining the response structure
+            context: Content sent ahead of the prompt, cached by openai's automatic prefix caching
             
         Returns:
             Instance of the provided response_model
         """
 
-        completion = self.client.beta.chat.completions.parse(
-            model=self.config.model,
-            messages=[
-                {"role": "system", "content": "You are an expert at structured data extraction."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=response_model,
-            max_tokens=self.config.max_tokens,
-            temperature=self.config.temperature
-        )
+        with _provider_errors():
+            completion = await self.client.beta.chat.completions.parse(
+                model=self.config.model,
+                messages=self._messages(prompt, context),
+                response_format=response_model,
+                max_tokens=self.config.max_tokens,
+                temperature=self.config.temperature
+            )
+        self._log_usage(completion.usage)
                 
         return completion.choices[0].message.parsed
 
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """Chat streaming the text of the response"""
+        with _provider_errors():
+            chunks = await self.client.chat.completions.create(
+                model=self.config.model,
+                messages=self._messages(prompt, context),
+                max_tokens=self.config.max_tokens,
+                temperature=self.config.temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                self._log_usage(chunk.usage)
+
+    def identity(self) -> Dict[str, object]:
+        return {
+            "provider": "openai",
+            "model": self.config.model,
+            "temperature": self.config.temperature,
+            "max_tokens": self.config.max_tokens
+        }
+
+    @staticmethod
+    def _messages(prompt: str, context: Optional[str]) -> List[dict]:
+        """Messages with the static parts first, so calls sharing the context share the longest prefix."""
+        messages = [{"role": "system", "content": "You are an expert at structured data extraction."}]
+        if context is not None:
+            messages.append({"role": "user", "content": context})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    @staticmethod
+    def _log_usage(usage) -> None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        logger.info("OpenAI usage: %d prompt tokens, %d read from cache, %d completion tokens",
+                    usage.prompt_tokens, cached, usage.completion_tokens)
+        record_usage(usage.prompt_tokens, cached, usage.completion_tokens)
+
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        """Chat with an image, with structured response using Pydantic models"""
+        with _provider_errors():
+            completion = await self.client.beta.chat.completions.parse(
+                model=self.config.model,
+                messages=self._image_messages(prompt, image_data, mime_type),
+                response_format=response_model,
+                max_tokens=self.config.max_tokens,
+                temperature=self.config.temperature
+            )
+        self._log_usage(completion.usage)
+
+        return completion.choices[0].message.parsed
+
+    @staticmethod
+    def _image_messages(prompt: str, image_data: bytes, mime_type: str) -> List[dict]:
+        image_url = f"data:{mime_type};base64,{base64.standard_b64encode(image_data).decode('ascii')}"
+        return [
+            {"role": "system", "content": "You are an expert at structured data extraction."},
+            {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": image_url}}
+            ]}
+        ]
                 
-    def chat_with_pdf(self, prompt: str, pdf_data: str, response_model: Type[BaseModel]) -> BaseModel:
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, response_model: Type[BaseModel]) -> BaseModel:
         """Chat with PDF support"""
-        pass
\ No newline at end of file
+        pass
+
+class OpenAIBatchBackend(BatchBackend):
+    """Sends the calls of an OpenAI LLM through openai's batch api, as an uploaded jsonl file"""
+
+    llm: OpenAILLM
+
+    def request(self, call: BatchCall) -> dict:
+        if call.method == "chat":
+            body = {"messages": self.llm._messages(call.prompt, call.context),
+                    "response_format": self._response_format(call.response_model)}
+        elif call.method == "text":
+            body = {"messages": self.llm._messages(call.prompt, call.context)}
+        elif call.method == "image":
+            body = {"messages": self.llm._image_messages(call.prompt, call.image_data, call.mime_type),
+                    "response_format": self._response_format(call.response_model)}
+        else:
+            raise InternalError(f"Unsupported batch call: {call.method}")
+        body.update(model=self.llm.config.model, max_tokens=self.llm.config.max_tokens,
+                    temperature=self.llm.config.temperature)
+        return body
+
+    @staticmethod
+    def _response_format(response_model: Type[BaseModel]) -> dict:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": response_model.__name__, "schema": response_model.model_json_schema()}
+        }
+
+    async def submit(self, requests: Dict[str, dict]) -> str:
+        lines = "\n".join(
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body})
+            for custom_id, body in requests.items()
+        )
+        with _provider_errors():
+            file = await self.llm.client.files.create(file=("batch.jsonl", lines.encode()), purpose="batch")
+            batch = await self.llm.client.batches.create(input_file_id=file.id, endpoint=BATCH_ENDPOINT,
+                                                         completion_window="24h")
+        return batch.id
+
+    async def results(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = await self.llm.client.batches.retrieve(batch_id)
+        if batch.status not in BATCH_ENDED:
+            return None
+        results = {}
+        # Failed requests are written to the error file
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.llm.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[entry["custom_id"]] = ChatCompletion.model_validate(response["body"])
+                else:
+                    error = entry.get("error") or response.get("body")
+                    results[entry["custom_id"]] = InternalError(f"Batch request failed: {error}")
+        return results
+
+    def parse(self, call: BatchCall, response: Any) -> Any:
+        self.llm._log_usage(response.usage)
+        message = response.choices[0].message
+        content = message.content
+        if content is None:
+            # A refusal, or a completion cut short before any text
+            reason = getattr(message, "refusal", None) or f"finish reason {response.choices[0].finish_reason}"
+            raise InternalError(f"Batch request returned no content: {reason}")
+        if call.method == "text":
+            return content
+        return call.response_model.model_validate_json(content)
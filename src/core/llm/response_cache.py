@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from ...utils.logger import logger
+from ...utils.metrics import metrics
+
+@dataclass
+class ResponseCacheEntry:
+    """A cached response file of size bytes, until expires_at (unix time)."""
+    size: int
+    expires_at: int
+
+class ResponseCache:
+    """Persistent size-bounded cache of LLM responses, keyed by a hash of the request.
+
+    Each response is a file named after its key and expiry, so the index is rebuilt from the directory listing
+    without reading the responses. Least recently used responses are evicted once the files exceed max_bytes,
+    the use order survives restarts as the files' modification times.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 512 * 1024 * 1024, ttl_seconds: float = 30 * 24 * 60 * 60):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, ResponseCacheEntry]" = self._load()
+        self._size = sum(entry.size for entry in self._entries.values())
+
+    def get(self, key: str) -> Optional[str]:
+        """Get a cached response, None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+
+        file_path = self._file_path(key, entry)
+        try:
+            value = file_path.read_text(encoding='utf-8')
+            # Keep the use order for the next start
+            os.utime(file_path)
+            return value
+        except IOError as e:
+            logger.error(f"Failed to read cached response {key}: {e}")
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._remove(key)
+            return None
+
+    def put(self, key: str, value: str, ttl_seconds: Optional[float] = None) -> None:
+        """Cache a response for ttl_seconds, the cache's ttl by default."""
+        data = value.encode('utf-8')
+        entry = ResponseCacheEntry(
+            size=len(data),
+            expires_at=int(time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds))
+        )
+        if entry.size > self.max_bytes:
+            logger.warning("Response %s of %d bytes is over the cache size, not cached", key, entry.size)
+            return
+
+        file_path = self._file_path(key, entry)
+        temp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}.part")
+        try:
+            temp_path.write_bytes(data)
+            os.replace(temp_path, file_path)
+        except IOError as e:
+            # The cache is an optimization, the response is still returned
+            temp_path.unlink(missing_ok=True)
+            logger.error(f"Failed to cache response {key}: {e}")
+            return
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous.expires_at != entry.expires_at:
+                self._remove(key)
+            elif previous is not None:
+                self._size -= self._entries.pop(key).size
+            self._entries[key] = entry
+            self._size += entry.size
+            self._evict()
+
+    def purge(self) -> int:
+        """Remove every cached response. Returns the number of removed responses."""
+        with self._lock:
+            removed = len(self._entries)
+            for key in list(self._entries):
+                self._remove(key)
+        logger.info("Purged %d responses from the LLM response cache", removed)
+        return removed
+
+    def _evict(self) -> None:
+        """Remove least recently used responses until the cache fits max_bytes. Caller must hold the lock."""
+        while self._size > self.max_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            metrics.increment("llm.cache.evictions")
+
+    def _remove(self, key: str) -> None:
+        """Caller must hold the lock."""
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+        self._file_path(key, entry).unlink(missing_ok=True)
+
+    def _file_path(self, key: str, entry: ResponseCacheEntry) -> Path:
+        return self.path / f"{key}-{entry.expires_at}.json"
+
+    def _load(self) -> "OrderedDict[str, ResponseCacheEntry]":
+        entries = []
+        now = time.time()
+        for file_path in self.path.glob("*.json"):
+            try:
+                key, expires_at = file_path.stem.rsplit("-", 1)
+                stat = file_path.stat()
+                if int(expires_at) <= now:
+                    file_path.unlink(missing_ok=True)
+                    continue
+                entries.append((stat.st_mtime, key, ResponseCacheEntry(size=stat.st_size, expires_at=int(expires_at))))
+            except (IOError, ValueError) as e:
+                logger.error(f"Skipping invalid cached response {file_path.name}: {e}")
+        # Least recently used first
+        return OrderedDict((key, entry) for _, key, entry in sorted(entries, key=lambda item: item[0]))
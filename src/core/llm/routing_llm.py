@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Type, TypeVar
+from pydantic import BaseModel
+from .base_llm import BaseLLM
+from .token_estimator import IMAGE_TOKENS, estimate_pdf_tokens, estimate_tokens
+from ...utils.logger import logger
+from ...utils.metrics import metrics
+
+T = TypeVar("T")
+
+# Tasks of text-only calls, which a small model can answer
+TEXT_TASKS = ("stream", "chat")
+
+@dataclass
+class LLMRoute:
+    """Calls matching the route are sent to llm, and to hedge_llm as well once they are slow or failed."""
+    llm: str
+    # Methods of the calls, i.e. the tasks: stream (the summary), chat, chat_with_image or chat_with_pdf. None for any
+    tasks: Optional[Tuple[str, ...]] = None
+    # Only calls of at most this many estimated input tokens, None for any size
+    max_tokens: Optional[int] = None
+    # LLM of another provider to hedge to, None to not hedge
+    hedge_llm: Optional[str] = None
+
+@dataclass
+class RoutingLLMConfig:
+    """Configuration for hedging routed LLM calls"""
+    # A call is hedged once it takes longer than this percentile of the recent latencies of its LLM and task
+    hedge_percentile: float = 95
+    # Recent latencies kept per LLM and task, and needed before calls are hedged
+    latency_window: int = 200
+    min_samples: int = 20
+
+class RoutingLLM(BaseLLM):
+    """Routes each call to one of several LLMs by its task and estimated input tokens, and hedges slow calls.
+
+    The first route matching a call is used, a call matching none goes to the first LLM.
+    A call on a route with a hedge LLM is sent there as well once it takes longer than the hedge percentile
+    of the recent latencies of its LLM, or right away if it fails. The first response wins, the other call
+    is cancelled. A stream is hedged until its first text.
+
+    Example:
+        llm = RoutingLLM({"claude": claude, "haiku": haiku, "openai": openai}, [
+            LLMRoute("haiku", tasks=TEXT_TASKS, max_tokens=8000, hedge_llm="openai"),
+            LLMRoute("claude", hedge_llm="openai")
+        ])
+    """
+
+    def __init__(self, llms: Dict[str, BaseLLM], routes: List[LLMRoute], config: Optional[RoutingLLMConfig] = None):
+        unknown = {name for route in routes for name in (route.llm, route.hedge_llm)
+                   if name is not None and name not in llms}
+        if not llms or unknown:
+            raise ValueError(f"Routes to unknown LLMs: {sorted(unknown)}")
+        self.llms = llms
+        self.routes = routes
+        self.config = config or RoutingLLMConfig()
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+
+    def identity(self) -> Dict[str, object]:
+        return {
+            "provider": "router",
+            "llms": {name: llm.identity() for name, llm in self.llms.items()},
+            "routes": [asdict(route) for route in self.routes]
+        }
+
+    def route(self, task: str, tokens: int) -> LLMRoute:
+        """The route of a call."""
+        for route in self.routes:
+            if (route.tasks is None or task in route.tasks) and (route.max_tokens is None or tokens <= route.max_tokens):
+                return route
+        return LLMRoute(next(iter(self.llms)))
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        return await self._call("chat", estimate_tokens(prompt) + estimate_tokens(context or ""),
+                                lambda llm: llm.chat(prompt, response_model, context=context))
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        deltas, first = await self._call("stream", estimate_tokens(prompt) + estimate_tokens(context or ""),
+                                         lambda llm: self._start_stream(llm, prompt, context),
+                                         release=lambda started: started[0].aclose())
+        try:
+            if first is None:
+                return
+            yield first
+            async for delta in deltas:
+                yield delta
+        finally:
+            await deltas.aclose()
+
+    @staticmethod
+    async def _start_stream(llm: BaseLLM, prompt: str, context: Optional[str]) -> Tuple[AsyncIterator[str], Optional[str]]:
+        """Start a stream, returning it with its first text so the latency is the time to the first text."""
+        deltas = llm.stream(prompt, context=context)
+        try:
+            return deltas, await anext(deltas, None)
+        except BaseException:
+            await deltas.aclose()
+            raise
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        return await self._call("chat_with_image", estimate_tokens(prompt) + IMAGE_TOKENS,
+                                lambda llm: llm.chat_with_image(prompt, image_data, mime_type, response_model))
+
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str],
+                            started: Optional[asyncio.Event] = None) -> Dict[str, str]:
+        return await self._call("chat_with_pdf", estimate_tokens(prompt) + estimate_pdf_tokens(pdf_data),
+                                lambda llm: llm.chat_with_pdf(prompt, pdf_data, json_structure, started))
+
+    async def _call(self, task: str, tokens: int, call: Callable[[BaseLLM], Awaitable[T]],
+                    release: Optional[Callable[[T], Awaitable[None]]] = None) -> T:
+        """Send a call along its route, hedging it if the route has a hedge LLM.
+        release frees the result of a call that lost the race, e.g. closes its stream."""
+        route = self.route(task, tokens)
+        metrics.increment(f"llm_router.{route.llm}.calls")
+        if route.hedge_llm is None:
+            return await self._timed(route.llm, task, call)
+
+        started_at = time.monotonic()
+        primary = asyncio.ensure_future(self._timed(route.llm, task, call))
+        pending = {primary}
+        hedge = None
+        losers = []
+        delay = self._hedge_delay(route.llm, task)
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, timeout=delay if hedge is None else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [future for future in done if future.exception() is None]
+                if succeeded:
+                    winner = succeeded[0]
+                    # Both calls may have finished at once
+                    losers = succeeded[1:]
+                    if winner is hedge:
+                        metrics.increment("llm_router.hedges_won")
+                    if primary in pending:
+                        # The slow call took at least this long, leaving it out would lower the percentile
+                        self._record(route.llm, task, time.monotonic() - started_at)
+                    return winner.result()
+                error = next((future.exception() for future in done), None)
+                if hedge is None:
+                    if error is None:
+                        logger.info("%s call to %s is slower than %.1fs, hedging it to %s",
+                                    task, route.llm, delay, route.hedge_llm)
+                    else:
+                        logger.warning("%s call to %s failed, sending it to %s: %s",
+                                       task, route.llm, route.hedge_llm, error)
+                    metrics.increment("llm_router.hedges")
+                    hedge = asyncio.ensure_future(self._timed(route.hedge_llm, task, call))
+                    pending.add(hedge)
+                elif not pending:
+                    raise error
+        finally:
+            for future in pending:
+                future.cancel()
+            if release is not None:
+                for loser in losers:
+                    await release(loser.result())
+
+    async def _timed(self, name: str, task: str, call: Callable[[BaseLLM], Awaitable[T]]) -> T:
+        """Send a call to an LLM and record its latency."""
+        started_at = time.monotonic()
+        result = await call(self.llms[name])
+        self._record(name, task, time.monotonic() - started_at)
+        return result
+
+    def _record(self, name: str, task: str, seconds: float) -> None:
+        latencies = self._latencies.setdefault((name, task), deque(maxlen=self.config.latency_window))
+        latencies.append(seconds)
+        metrics.observe(f"llm_router.{name}.{task}_seconds", seconds)
+
+    def _hedge_delay(self, name: str, task: str) -> Optional[float]:
+        """Hedge percentile of the recent latencies, None until there are enough of them."""
+        latencies = self._latencies.get((name, task))
+        if latencies is None or len(latencies) < self.config.min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.config.hedge_percentile / 100))]
@@ -0,0 +1,52 @@
+import asyncio
+from typing import AsyncIterator, Dict, Optional, Type
+from pydantic import BaseModel
+from .base_llm import BaseLLM
+from .llm_scheduler import LLMScheduler
+from .token_estimator import IMAGE_TOKENS, estimate_pdf_tokens, estimate_tokens
+
+class ScheduledLLM(BaseLLM):
+    """Sends the calls of an LLM through a scheduler enforcing the provider's rate limits.
+    Each call is charged its estimated input tokens against the tokens per minute budget.
+    A stream holds its slot until its first text, it is charged in full up front.
+    """
+
+    def __init__(self, llm: BaseLLM, scheduler: LLMScheduler):
+        self.llm = llm
+        self.scheduler = scheduler
+
+    def identity(self) -> Dict[str, object]:
+        return self.llm.identity()
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        return await self.scheduler.run(
+            lambda: self.llm.chat(prompt, response_model, context=context),
+            tokens=estimate_tokens(prompt) + estimate_tokens(context or "")
+        )
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        async def start():
+            # Rate limit errors are raised when the stream starts
+            deltas = self.llm.stream(prompt, context=context)
+            return deltas, await anext(deltas, None)
+
+        deltas, first = await self.scheduler.run(start, tokens=estimate_tokens(prompt) + estimate_tokens(context or ""))
+        if first is None:
+            return
+        yield first
+        async for delta in deltas:
+            yield delta
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        return await self.scheduler.run(
+            lambda: self.llm.chat_with_image(prompt, image_data, mime_type, response_model),
+            tokens=estimate_tokens(prompt) + IMAGE_TOKENS
+        )
+
+    async def chat_with_pdf(self, prompt: str, pdf_data: str, json_structure: Dict[str, str],
+                            started: Optional[asyncio.Event] = None) -> Dict[str, str]:
+        return await self.scheduler.run(
+            lambda: self.llm.chat_with_pdf(prompt, pdf_data, json_structure, started),
+            tokens=estimate_tokens(prompt) + estimate_pdf_tokens(pdf_data)
+        )
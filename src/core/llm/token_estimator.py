@@ -0,0 +1,19 @@
+# Rough number of characters per token for english text, good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens the text takes up in a prompt."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Truncate the text to about max_tokens tokens."""
+    return text[:max(max_tokens, 0) * CHARS_PER_TOKEN]
+
+# Rough input tokens of an image, anthropic caps images at about 1600 tokens
+IMAGE_TOKENS = 1600
+# Rough pdf bytes per input token, pages are sent as both text and image
+PDF_BYTES_PER_TOKEN = 30
+
+def estimate_pdf_tokens(pdf_data: str) -> int:
+    """Estimate the tokens of a base64 encoded pdf from its size."""
+    return len(pdf_data) * 3 // 4 // PDF_BYTES_PER_TOKEN
@@ -0,0 +1,33 @@
+from dataclasses import dataclass, asdict, field
+from enum import Enum
+from typing import Optional, List
+from .paper import PaperAnalysis
+
+class AnalysisEventType(Enum):
+    """Progress events of a streamed paper analysis, in the order they are sent."""
+    METADATA = 'metadata'
+    DOWNLOADED = 'downloaded'
+    EXTRACTED = 'extracted'
+    SUMMARY_DELTA = 'summary_delta'
+    SUMMARY = 'summary'
+    TABLE = 'table'
+    DONE = 'done'
+    ERROR = 'error'
+
+@dataclass
+class AnalysisEvent:
+    """A progress event of a streamed paper analysis."""
+    type: AnalysisEventType
+    data: dict = field(default_factory=dict)
+    # The complete analysis, only set on the done event
+    analysis: Optional[PaperAnalysis] = None
+
+def result_events(analysis: PaperAnalysis) -> List[AnalysisEvent]:
+    """Events for the results of a completed analysis: its summary, main table and the done event."""
+    events = []
+    if analysis.summary is not None:
+        events.append(AnalysisEvent(AnalysisEventType.SUMMARY, {"summary": analysis.summary}))
+    table = asdict(analysis.main_table) if analysis.main_table else None
+    events.append(AnalysisEvent(AnalysisEventType.TABLE, {"table": table}))
+    events.append(AnalysisEvent(AnalysisEventType.DONE, analysis=analysis))
+    return events
@@ -0,0 +1,34 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Optional, List
+from .paper import PaperAnalysis
+
+class BatchItemStatus(Enum):
+    """Lifecycle of a single paper within a batch job."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+@dataclass
+class BatchItem:
+    """A single paper of a batch job."""
+    url: str
+    status: BatchItemStatus = BatchItemStatus.PENDING
+    analysis: Optional[PaperAnalysis] = None
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+@dataclass
+class BatchJob:
+    """A batch of papers analyzed together."""
+    id: str
+    items: List[BatchItem]
+    created_at: datetime = field(default_factory=datetime.now)
+
+    @property
+    def is_finished(self) -> bool:
+        """Check if every paper of the job is done or failed."""
+        return all(item.status in (BatchItemStatus.DONE, BatchItemStatus.FAILED) for item in self.items)
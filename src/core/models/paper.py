@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, List
+import csv
+import io
+from typing import Optional, List, Tuple
 from dataclasses import asdict
 
 class PaperSource(Enum):
@@ -26,6 +28,17 @@ class PaperMetadata:
         """Convert the metadata to a dictionary."""
         return asdict(self)
 
+@dataclass
+class PaperFileInfo:
+    """Details of a stored, validated paper pdf."""
+    size: int
+    sha256: str
+    page_count: int
+
+    def dict(self) -> dict:
+        """Convert the file info to a dictionary."""
+        return asdict(self)
+
 @dataclass
 class TableInfo:
     """Information about a table in the paper."""
@@ -33,6 +46,34 @@ class TableInfo:
     csv_content: str
     footnotes: str    
 
+@dataclass
+class TableCandidate:
+    """A table found in a paper pdf by local table detection."""
+    page_number: int  # 1-based
+    bbox: Tuple[float, float, float, float]  # x0, y0, x1, y1 in pdf points
+    cells: List[List[str]]  # rows of cells, empty string for empty or merged cells
+
+    @property
+    def row_count(self) -> int:
+        return len(self.cells)
+
+    @property
+    def col_count(self) -> int:
+        return max((len(row) for row in self.cells), default=0)
+
+    @property
+    def empty_cell_fraction(self) -> float:
+        """Fraction of the cells that are empty, high for garbled or merged-cell tables."""
+        total = sum(len(row) for row in self.cells)
+        return sum(not cell for row in self.cells for cell in row) / total if total else 1.0
+
+    def to_csv(self, max_rows: Optional[int] = None, max_cell_length: Optional[int] = None) -> str:
+        """Convert the cells to csv, optionally only the first max_rows rows with cells cut to max_cell_length, for previews."""
+        output = io.StringIO()
+        csv.writer(output, lineterminator="\n").writerows(
+            [cell[:max_cell_length] for cell in row] for row in self.cells[:max_rows]
+        )
+        return output.getvalue()
 
 @dataclass
 class PaperContent:
@@ -43,8 +84,11 @@ class PaperContent:
 
 @dataclass
 class PaperAnalysis: 
-    """Results of paper analysis."""
+    """Results of paper analysis.
+    A part that failed to be generated is None, with the reason listed in errors.
+    """
     paper_id: str
     metadata: PaperMetadata
-    summary: str
+    summary: Optional[str]
     main_table: Optional[TableInfo] 
+    errors: List[str] = field(default_factory=list)
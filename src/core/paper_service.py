@@ -1,57 +1,170 @@
+import asyncio
 from .downloader.download_manager import DownloadManager
-from .storage.storage import Storage
+from .storage.storage import Storage, StorageError
 from .identifier.identifier import Identifier
 from .models.paper import PaperMetadata, PaperAnalysis
+from .models.analysis_event import AnalysisEvent, AnalysisEventType, result_events
 from .analyzer.base_analyzer import ContentAnalyzer
+from ..utils.stage_limits import StageLimits
+from ..utils.single_flight import SingleFlight
 from ..utils.logger import logger
-from typing import BinaryIO
+from ..utils.metrics import metrics
+from typing import AsyncIterator, BinaryIO, Optional, List, Dict
 
 class PaperService:
-    """Service for orchestrating paper analysis operations."""
+    """Service for orchestrating paper analysis operations.
+    
+    Concurrent requests for the same paper are coalesced, so a hot paper is downloaded and
+    analyzed only once while the other callers wait for the in-flight result.
+    Storage is read and written in threads, keeping file I/O off the event loop.
+    """
     
     def __init__(self, download_manager: DownloadManager, storage: Storage, 
-                 identifier: Identifier, analyzer: ContentAnalyzer):
+                 identifier: Identifier, analyzer: ContentAnalyzer, stage_limits: Optional[StageLimits] = None):
         self.download_manager = download_manager
         self.storage = storage
         self.identifier = identifier
         self.analyzer = analyzer
+        self.stage_limits = stage_limits or StageLimits()
+        self.flights = SingleFlight("paper_service")
 
-    def get_analysis(self, url: str) -> PaperAnalysis:
+    async def get_analysis(self, url: str) -> PaperAnalysis:
         """
         Get complete analysis of a paper including metadata, summary, and tables.
         """
         logger.info("Processing paper from URL: %s", url)
         
-        paper_identifier = self.identifier.from_url(url)
-        
+        with metrics.timer("stage.identify.seconds"):
+            paper_identifier = self.identifier.from_url(url)
+        return await self.flights.do(
+            f"analysis:{paper_identifier.id}",
+            lambda: self._analyze(url, paper_identifier.id)
+        )
+
+    async def _analyze(self, url: str, paper_id: str) -> PaperAnalysis:
+        """Download, analyze and store a paper. Only one call per paper runs at a time."""
         # Check cache first, paper and summary exist 
-        if self.storage.is_paper_analyzed(paper_identifier.id):
-            logger.info("Paper already processed: %s", paper_identifier.id)
-            return self.storage.get_analysis(paper_identifier.id)
+        if await self._is_paper_analyzed(paper_id):
+            logger.info("Paper already processed: %s", paper_id)
+            return await asyncio.to_thread(self.storage.get_analysis, paper_id)
             
-        # Download and store paper
-        paper_metadata = self.download_manager.download(url)        
+        # Download and store paper, unless an earlier request already did
+        if not await self._paper_exists(paper_id):
+            await self._download(url, paper_id)
 
-        # Analyze paper
-        analysis = self.analyzer.analyze_paper(paper_identifier.id)
-        
-        # Store results        
-        self.storage.store_summary(paper_identifier.id, analysis.summary)
-        self.storage.store_table(paper_identifier.id, analysis.main_table)        
-        
+        # Analyze paper, generating only the parts an earlier analysis failed to
+        stored = await asyncio.to_thread(self._stored_parts, paper_id)
+        analysis = await self.analyzer.analyze_paper(paper_id, stored)
+        await asyncio.to_thread(self._store_analysis, paper_id, analysis)
         return analysis
 
-    def get_paper_metadata(self, url: str) -> PaperMetadata:
+    async def stream_analysis(self, url: str) -> AsyncIterator[AnalysisEvent]:
+        """
+        Analyze a paper, yielding an event as each stage completes, the summary as it is generated
+        and the analysis in a final done event.
+
+        Unlike get_analysis, only the download is coalesced with concurrent requests for the same paper.
+        """
+        logger.info("Streaming analysis of paper from URL: %s", url)
+        with metrics.timer("stage.identify.seconds"):
+            paper_id = self.identifier.from_url(url).id
+
+        if await self._is_paper_analyzed(paper_id):
+            logger.info("Paper already processed: %s", paper_id)
+            analysis = await asyncio.to_thread(self.storage.get_analysis, paper_id)
+            yield AnalysisEvent(AnalysisEventType.METADATA, analysis.metadata.dict())
+            for event in result_events(analysis):
+                yield event
+            return
+
+        # Metadata is available before the pdf is downloaded
+        downloaded = await self._paper_exists(paper_id)
+        if downloaded:
+            metadata = await asyncio.to_thread(self.storage.get_metadata, paper_id)
+        else:
+            metadata = await self.download_manager.get_metadata(url)
+        yield AnalysisEvent(AnalysisEventType.METADATA, metadata.dict())
+
+        if not downloaded:
+            await self._download(url, paper_id)
+        yield AnalysisEvent(AnalysisEventType.DOWNLOADED)
+
+        stored = await asyncio.to_thread(self._stored_parts, paper_id) if downloaded else None
+        async for event in self.analyzer.stream_analysis(paper_id, stored):
+            if event.type == AnalysisEventType.DONE:
+                await asyncio.to_thread(self._store_analysis, paper_id, event.analysis)
+            yield event
+
+    async def _paper_exists(self, paper_id: str) -> bool:
+        """Check if the paper is stored, off the event loop since a paper stored without info is validated first."""
+        return await asyncio.to_thread(self.storage.check_paper_exists, paper_id)
+
+    async def _is_paper_analyzed(self, paper_id: str) -> bool:
+        return await asyncio.to_thread(self.storage.is_paper_analyzed, paper_id)
+
+    def _stored_parts(self, paper_id: str) -> Optional[PaperAnalysis]:
+        """The parts stored by an earlier analysis which failed in part, None if there are none."""
+        try:
+            summary = self.storage.get_summary(paper_id)
+        except StorageError:
+            summary = None
+        try:
+            table = self.storage.get_table(paper_id)
+        except StorageError:
+            table = None
+        if summary is None and table is None:
+            return None
+        return PaperAnalysis(paper_id=paper_id, metadata=self.storage.get_metadata(paper_id),
+                             summary=summary, main_table=table)
+
+    def _store_analysis(self, paper_id: str, analysis: PaperAnalysis) -> None:
+        """Store results, a part that failed is generated again on the next request."""
+        with metrics.timer("stage.store.seconds"):
+            if analysis.summary is not None:
+                self.storage.store_summary(paper_id, analysis.summary)
+            if analysis.main_table is not None:
+                self.storage.store_table(paper_id, analysis.main_table)
+
+    async def prefetch(self, urls: List[str]) -> Dict[str, Optional[Exception]]:
+        """
+        Look up many papers in bulk ahead of their analysis. Already analyzed papers are skipped.
+
+        Returns:
+            The error for each URL that can't be downloaded, None otherwise
+        """
+        results: Dict[str, Optional[Exception]] = {}
+        pending = []
+        for url in urls:
+            try:
+                if not await self._is_paper_analyzed(self.identifier.from_url(url).id):
+                    pending.append(url)
+                    continue
+                results[url] = None
+            except Exception as e:
+                results[url] = e
+
+        if pending:
+            results.update(await self.download_manager.prefetch(pending))
+        return results
+
+    async def get_paper_metadata(self, url: str) -> PaperMetadata:
         """
         Retrieve metadata for a specific paper.
         """        
         paper_identifier = self.identifier.from_url(url)
-        if not self.storage.check_paper_exists(paper_identifier.id):
-            paper_metadata = self.download_manager.download(url)
-            self.storage.store_metadata(paper_identifier.id, paper_metadata)
-        return self.storage.get_metadata(paper_identifier.id)
+        return await self.flights.do(
+            f"metadata:{paper_identifier.id}",
+            lambda: self._get_metadata(url, paper_identifier.id)
+        )
 
-    def download_paper(self, url: str) -> BinaryIO:
+    async def _get_metadata(self, url: str, paper_id: str) -> PaperMetadata:
+        """Retrieve metadata, downloading the paper if it is not stored yet."""
+        if not await self._paper_exists(paper_id):
+            paper_metadata = await self._download(url, paper_id)
+            await asyncio.to_thread(self.storage.store_metadata, paper_id, paper_metadata)
+        return await asyncio.to_thread(self.storage.get_metadata, paper_id)
+
+    async def download_paper(self, url: str) -> BinaryIO:
         """
         Stream a paper's content as bytes.
         """
@@ -59,12 +172,22 @@ class PaperService:
         paper_identifier = self.identifier.from_url(url)
         
         # Download if not already in storage
-        if not self.storage.check_paper_exists(paper_identifier.id):
-            self.download_manager.download(url)
+        if not await self._paper_exists(paper_identifier.id):
+            await self._download(url, paper_identifier.id)
         
-        return self.storage.get_paper_reader(paper_identifier.id)
-            
-            
+        return await asyncio.to_thread(self.storage.get_paper_reader, paper_identifier.id)
 
+    def purge_unavailable(self, url: Optional[str] = None) -> int:
+        """
+        Forget that a paper, or every paper if no URL is given, is unavailable, so it is looked up again.
+        """
+        paper_id = self.identifier.from_url(url).id if url else None
+        return self.download_manager.purge_unavailable(paper_id)
 
+    async def _download(self, url: str, paper_id: str) -> PaperMetadata:
+        """Download and store a paper, coalescing concurrent downloads of the same paper."""
+        async def download() -> PaperMetadata:
+            async with self.stage_limits.download:
+                return await self.download_manager.download(url)
 
+        return await self.flights.do(f"download:{paper_id}", download)
@@ -1,11 +1,55 @@
+import gzip
+import hashlib
 import json
+import os
+import uuid
+import fitz
 from pathlib import Path
-from typing import List, BinaryIO
+from typing import List, BinaryIO, Optional
 from datetime import datetime
 
-from .storage import Storage, StorageError
-from ..models.paper import PaperMetadata, TableInfo, PaperAnalysis
+from .storage import Storage, StorageError, PaperWriter
+from ..models.paper import PaperMetadata, TableInfo, PaperAnalysis, PaperFileInfo
 from ...utils.logger import logger
+
+class AtomicPaperWriter(PaperWriter):
+    """Writes a paper to a temporary file, which is validated and renamed into place on commit."""
+
+    def __init__(self, storage: "LocalStorage", paper_id: str):
+        self.storage = storage
+        self.paper_id = paper_id
+        self.temp_path = storage.papers_dir / f"{paper_id}.pdf.{uuid.uuid4().hex}.part"
+        self._file = open(self.temp_path, 'wb')
+
+    def write(self, data: bytes) -> int:
+        return self._file.write(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def truncate(self, size: Optional[int] = None) -> int:
+        return self._file.truncate(size)
+
+    def commit(self) -> PaperFileInfo:
+        """Validate the written pdf and atomically replace the stored paper with it."""
+        self._file.close()
+        try:
+            info = self.storage._validate_pdf(self.temp_path)
+            os.replace(self.temp_path, self.storage._paper_path(self.paper_id))
+            self.storage._store_paper_info(self.paper_id, info)
+            return info
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        """Discard the written content."""
+        self._file.close()
+        self.temp_path.unlink(missing_ok=True)
+
 class LocalStorage(Storage):
     """Local filesystem implementation of PaperStorage."""
 
@@ -21,10 +65,99 @@ class LocalStorage(Storage):
                          self.summaries_dir, self.tables_dir]:
             directory.mkdir(parents=True, exist_ok=True)
 
+    def _paper_path(self, paper_id: str) -> Path:
+        return self.papers_dir / f"{paper_id}.pdf"
+
+    def _paper_info_path(self, paper_id: str) -> Path:
+        return self.papers_dir / f"{paper_id}.pdf.json"
+
     def check_paper_exists(self, paper_id: str) -> bool:
-        """Check if a paper exists."""
-        paper_path = self.papers_dir / f"{paper_id}.pdf"
-        return paper_path.exists()
+        """Check if a valid paper exists.
+        A paper is trusted if its size matches the size recorded when it was stored, without parsing the pdf.
+        """
+        paper_path = self._paper_path(paper_id)
+        if not paper_path.exists():
+            return False
+
+        try:
+            info = self.get_paper_info(paper_id)
+        except StorageError:
+            # Stored before papers were validated, validate it once
+            return self._adopt_paper(paper_id)
+        return paper_path.stat().st_size == info.size
+
+    def get_paper_info(self, paper_id: str) -> PaperFileInfo:
+        """Get the size, hash and page count recorded when the paper was stored."""
+        info_path = self._paper_info_path(paper_id)
+        if not info_path.exists():
+            raise StorageError(f"Paper info not found: {paper_id}")
+
+        try:
+            with open(info_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return PaperFileInfo(size=data["size"], sha256=data["sha256"], page_count=data["page_count"])
+        except (IOError, json.JSONDecodeError, KeyError) as e:
+            logger.error(f"Failed to read paper info: {e}")
+            raise StorageError(f"Failed to read paper info: {e}")
+
+    def _store_paper_info(self, paper_id: str, info: PaperFileInfo) -> None:
+        """Atomically store the paper info sidecar."""
+        info_path = self._paper_info_path(paper_id)
+        temp_path = info_path.with_name(f"{info_path.name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({**info.dict(), "stored_at": datetime.now().isoformat()}, f, indent=2)
+            os.replace(temp_path, info_path)
+        except IOError as e:
+            temp_path.unlink(missing_ok=True)
+            logger.error(f"Failed to store paper info: {e}")
+            raise StorageError(f"Failed to store paper info: {e}")
+
+    def _adopt_paper(self, paper_id: str) -> bool:
+        """Validate a paper stored without info, recording its info if valid and removing it otherwise."""
+        paper_path = self._paper_path(paper_id)
+        try:
+            info = self._validate_pdf(paper_path)
+        except StorageError:
+            logger.warning(f"Removing invalid stored paper: {paper_id}")
+            paper_path.unlink(missing_ok=True)
+            return False
+        self._store_paper_info(paper_id, info)
+        return True
+
+    def _validate_pdf(self, path: Path) -> PaperFileInfo:
+        """Check that a file is a complete pdf, returning its size, hash and page count.
+        
+        Raises:
+            StorageError: If the file is empty, truncated or can't be parsed
+        """
+        size = path.stat().st_size
+        if size == 0:
+            raise StorageError(f"Invalid pdf, file is empty: {path.name}")
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            header = f.read(5)
+            f.seek(max(0, size - 1024))
+            trailer = f.read()
+            f.seek(0)
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+
+        if header != b'%PDF-':
+            raise StorageError(f"Invalid pdf, missing header: {path.name}")
+        if b'%%EOF' not in trailer:
+            raise StorageError(f"Invalid pdf, missing trailer, file is likely truncated: {path.name}")
+
+        try:
+            with fitz.open(path) as doc:
+                page_count = doc.page_count
+        except Exception as e:
+            raise StorageError(f"Invalid pdf, failed to parse {path.name}: {e}")
+        if page_count == 0:
+            raise StorageError(f"Invalid pdf, no pages: {path.name}")
+
+        return PaperFileInfo(size=size, sha256=sha256.hexdigest(), page_count=page_count)
 
     def store_metadata(self, paper_id: str, metadata: PaperMetadata) -> None:
         """Store metadata for a paper."""
@@ -39,15 +172,21 @@ class LocalStorage(Storage):
             logger.error(f"Failed to store metadata: {e}")
             raise StorageError(f"Failed to store metadata: {e}")
 
-    def get_paper_writer(self, paper_id: str) -> BinaryIO:
-        """Get a binary writer for the paper."""
-        paper_path = self.papers_dir / f"{paper_id}.pdf"
+    def get_paper_writer(self, paper_id: str) -> AtomicPaperWriter:
+        """Get a binary writer for the paper, writing to a temporary file until committed."""
         try:
-            return open(paper_path, 'wb')
+            return AtomicPaperWriter(self, paper_id)
         except IOError as e:
             logger.error(f"Failed to create paper writer: {e}")
             raise StorageError(f"Failed to create paper writer: {e}")
 
+    def get_paper_path(self, paper_id: str) -> Path:
+        """Get the local path to a paper."""
+        paper_path = self._paper_path(paper_id)
+        if not paper_path.exists():
+            raise StorageError(f"Paper not found: {paper_id}")
+        return paper_path
+
     def get_paper_reader(self, paper_id: str) -> BinaryIO:
         """Get a reader for a paper."""
         paper_path = self.papers_dir / f"{paper_id}.pdf"
@@ -59,6 +198,35 @@ class LocalStorage(Storage):
         except IOError as e:
             raise StorageError(f"Failed to read paper: {e}")
 
+    def store_extracted_text(self, paper_id: str, cache_key: str, page_contents: List[str]) -> None:
+        """Store the extracted text of each page gzipped next to the paper, replacing text extracted under another key."""
+        text_path = self.papers_dir / f"{paper_id}.pages.json.gz"
+        temp_path = text_path.with_name(f"{text_path.name}.{uuid.uuid4().hex}.part")
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                json.dump({"cache_key": cache_key, "page_contents": page_contents}, f)
+            os.replace(temp_path, text_path)
+        except IOError as e:
+            temp_path.unlink(missing_ok=True)
+            logger.error(f"Failed to store extracted text: {e}")
+            raise StorageError(f"Failed to store extracted text: {e}")
+
+    def get_extracted_text(self, paper_id: str, cache_key: str) -> Optional[List[str]]:
+        """Retrieve the extracted text of each page, None if missing or extracted under another key."""
+        text_path = self.papers_dir / f"{paper_id}.pages.json.gz"
+        if not text_path.exists():
+            return None
+
+        try:
+            with gzip.open(text_path, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, EOFError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to read extracted text, ignoring it: {e}")
+            return None
+        if data.get("cache_key") != cache_key:
+            return None
+        return data["page_contents"]
+
     def store_summary(self, paper_id: str, summary: str) -> None:
         """Store a summary for a paper."""
         summary_path = self.summaries_dir / f"{paper_id}.txt"
@@ -154,7 +322,6 @@ class LocalStorage(Storage):
         try:
             with open(metadata_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                print(data)
             return self._dict_to_metadata(data)
         except (IOError, json.JSONDecodeError) as e:
             logger.error(f"Failed to read metadata: {e}")
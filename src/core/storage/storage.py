@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import BinaryIO, ContextManager
-from ..models.paper import PaperMetadata, PaperAnalysis
+from pathlib import Path
+from typing import BinaryIO, ContextManager, Optional
+from ..models.paper import PaperMetadata, PaperAnalysis, PaperFileInfo
 from typing import List
 from ...utils.exceptions import InternalError
 
@@ -9,11 +10,54 @@ class StorageError(InternalError):
     pass
 
 
+class PaperWriter(ABC):
+    """Binary writer for a paper. The paper is only stored once the writer is committed.
+    
+    Used as a context manager, the writer is committed when the block succeeds and aborted otherwise.
+    """
+
+    @abstractmethod
+    def write(self, data: bytes) -> int:
+        pass
+
+    @abstractmethod
+    def seek(self, offset: int, whence: int = 0) -> int:
+        pass
+
+    @abstractmethod
+    def truncate(self, size: Optional[int] = None) -> int:
+        pass
+
+    @abstractmethod
+    def commit(self) -> None:
+        """Validate the written paper and store it. Raises StorageError if it is not valid."""
+        pass
+
+    @abstractmethod
+    def abort(self) -> None:
+        """Discard the written content."""
+        pass
+
+    def __enter__(self) -> "PaperWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
 class Storage(ABC):
     """Abstract base class for paper storage backends."""
     @abstractmethod
     def check_paper_exists(self, paper_id: str) -> bool:
-        """Check if a paper exists."""
+        """Check if a valid paper exists."""
+        pass
+
+    @abstractmethod
+    def get_paper_info(self, paper_id: str) -> PaperFileInfo:
+        """Get the size, hash and page count recorded when the paper was stored."""
         pass
 
     @abstractmethod
@@ -22,21 +66,38 @@ class Storage(ABC):
         pass
 
     @abstractmethod
-    def get_paper_writer(self, paper_id: str) -> ContextManager[BinaryIO]:
+    def get_paper_writer(self, paper_id: str) -> PaperWriter:
         """
-        Get a context manager that provides a binary writer for the paper.
+        Get a binary writer for the paper.
+        The paper is only stored once the writer is committed and the written content is a valid pdf,
+        so a failed or interrupted download never replaces or poisons a stored paper.
         
         Example:
             with storage.get_paper_writer(paper_id) as writer:
-                downloader.download_to_writer(url, writer)
+                write_pdf(writer)
         """
         pass
 
+    @abstractmethod
+    def get_paper_path(self, paper_id: str) -> Path:
+        """Get a local path to the paper, for libraries and worker processes that open documents by path."""
+        pass
+
     @abstractmethod
     def get_paper_reader(self, paper_id: str) -> ContextManager[BinaryIO]:
         """Get a context manager that provides a binary reader for the paper."""
         pass
 
+    @abstractmethod
+    def store_extracted_text(self, paper_id: str, cache_key: str, page_contents: List[str]) -> None:
+        """Store the text extracted from each page of a paper, under a key identifying how it was extracted."""
+        pass
+
+    @abstractmethod
+    def get_extracted_text(self, paper_id: str, cache_key: str) -> Optional[List[str]]:
+        """Retrieve the text extracted from each page of a paper, None if not stored under the given key."""
+        pass
+
     @abstractmethod
     def get_metadata(self, paper_id: str) -> PaperMetadata:
         """Retrieve metadata for a stored paper."""
@@ -1,3 +1,5 @@
+from typing import Optional
+
 class UserFacingError(Exception):
     """Base exception class for errors that can be safely shown to users."""
     def __init__(self, message: str, status_code: int = 400):
@@ -11,3 +13,36 @@ class InternalError(Exception):
     def __init__(self, message: str):
         self.message = message
         super().__init__(self.message)
+
+
+class PaperUnavailableError(UserFacingError):
+    """Raised when a paper exists but its full text can't be downloaded, e.g. it is not in PubMed Central."""
+    NO_PMCID = 'no_pmcid'
+    NOT_ACCESSIBLE = 'not_accessible'
+
+    def __init__(self, message: str, reason: str, status_code: int = 400):
+        self.reason = reason
+        super().__init__(message, status_code)
+
+
+class LLMRateLimitError(UserFacingError):
+    """Raised when the LLM provider rejects a request over its rate limits, or because it is overloaded."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, status_code: int = 503):
+        # Seconds the provider asked to wait before retrying, if it said
+        self.retry_after = retry_after
+        super().__init__(message, status_code)
+
+
+class LLMUnavailableError(UserFacingError):
+    """Raised when a call to the LLM provider fails with a server error, a timeout or a dropped connection."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message, status_code)
+
+
+class PaperTooLargeError(UserFacingError):
+    """Raised when no analysis strategy fits a paper in the token, cost and latency budgets."""
+
+    def __init__(self, message: str, status_code: int = 413):
+        super().__init__(message, status_code)
@@ -0,0 +1,64 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator
+
+@dataclass
+class Observation:
+    """Aggregated observations of a single metric."""
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def dict(self) -> dict:
+        data = asdict(self)
+        data["mean"] = self.total / self.count if self.count else 0.0
+        if not self.count:
+            data["min"] = 0.0
+        return data
+
+class Metrics:
+    """In-process counters and observations, shared by all components."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._observations: Dict[str, Observation] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """Increment a counter, use a negative value to decrement it."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a single observation, e.g. a duration or a size."""
+        with self._lock:
+            self._observations.setdefault(name, Observation()).add(value)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Observe the wall time of the block in seconds, also when it raises."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at)
+
+    def snapshot(self) -> dict:
+        """Get a copy of all counters and observations."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "observations": {name: obs.dict() for name, obs in self._observations.items()}
+            }
+
+# Create the metrics registry at module level, like the logger
+metrics = Metrics()
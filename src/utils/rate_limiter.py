@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+from .metrics import metrics
+
+class TokenBucketRateLimiter:
+    """Token bucket limiting the rate of calls to an external service.
+    
+    Callers are never rejected. Each caller reserves the next free slot in arrival order and sleeps
+    until it is due, so callers are served fairly and throughput stays at the configured rate.
+
+    Example:
+        async with rate_limiter:
+            await client.get(...)
+    """
+
+    def __init__(self, name: str, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            name: Name used for the wait time metrics
+            rate: Allowed calls per second
+            capacity: Maximum burst size, defaults to a single call
+        """
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity or 1
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Reserve the next free slot. Returns the time to wait until it is due, in seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            # Reserve a token, going negative means queueing behind earlier callers
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    async def acquire(self) -> float:
+        """Wait until a call is allowed. Returns the time spent waiting, in seconds."""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        metrics.observe(f"rate_limiter.{self.name}.wait_seconds", wait)
+        return wait
+
+    async def __aenter__(self) -> "TokenBucketRateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        pass
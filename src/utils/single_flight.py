@@ -0,0 +1,43 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+from .metrics import metrics
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single execution.
+    
+    The first caller for a key starts the work, callers arriving while it is in flight wait
+    for its result (or exception) instead of repeating the work. The work runs as its own task,
+    so a caller that goes away (e.g. a closed request) doesn't cancel it for the others.
+
+    Example:
+        await flights.do(f"analysis:{paper_id}", lambda: analyze(paper_id))
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn for the key, or wait for the call already in flight for it."""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+            return await asyncio.shield(future)
+
+        metrics.increment(f"single_flight.{self.name}.coalesced")
+        metrics.increment(f"single_flight.{self.name}.waiting")
+        try:
+            return await asyncio.shield(future)
+        finally:
+            metrics.increment(f"single_flight.{self.name}.waiting", -1)
+
+    def _finish(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Mark the exception as retrieved, every caller may have gone away
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1,30 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass
+class StageLimitsConfig:
+    """Maximum number of papers allowed in each pipeline stage at the same time."""
+    download: int = 4
+    extraction: int = 2
+    llm: int = 4
+
+class StageLimits:
+    """Shared semaphores bounding the concurrency of each pipeline stage.
+    
+    Example:
+        async with stage_limits.download:
+            await download_manager.download(url)
+    """
+
+    def __init__(self, config: Optional[StageLimitsConfig] = None):
+        config = config or StageLimitsConfig()
+        self.config = config
+        self.download = asyncio.Semaphore(config.download)
+        self.extraction = asyncio.Semaphore(config.extraction)
+        self.llm = asyncio.Semaphore(config.llm)
+
+    @property
+    def total(self) -> int:
+        """Number of papers that can be in flight across all stages."""
+        return self.config.download + self.config.extraction + self.config.llm
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import requests
+import json
 from urllib.parse import quote
 from io import StringIO
 
@@ -14,6 +15,55 @@ st.set_page_config(
 # Constants
 API_BASE_URL = "http://localhost:8000"
 
+def read_events(response):
+    """Parse the server-sent events of a streamed response into (event, data) pairs."""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data))
+            event, data = None, []
+
+def show_metadata(metadata):
+    """Display the paper details and abstract in two columns."""
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Paper Details")
+        st.write(f"**Title:** {metadata['title']}")
+        st.write(f"**Paper ID:** {metadata['id']}")
+        st.write(f"**Source URL:** {metadata['url']}")
+    
+    with col2:
+        st.subheader("Abstract")
+        st.write(metadata['abstract'])
+
+def show_table(table):
+    """Display the main table if available."""
+    if not table:
+        st.info("No table data available for this paper.")
+        return
+
+    st.subheader("Main Table")
+    st.info(table['description'])
+    
+    try:
+        # Convert CSV string to DataFrame using StringIO from io module
+        df = pd.read_csv(StringIO(table['csv_content']))
+        st.dataframe(
+            df,
+            use_container_width=True,
+            hide_index=True
+        )
+        
+        if table['footnotes']:
+            st.caption("**Table Footnotes:**")
+            st.caption(table['footnotes'])
+    except Exception as e:
+        st.error(f"Error displaying table: {str(e)}")
+
 # Title and description
 st.title("📚 Paper Analysis Tool")
 st.markdown("Enter a paper URL to analyze its content, get a summary, and view extracted tables.")
@@ -27,52 +77,48 @@ if url:
     
     with tab_analysis:
         try:
-            # Make API call to analysis endpoint
+            # Stream the analysis, each stage is shown as soon as it completes
             response = requests.post(
-                f"{API_BASE_URL}/get-analysis",
-                json={"url": url}
+                f"{API_BASE_URL}/get-analysis/stream",
+                json={"url": url},
+                stream=True
             )
             
             if response.status_code == 200:
-                data = response.json()
-                
-                # Create two columns for metadata
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.subheader("Paper Details")
-                    st.write(f"**Title:** {data['metadata']['title']}")
-                    st.write(f"**Paper ID:** {data['paper_id']}")
-                    st.write(f"**Source URL:** {data['metadata']['url']}")
-                
-                with col2:
-                    st.subheader("Abstract")
-                    st.write(data['metadata']['abstract'])
-                
-                # Display summary
-                st.subheader("Summary")
-                st.write(data['summary'])
-                
-                # Display table if available
-                if data.get('main_table'):
-                    st.subheader("Main Table")
-                    st.info(data['main_table']['description'])
-                    
-                    try:
-                        # Convert CSV string to DataFrame using StringIO from io module
-                        df = pd.read_csv(StringIO(data['main_table']['csv_content']))
-                        st.dataframe(
-                            df,
-                            use_container_width=True,
-                            hide_index=True
-                        )
-                        
-                        if data['main_table']['footnotes']:
-                            st.caption("**Table Footnotes:**")
-                            st.caption(data['main_table']['footnotes'])
-                    except Exception as e:
-                        st.error(f"Error displaying table: {str(e)}")
-                else:
-                    st.info("No table data available for this paper.")
+                status = st.status("Fetching paper metadata...")
+                details = st.container()
+                warnings = st.container()
+                summary_placeholder = st.empty()
+                table_container = st.container()
+                summary = ""
+
+                for event, data in read_events(response):
+                    if event == "metadata":
+                        status.update(label="Downloading paper...")
+                        with details:
+                            show_metadata(data)
+                    elif event == "downloaded":
+                        status.update(label="Extracting text...")
+                    elif event == "extracted":
+                        status.write(f"Extracted {data['page_count']} pages, "
+                                     f"{data['table_candidates']} tables detected")
+                        status.update(label="Generating summary and main table...")
+                    elif event == "summary_delta":
+                        summary += data['text']
+                        summary_placeholder.markdown(f"### Summary\n{summary}")
+                    elif event == "summary":
+                        summary_placeholder.markdown(f"### Summary\n{data['summary']}")
+                    elif event == "table":
+                        with table_container:
+                            show_table(data['table'])
+                    elif event == "done":
+                        # Display parts of the analysis that failed
+                        for error in data.get('errors', []):
+                            warnings.warning(error)
+                        status.update(label="Analysis complete", state="complete", expanded=False)
+                    elif event == "error":
+                        status.update(label="Analysis failed", state="error", expanded=False)
+                        st.error(data.get('error', 'An unknown error occurred'))
                     
             else:
                 # Handle error responses based on exceptions.py structure
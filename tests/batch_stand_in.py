@@ -0,0 +1,227 @@
+"""
+Local stand-in for anthropic's message batches api and openai's batch and files apis.
+
+Responses are generated from the request: a json object built from the requested schema, or a fixed text.
+Every batch ends on its first status check. Requests containing fail_marker fail, as an errored entry
+for anthropic and as a refusal without content for openai.
+
+Example:
+    with BatchStandIn() as stand_in:
+        llm = ClaudeLLM(ClaudeLLMConfig(api_key="test", base_url=stand_in.url))
+        llm = OpenAILLM(OpenAILLMConfig(api_key="test", base_url=f"{stand_in.url}/v1"))
+"""
+import email
+import json
+import re
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+SUMMARY = "A batched summary."
+
+
+def fake_value(schema: dict, defs: dict):
+    """A value matching a json schema."""
+    if "$ref" in schema:
+        return fake_value(defs[schema["$ref"].split("/")[-1]], defs)
+    if "anyOf" in schema:
+        return fake_value(schema["anyOf"][0], defs)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: fake_value(value, defs) for name, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_value(schema.get("items", {}), defs)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return True
+    return "x"
+
+
+def fake_object(schema: dict) -> dict:
+    return fake_value(schema, schema.get("$defs", {}))
+
+
+def claude_content(params: dict) -> List[dict]:
+    """Content blocks answering a Claude request: a tool call, the rest of a prefilled json object or text."""
+    if params.get("tools"):
+        tool = params["tools"][0]
+        return [{"type": "tool_use", "id": "toolu_1", "name": tool["name"], "input": fake_object(tool["input_schema"])}]
+    content = [message for message in params["messages"] if message["role"] == "user"][-1]["content"]
+    text = content if isinstance(content, str) else next(block["text"] for block in content if block["type"] == "text")
+    if params["messages"][-1]["role"] == "assistant":
+        schema = json.loads(re.search(r"JSON schema:\n(.*?)\n\s*Your response", text, re.S).group(1))
+        # The response continues the prefilled "{"
+        return [{"type": "text", "text": json.dumps(fake_object(schema))[1:]}]
+    structure = re.search(r"structure:\n(.*?)\n\s*Your response", text, re.S)
+    if structure:
+        return [{"type": "text", "text": json.dumps({key: "x" for key in json.loads(structure.group(1))})}]
+    return [{"type": "text", "text": SUMMARY}]
+
+
+def openai_content(body: dict) -> str:
+    if "response_format" in body:
+        return json.dumps(fake_object(body["response_format"]["json_schema"]["schema"]))
+    return SUMMARY
+
+
+class BatchStandIn:
+    """Serves the batch apis on a local port in a background thread. The submitted batches are kept in batches."""
+
+    def __init__(self, fail_marker: Optional[str] = None):
+        self.fail_marker = fail_marker
+        # Requests of each submitted batch, in submission order
+        self.batches: List[List[dict]] = []
+        self._batches: Dict[str, dict] = {}
+        self._files: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        handler = type("Handler", (_Handler,), {"stand_in": self})
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self) -> "BatchStandIn":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _fails(self, request: dict) -> bool:
+        return self.fail_marker is not None and self.fail_marker in json.dumps(request)
+
+    # anthropic
+
+    def create_message_batch(self, body: dict) -> dict:
+        batch = {"id": f"msgbatch_{uuid.uuid4().hex}", "requests": body["requests"]}
+        with self._lock:
+            self._batches[batch["id"]] = batch
+            self.batches.append(body["requests"])
+        return self._message_batch(batch, ended=False)
+
+    def message_batch(self, batch_id: str) -> dict:
+        return self._message_batch(self._batches[batch_id], ended=True)
+
+    def _message_batch(self, batch: dict, ended: bool) -> dict:
+        return {
+            "id": batch["id"], "type": "message_batch", "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else len(batch["requests"]), "succeeded": 0, "errored": 0,
+                               "canceled": 0, "expired": 0},
+            "created_at": "2024-01-01T00:00:00Z", "expires_at": "2024-01-02T00:00:00Z", "ended_at": None,
+            "archived_at": None, "cancel_initiated_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch['id']}/results" if ended else None
+        }
+
+    def message_batch_results(self, batch_id: str) -> bytes:
+        lines = []
+        for request in self._batches[batch_id]["requests"]:
+            if self._fails(request):
+                result = {"type": "errored", "error": {"type": "invalid_request_error", "message": "Refused"}}
+            else:
+                result = {"type": "succeeded", "message": {
+                    "id": "msg_1", "type": "message", "role": "assistant", "model": request["params"]["model"],
+                    "content": claude_content(request["params"]), "stop_reason": "end_turn", "stop_sequence": None,
+                    "usage": {"input_tokens": 10, "output_tokens": 5}
+                }}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}))
+        return "\n".join(lines).encode()
+
+    # openai
+
+    def create_file(self, content_type: str, body: bytes) -> dict:
+        message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        content = next(part.get_payload(decode=True) for part in message.walk()
+                       if part.get_param("name", header="content-disposition") == "file")
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self._lock:
+            self._files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed"}
+
+    def create_batch(self, body: dict) -> dict:
+        requests = [json.loads(line) for line in self._files[body["input_file_id"]].decode().splitlines() if line]
+        batch = {"id": f"batch_{uuid.uuid4().hex}", "input_file_id": body["input_file_id"], "requests": requests}
+        with self._lock:
+            self._batches[batch["id"]] = batch
+            self.batches.append(requests)
+        return self._batch(batch)
+
+    def batch(self, batch_id: str) -> dict:
+        batch = self._batches[batch_id]
+        with self._lock:
+            if "output_file_id" not in batch:
+                batch["output_file_id"] = f"file-{uuid.uuid4().hex}"
+                self._files[batch["output_file_id"]] = "\n".join(
+                    json.dumps(self._batch_output(request)) for request in batch["requests"]
+                ).encode()
+        return self._batch(batch)
+
+    def _batch(self, batch: dict) -> dict:
+        ended = "output_file_id" in batch
+        return {"id": batch["id"], "object": "batch", "endpoint": "/v1/chat/completions",
+                "input_file_id": batch["input_file_id"], "completion_window": "24h",
+                "status": "completed" if ended else "in_progress", "created_at": 0,
+                "output_file_id": batch.get("output_file_id"), "error_file_id": None}
+
+    def _batch_output(self, request: dict) -> dict:
+        body = request["body"]
+        if self._fails(request):
+            message = {"role": "assistant", "content": None, "refusal": "Refused"}
+        else:
+            message = {"role": "assistant", "content": openai_content(body)}
+        return {"id": "batch_req_1", "custom_id": request["custom_id"], "error": None, "response": {
+            "status_code": 200, "request_id": "req_1", "body": {
+                "id": "chatcmpl_1", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop", "message": message}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+            }
+        }}
+
+    def file_content(self, file_id: str) -> bytes:
+        return self._files[file_id]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    stand_in: BatchStandIn
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if path == "/v1/messages/batches":
+            self._json(self.stand_in.create_message_batch(json.loads(body)))
+        elif path == "/v1/files":
+            self._json(self.stand_in.create_file(self.headers["Content-Type"], body))
+        elif path == "/v1/batches":
+            self._json(self.stand_in.create_batch(json.loads(body)))
+        else:
+            self._send(404, "text/plain", b"Not found")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if match := re.fullmatch(r"/v1/messages/batches/(\w+)/results", path):
+            self._send(200, "application/binary", self.stand_in.message_batch_results(match.group(1)))
+        elif match := re.fullmatch(r"/v1/messages/batches/(\w+)", path):
+            self._json(self.stand_in.message_batch(match.group(1)))
+        elif match := re.fullmatch(r"/v1/batches/(\w+)", path):
+            self._json(self.stand_in.batch(match.group(1)))
+        elif match := re.fullmatch(r"/v1/files/([\w-]+)/content", path):
+            self._send(200, "application/binary", self.stand_in.file_content(match.group(1)))
+        else:
+            self._send(404, "text/plain", b"Not found")
+
+    def _json(self, data: dict) -> None:
+        self._send(200, "application/json", json.dumps(data).encode())
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,24 @@
+from src.core.analyzer.analysis_estimator import TEXT, AnalysisEstimator
+from src.core.analyzer.extractor.content_pruner import ContentPruner, ContentPrunerConfig
+from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzerConfig
+from src.core.models.paper import PaperContent
+
+# 10 pages of 1000 estimated tokens, different for each page so they aren't taken for running headers
+CONTENT = PaperContent(title="Title", abstract="Abstract",
+                       page_contents=[f"{letter}ord " * 800 for letter in "abcdefghij"])
+
+
+def estimate(**text_config):
+    pruner = ContentPruner(ContentPrunerConfig(token_budgets={"summary": 5000, "table": 5000}))
+    return AnalysisEstimator(pruner, text_config=TextDumpAnalyzerConfig(**text_config)).estimate(TEXT, CONTENT)
+
+
+def test_chunked_summary_follows_the_text_analyzer_config():
+    large_chunks = estimate(chunk_tokens=5000)
+    small_chunks = estimate(chunk_tokens=1000)
+    serial_chunks = estimate(chunk_tokens=1000, max_parallel_chunks=1)
+
+    # Chunks and their reduction, then the table
+    assert large_chunks.calls == 2 + 1 + 1
+    assert small_chunks.calls == 10 + 1 + 1
+    assert serial_chunks.latency_seconds > small_chunks.latency_seconds
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from src.core.batch_service import BatchService
+from src.core.models.batch import BatchItemStatus
+from src.utils.exceptions import InternalError, PaperUnavailableError
+from src.utils.stage_limits import StageLimits
+
+UNAVAILABLE = "https://pubmed.ncbi.nlm.nih.gov/1/"
+CHUNK_FAILED = "https://pubmed.ncbi.nlm.nih.gov/2/"
+FOUND = "https://pubmed.ncbi.nlm.nih.gov/3/"
+
+
+class FakePaperService:
+    """Prefetches with fixed errors, recording the papers analyzed."""
+
+    def __init__(self, errors: Dict[str, Optional[Exception]]):
+        self.errors = errors
+        self.analyzed: List[str] = []
+
+    async def prefetch(self, urls: List[str]) -> Dict[str, Optional[Exception]]:
+        return self.errors
+
+    async def get_analysis(self, url: str):
+        self.analyzed.append(url)
+        return None
+
+
+def test_only_definite_prefetch_errors_fail_papers_right_away():
+    paper_service = FakePaperService({
+        UNAVAILABLE: PaperUnavailableError("Not in PMC", reason=PaperUnavailableError.NO_PMCID),
+        CHUNK_FAILED: InternalError("Error fetching metadata: 502 Bad Gateway"),
+        FOUND: None
+    })
+
+    async def run():
+        service = BatchService(paper_service, StageLimits())
+        job = service.submit([UNAVAILABLE, CHUNK_FAILED, FOUND])
+        await asyncio.gather(*service._tasks)
+        return job
+
+    job = asyncio.run(run())
+
+    assert sorted(paper_service.analyzed) == [CHUNK_FAILED, FOUND]
+    assert [item.status for item in job.items] == [BatchItemStatus.FAILED, BatchItemStatus.DONE, BatchItemStatus.DONE]
+    assert job.items[0].error == "Not in PMC"
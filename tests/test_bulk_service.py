@@ -0,0 +1,78 @@
+import asyncio
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from batch_stand_in import SUMMARY, BatchStandIn
+from src.core.analyzer.extractor.content_extractor import ContentExtractor, ContentExtractorConfig
+from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzer, TextDumpAnalyzerConfig
+from src.core.bulk_service import BulkService
+from src.core.llm.batch_llm import BatchLLM, BatchLLMConfig
+from src.core.llm.claude_llm import ClaudeBatchBackend, ClaudeLLM, ClaudeLLMConfig
+from src.core.llm.openai_llm import OpenAIBatchBackend, OpenAILLM, OpenAILLMConfig
+from src.core.storage.local_storage import LocalStorage
+from src.utils.exceptions import InternalError
+from src.utils.stage_limits import StageLimits, StageLimitsConfig
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+PAPERS = ["38285791", "39040441"]
+
+
+def create_backend(provider: str, url: str):
+    if provider == "openai":
+        return OpenAIBatchBackend(OpenAILLM(OpenAILLMConfig(api_key="test", base_url=f"{url}/v1", max_retries=0)))
+    return ClaudeBatchBackend(ClaudeLLM(ClaudeLLMConfig(api_key="test", base_url=url, max_retries=0)))
+
+
+def title(paper_id: str) -> str:
+    return json.loads((DATA_DIR / "metadata" / f"{paper_id}.json").read_text())["title"]
+
+
+@pytest.fixture
+def storage(tmp_path: Path) -> LocalStorage:
+    storage = LocalStorage(tmp_path)
+    for paper_id in PAPERS:
+        shutil.copy(DATA_DIR / "papers" / f"{paper_id}.pdf", storage.papers_dir)
+        shutil.copy(DATA_DIR / "metadata" / f"{paper_id}.json", storage.metadata_dir)
+    return storage
+
+
+def run_bulk(storage: LocalStorage, stand_in: BatchStandIn, provider: str) -> dict:
+    llm = BatchLLM(create_backend(provider, stand_in.url),
+                   BatchLLMConfig(poll_seconds=0.01, settle_seconds=0.05, collect_seconds=60))
+    extractor = ContentExtractor(storage, ContentExtractorConfig(max_workers=1))
+    analyzer = TextDumpAnalyzer(storage, extractor, llm, StageLimits(StageLimitsConfig(llm=len(PAPERS))),
+                                config=TextDumpAnalyzerConfig(max_parallel_chunks=1000))
+    try:
+        return asyncio.run(BulkService(storage, analyzer, llm).run(PAPERS))
+    finally:
+        extractor.close()
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_papers_are_analyzed_in_shared_batches(storage: LocalStorage, provider: str):
+    with BatchStandIn() as stand_in:
+        errors = run_bulk(storage, stand_in, provider)
+
+    assert errors == {paper_id: None for paper_id in PAPERS}
+    for paper_id in PAPERS:
+        assert storage.get_summary(paper_id) == SUMMARY
+        assert storage.get_table(paper_id).csv_content
+    # The first round holds the prompts of every paper, follow-up prompts go in later rounds
+    first = json.dumps(stand_in.batches[0])
+    assert all(title(paper_id)[:20] in first for paper_id in PAPERS)
+    assert len(stand_in.batches) < sum(len(batch) for batch in stand_in.batches)
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_failed_requests_fail_only_their_paper(storage: LocalStorage, provider: str):
+    failing, succeeding = PAPERS
+    with BatchStandIn(fail_marker=title(failing)[:20]) as stand_in:
+        errors = run_bulk(storage, stand_in, provider)
+
+    assert isinstance(errors[failing], InternalError)
+    assert errors[succeeding] is None
+    assert not storage.is_paper_analyzed(failing)
+    assert storage.get_summary(succeeding) == SUMMARY
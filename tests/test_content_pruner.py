@@ -0,0 +1,53 @@
+from src.core.analyzer.extractor.content_pruner import ContentPruner, ContentPrunerConfig
+from src.core.llm.token_estimator import estimate_tokens
+from src.core.models.paper import PaperContent
+
+
+def page(letter: str) -> str:
+    """A page of 100 estimated tokens, different for each letter so it isn't taken for a running header."""
+    return f"{letter}ord " * 80
+
+
+def content(pages) -> PaperContent:
+    return PaperContent(title="Title", abstract="Abstract", page_contents=list(pages))
+
+
+def pruner(**token_budgets) -> ContentPruner:
+    return ContentPruner(ContentPrunerConfig(token_budgets=token_budgets))
+
+
+def test_pages_are_kept_in_order_within_the_budget():
+    pages = [page(letter) for letter in "abcde"]
+
+    pruned = pruner(summary=250).prune("paper", content(pages), "summary").page_contents
+
+    assert len(pruned) == 5
+    assert pruned[:2] == pages[:2]
+    # The first page over budget is truncated, the following pages are dropped
+    assert pruned[2] == pages[2][:200]
+    assert pruned[3:] == ["", ""]
+    assert sum(estimate_tokens(page) for page in pruned) <= 250
+
+
+def test_table_budget_keeps_pages_with_tables_first():
+    pages = [page("a"), page("b"), "Table 1 shows " + page("c")[:386]]
+
+    pruned = pruner(table=200).prune("paper", content(pages), "table").page_contents
+
+    assert pruned == [pages[0], "", pages[2]]
+
+
+def test_prompt_without_budget_is_not_truncated():
+    pages = [page(letter) for letter in "abc"]
+
+    assert pruner(summary=10).prune("paper", content(pages), "chunks").page_contents == pages
+
+
+def test_boilerplate_is_dropped_before_the_budget():
+    pages = ["Results\nThe results.\nReferences\n1. Someone, A paper, 2020", "Discussion\nThe discussion."]
+
+    pruner_ = pruner(summary=1000)
+    pruned = pruner_.prune("paper", content(pages), "summary").page_contents
+
+    assert pruned == ["Results\nThe results.", "Discussion\nThe discussion."]
+    assert pruner_.estimate_tokens(content(pages)) == sum(estimate_tokens(page) for page in pruned)
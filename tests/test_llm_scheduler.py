@@ -0,0 +1,170 @@
+import asyncio
+import json
+import time
+from email.utils import formatdate
+
+import anthropic
+import httpx
+import openai
+import pytest
+from pydantic import BaseModel
+
+from batch_stand_in import claude_content, openai_content
+from src.core.llm.claude_llm import ClaudeLLM, ClaudeLLMConfig
+from src.core.llm.llm_scheduler import LLMPriority, LLMScheduler, LLMSchedulerConfig, llm_priority, parse_retry_after
+from src.core.llm.openai_llm import OpenAILLM, OpenAILLMConfig
+from src.core.llm.scheduled_llm import ScheduledLLM
+from src.utils.exceptions import LLMRateLimitError, LLMUnavailableError
+
+UNLIMITED = dict(requests_per_minute=None, tokens_per_minute=None)
+
+
+def test_queued_requests_are_sent_by_priority_then_arrival():
+    scheduler = LLMScheduler("test", LLMSchedulerConfig(initial_concurrency=1, max_concurrency=1, **UNLIMITED))
+    sent = []
+
+    async def request(name: str, priority: LLMPriority, release: asyncio.Event = None):
+        async def call():
+            sent.append(name)
+            if release is not None:
+                await release.wait()
+        with llm_priority(priority):
+            await scheduler.run(call, tokens=1)
+
+    async def run():
+        release = asyncio.Event()
+        blocking = asyncio.ensure_future(request("blocking", LLMPriority.INTERACTIVE, release))
+        await asyncio.sleep(0)
+        queued = [asyncio.ensure_future(request(name, priority)) for name, priority in [
+            ("batch 1", LLMPriority.BATCH), ("interactive 1", LLMPriority.INTERACTIVE),
+            ("batch 2", LLMPriority.BATCH), ("interactive 2", LLMPriority.INTERACTIVE)
+        ]]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocking, *queued)
+
+    asyncio.run(run())
+    assert sent == ["blocking", "interactive 1", "interactive 2", "batch 1", "batch 2"]
+
+
+def test_rate_limit_cuts_concurrency_once_per_round_and_successes_grow_it():
+    scheduler = LLMScheduler("test", LLMSchedulerConfig(initial_concurrency=4, backoff_factor=0.5, **UNLIMITED))
+    attempts = {}
+
+    async def request(name: str):
+        async def call():
+            attempts[name] = attempts.get(name, 0) + 1
+            await asyncio.sleep(0.01)
+            if attempts[name] == 1:
+                raise LLMRateLimitError("Rate limited", retry_after=0)
+            return name
+        return await scheduler.run(call, tokens=1)
+
+    async def run():
+        # Requests in flight together are rate limited together, concurrency is only halved once
+        return await asyncio.gather(*(request(f"request {index}") for index in range(4)))
+
+    assert asyncio.run(run()) == [f"request {index}" for index in range(4)]
+    assert all(count == 2 for count in attempts.values())
+    # Halved to 2, then grown by 1/concurrency for each of the 4 retries that succeeded
+    assert 2 < scheduler.concurrency < 4
+
+
+def test_rate_limited_request_is_retried_after_retry_after():
+    scheduler = LLMScheduler("test", LLMSchedulerConfig(**UNLIMITED))
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise LLMRateLimitError("Rate limited", retry_after=0.2)
+        return "result"
+
+    assert asyncio.run(scheduler.run(call, tokens=1)) == "result"
+    assert attempts[1] - attempts[0] >= 0.2
+
+
+def test_rate_limit_error_is_raised_after_max_retries():
+    scheduler = LLMScheduler("test", LLMSchedulerConfig(max_retries=2, **UNLIMITED))
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise LLMRateLimitError("Rate limited", retry_after=0)
+
+    with pytest.raises(LLMRateLimitError):
+        asyncio.run(scheduler.run(call, tokens=1))
+    assert len(attempts) == 3
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+    assert parse_retry_after({"retry-after": "3"}) == 3
+    assert 55 < parse_retry_after({"retry-after": formatdate(time.time() + 60, usegmt=True)}) <= 60
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"retry-after": "soon"}) is None
+
+
+class Answer(BaseModel):
+    text: str
+
+
+def provider_response(provider: str, request: httpx.Request) -> dict:
+    """A successful response of the provider to the request."""
+    body = json.loads(request.content)
+    if provider == "openai":
+        return {"id": "chatcmpl_1", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": openai_content(body)}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}}
+    return {"id": "msg_1", "type": "message", "role": "assistant", "model": body["model"],
+            "content": claude_content(body), "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": 10, "output_tokens": 5}}
+
+
+def create_llm(provider: str, transport: httpx.MockTransport):
+    http_client = httpx.AsyncClient(transport=transport)
+    if provider == "openai":
+        llm = OpenAILLM(OpenAILLMConfig(api_key="test", max_retries=0))
+        llm.client = openai.AsyncOpenAI(api_key="test", max_retries=0, http_client=http_client)
+    else:
+        llm = ClaudeLLM(ClaudeLLMConfig(api_key="test", max_retries=0))
+        llm.client = anthropic.AsyncAnthropic(api_key="test", max_retries=0, http_client=http_client)
+    return llm
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_server_error_is_retried_after_a_backoff(provider: str):
+    statuses = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        statuses.append(500 if not statuses else 200)
+        if statuses[-1] == 500:
+            return httpx.Response(500, json={"error": {"type": "api_error", "message": "Internal server error"}})
+        return httpx.Response(200, json=provider_response(provider, request))
+
+    scheduler = LLMScheduler("test", LLMSchedulerConfig(retry_backoff=0.01, **UNLIMITED))
+    llm = ScheduledLLM(create_llm(provider, httpx.MockTransport(handler)), scheduler)
+
+    answer = asyncio.run(llm.chat("prompt", Answer))
+
+    assert answer.text == "x"
+    assert statuses == [500, 200]
+    # A server error doesn't slow the other requests down
+    assert scheduler.concurrency > LLMSchedulerConfig().initial_concurrency
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "openai"])
+def test_connection_error_is_raised_after_max_retries(provider: str):
+    attempts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(1)
+        raise httpx.ConnectError("Connection refused")
+
+    scheduler = LLMScheduler("test", LLMSchedulerConfig(max_retries=2, retry_backoff=0.01, **UNLIMITED))
+    llm = ScheduledLLM(create_llm(provider, httpx.MockTransport(handler)), scheduler)
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(llm.chat("prompt", Answer))
+    assert len(attempts) == 3
@@ -0,0 +1,59 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from src.core.storage.local_storage import LocalStorage
+from src.core.storage.storage import StorageError
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+PDF = (DATA_DIR / "papers" / "38285791.pdf").read_bytes()
+
+
+def part_files(storage: LocalStorage):
+    return list(storage.papers_dir.glob("*.part"))
+
+
+def test_commit_stores_the_validated_paper_with_its_info(tmp_path: Path):
+    storage = LocalStorage(tmp_path)
+    writer = storage.get_paper_writer("paper")
+    writer.write(PDF[:1000])
+    assert not storage.check_paper_exists("paper")
+    writer.write(PDF[1000:])
+
+    info = writer.commit()
+
+    assert storage._paper_path("paper").read_bytes() == PDF
+    assert info.size == len(PDF)
+    assert info.sha256 == hashlib.sha256(PDF).hexdigest()
+    assert storage.get_paper_info("paper") == info
+    assert storage.check_paper_exists("paper")
+    assert part_files(storage) == []
+
+
+def test_invalid_pdf_is_not_committed_and_keeps_the_stored_paper(tmp_path: Path):
+    storage = LocalStorage(tmp_path)
+    writer = storage.get_paper_writer("paper")
+    writer.write(PDF)
+    writer.commit()
+
+    writer = storage.get_paper_writer("paper")
+    # Truncated midway, e.g. a dropped connection
+    writer.write(PDF[:len(PDF) // 2])
+    with pytest.raises(StorageError):
+        writer.commit()
+
+    assert storage._paper_path("paper").read_bytes() == PDF
+    assert storage.check_paper_exists("paper")
+    assert part_files(storage) == []
+
+
+def test_abort_discards_the_written_content(tmp_path: Path):
+    storage = LocalStorage(tmp_path)
+    writer = storage.get_paper_writer("paper")
+    writer.write(PDF)
+
+    writer.abort()
+
+    assert not storage.check_paper_exists("paper")
+    assert part_files(storage) == []
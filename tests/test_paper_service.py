@@ -0,0 +1,65 @@
+import asyncio
+import shutil
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Type
+
+from pydantic import BaseModel
+
+from batch_stand_in import fake_object
+from src.core.analyzer.extractor.content_extractor import ContentExtractor, ContentExtractorConfig
+from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzer
+from src.core.identifier.identifier import Identifier
+from src.core.llm.base_llm import BaseLLM
+from src.core.paper_service import PaperService
+from src.core.storage.local_storage import LocalStorage
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+PAPER_ID = "38285791"
+URL = f"https://pubmed.ncbi.nlm.nih.gov/{PAPER_ID}/"
+SUMMARY = "A stored summary."
+
+
+class RecordingLLM(BaseLLM):
+    """Answers from the requested schema, recording the calls made."""
+
+    def __init__(self):
+        self.calls: List[str] = []
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        self.calls.append("chat")
+        return response_model(**fake_object(response_model.model_json_schema()))
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        self.calls.append("stream")
+        yield "A generated summary."
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        self.calls.append("chat_with_image")
+        return response_model(**fake_object(response_model.model_json_schema()))
+
+
+class NoDownloads:
+    async def download(self, url: str):
+        raise AssertionError(f"Downloaded {url} again")
+
+
+def test_partial_analysis_generates_only_the_missing_part(tmp_path: Path):
+    storage = LocalStorage(tmp_path)
+    shutil.copy(DATA_DIR / "papers" / f"{PAPER_ID}.pdf", storage.papers_dir)
+    shutil.copy(DATA_DIR / "metadata" / f"{PAPER_ID}.json", storage.metadata_dir)
+    # An earlier analysis stored the summary but failed to generate the table
+    storage.store_summary(PAPER_ID, SUMMARY)
+    llm = RecordingLLM()
+    extractor = ContentExtractor(storage, ContentExtractorConfig(max_workers=1))
+    service = PaperService(NoDownloads(), storage, Identifier(), TextDumpAnalyzer(storage, extractor, llm))
+
+    try:
+        analysis = asyncio.run(service.get_analysis(URL))
+    finally:
+        extractor.close()
+
+    assert analysis.summary == SUMMARY
+    assert analysis.main_table is not None
+    assert "stream" not in llm.calls
+    assert storage.is_paper_analyzed(PAPER_ID)
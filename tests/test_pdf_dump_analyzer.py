@@ -0,0 +1,71 @@
+import asyncio
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import AsyncIterator, List, Tuple
+
+import anthropic
+import httpx
+
+from batch_stand_in import claude_content
+from src.core.analyzer.pdf_dump_analyzer import PdfDumpAnalyzer
+from src.core.llm.claude_llm import ClaudeLLM, ClaudeLLMConfig
+from src.core.storage.local_storage import LocalStorage
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+PAPER_ID = "38285791"
+
+
+def sse(event: dict) -> bytes:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+class MessageStream(httpx.AsyncByteStream):
+    """A streamed message answering the request, started after a delay."""
+
+    def __init__(self, params: dict, delay: float, started: List[float]):
+        self.params = params
+        self.delay = delay
+        self.started = started
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.delay)
+        self.started.append(time.monotonic())
+        yield sse({"type": "message_start", "message": {
+            "id": "msg_1", "type": "message", "role": "assistant", "model": self.params["model"], "content": [],
+            "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": 1}}})
+        yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        text = claude_content(self.params)[0]["text"]
+        yield sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}})
+        yield sse({"type": "content_block_stop", "index": 0})
+        yield sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                   "usage": {"output_tokens": 5}})
+        yield sse({"type": "message_stop"})
+
+
+def test_table_prompt_is_sent_once_the_summary_prompt_has_cached_the_pdf(tmp_path: Path):
+    storage = LocalStorage(tmp_path)
+    shutil.copy(DATA_DIR / "papers" / f"{PAPER_ID}.pdf", storage.papers_dir)
+    shutil.copy(DATA_DIR / "metadata" / f"{PAPER_ID}.json", storage.metadata_dir)
+    sent: List[Tuple[str, float]] = []
+    started: List[float] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = json.loads(request.content)
+        prompt = params["messages"][0]["content"][-1]["text"]
+        sent.append(("summary" if '"summary"' in prompt else "table", time.monotonic()))
+        return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                              stream=MessageStream(params, 0.2, started))
+
+    llm = ClaudeLLM(ClaudeLLMConfig(api_key="test", max_retries=0))
+    llm.client = anthropic.AsyncAnthropic(api_key="test", max_retries=0,
+                                          http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    analysis = asyncio.run(PdfDumpAnalyzer(storage, llm).analyze_paper(PAPER_ID))
+
+    assert analysis.summary == "x"
+    assert analysis.main_table.csv_content == "x"
+    # No separate warm up call, the pdf is sent once per prompt
+    assert [name for name, _ in sent] == ["summary", "table"]
+    assert sent[1][1] >= started[0]
@@ -0,0 +1,102 @@
+import asyncio
+import io
+from typing import List
+
+import httpx
+import pytest
+
+from src.core.downloader.pubmed_downloader import PubMedDownloader, PubMedDownloaderConfig
+from src.utils.exceptions import PaperUnavailableError, UserFacingError
+
+PDF = b"%PDF-1.4 " + bytes(range(256)) * 64
+
+
+def dropped_after(data: bytes):
+    """A response body that drops the connection after data."""
+    async def body():
+        yield data
+        raise httpx.ReadError("Connection dropped")
+    return body()
+
+
+def test_resume_restarts_on_a_mismatched_range():
+    requests: List[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        headers = {"Content-Type": "application/pdf"}
+        if len(requests) == 1:
+            return httpx.Response(200, headers=headers, content=dropped_after(PDF[:1000]))
+        if len(requests) == 2:
+            # Resumed at a range other than the one requested
+            headers["Content-Range"] = f"bytes 500-{len(PDF) - 1}/{len(PDF)}"
+            return httpx.Response(206, headers=headers, content=PDF[500:])
+        return httpx.Response(200, headers=headers, content=PDF)
+
+    downloader = PubMedDownloader(PubMedDownloaderConfig(email="test@example.com", chunk_size=100))
+    downloader.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    writer = io.BytesIO()
+
+    asyncio.run(downloader._download_pdf("https://pmc.test/pdf/", writer))
+
+    assert writer.getvalue() == PDF
+    assert [request.headers.get("Range") for request in requests] == [None, "bytes=1000-", None]
+
+
+@pytest.mark.parametrize("status, content_type, unavailable", [
+    (404, "text/html", True),
+    (410, "text/html", True),
+    (200, "text/html", True),
+    # Access denied may only last a while, e.g. a client blocked for too many requests
+    (403, "text/html", False),
+])
+def test_only_definite_answers_mark_the_pdf_unavailable(status: int, content_type: str, unavailable: bool):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(status, headers={"Content-Type": content_type}, text="Not a pdf")
+
+    downloader = PubMedDownloader(PubMedDownloaderConfig(email="test@example.com"))
+    downloader.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    with pytest.raises(UserFacingError) as error:
+        asyncio.run(downloader._download_pdf("https://pmc.test/pdf/", io.BytesIO()))
+
+    assert isinstance(error.value, PaperUnavailableError) == unavailable
+    assert error.value.status_code == status
+
+
+ELINK = ('<?xml version="1.0" encoding="UTF-8" ?>\n<!DOCTYPE eLinkResult PUBLIC "-//NLM//DTD elink 20101123//EN" '
+         '"https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20101123/elink.dtd">\n<eLinkResult><LinkSet><DbFrom>pubmed</DbFrom>'
+         '<IdList><Id>1</Id></IdList><LinkSetDb><DbTo>pmc</DbTo><LinkName>pubmed_pmc</LinkName>'
+         '<Link><Id>100</Id></Link></LinkSetDb></LinkSet></eLinkResult>')
+
+
+def create_downloader(handler) -> PubMedDownloader:
+    downloader = PubMedDownloader(PubMedDownloaderConfig(email="test@example.com", requests_per_second=1000,
+                                                         eutils_retry_backoff=0.01))
+    downloader.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return downloader
+
+
+def test_eutils_server_errors_are_retried():
+    statuses = [503, 429]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if statuses:
+            return httpx.Response(statuses.pop(0), text="Busy")
+        return httpx.Response(200, headers={"Content-Type": "text/xml"}, text=ELINK)
+
+    assert asyncio.run(create_downloader(handler).resolve_pmcids(["1"])) == {"1": "100"}
+    assert statuses == []
+
+
+def test_eutils_client_errors_are_not_retried():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(400, text="Bad request")
+
+    results = asyncio.run(create_downloader(handler).resolve_pmcids(["1"]))
+
+    assert isinstance(results["1"], Exception)
+    assert len(requests) == 1
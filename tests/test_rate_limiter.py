@@ -0,0 +1,34 @@
+import pytest
+
+from src.utils import rate_limiter
+from src.utils.rate_limiter import TokenBucketRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock standing still until advanced."""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_up_to_capacity_then_queues_at_rate(clock):
+    limiter = TokenBucketRateLimiter("test", rate=10, capacity=3)
+
+    waits = [limiter.reserve() for _ in range(5)]
+
+    assert waits == pytest.approx([0, 0, 0, 0.1, 0.2])
+
+
+def test_tokens_refill_at_rate_up_to_capacity(clock):
+    limiter = TokenBucketRateLimiter("test", rate=10, capacity=2)
+    assert [limiter.reserve() for _ in range(2)] == [0, 0]
+
+    clock[0] += 0.1
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == pytest.approx(0.1)
+
+    # A long pause refills no more than the capacity
+    clock[0] += 60
+    assert [limiter.reserve() for _ in range(2)] == [0, 0]
+    assert limiter.reserve() == pytest.approx(0.1)
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+from src.core.llm import response_cache
+from src.core.llm.response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock standing still until advanced."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_responses_expire_after_their_ttl(tmp_path: Path, clock):
+    cache = ResponseCache(tmp_path, ttl_seconds=60)
+    cache.put("default", "a")
+    cache.put("short", "b", ttl_seconds=10)
+
+    clock[0] += 30
+    assert cache.get("default") == "a"
+    assert cache.get("short") is None
+
+    clock[0] += 30
+    assert cache.get("default") is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_least_recently_used_responses_are_evicted_over_max_bytes(tmp_path: Path, clock):
+    cache = ResponseCache(tmp_path, max_bytes=10)
+    cache.put("first", "aaaa")
+    cache.put("second", "bbbb")
+    assert cache.get("first") == "aaaa"
+
+    cache.put("third", "cccc")
+
+    assert cache.get("second") is None
+    assert cache.get("first") == "aaaa"
+    assert cache.get("third") == "cccc"
+    # Responses over the whole cache size are not cached
+    cache.put("large", "x" * 11)
+    assert cache.get("large") is None
+    assert cache.get("first") == "aaaa"
+
+
+def test_index_is_rebuilt_on_restart(tmp_path: Path, clock):
+    ResponseCache(tmp_path).put("key", "value")
+
+    cache = ResponseCache(tmp_path)
+
+    assert cache.get("key") == "value"
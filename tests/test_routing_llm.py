@@ -0,0 +1,86 @@
+import asyncio
+from typing import AsyncIterator, List, Optional, Type
+
+from pydantic import BaseModel
+
+from src.core.llm.base_llm import BaseLLM
+from src.core.llm.routing_llm import TEXT_TASKS, LLMRoute, RoutingLLM, RoutingLLMConfig
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class NamedLLM(BaseLLM):
+    """Answers with its name after delay seconds, recording the tasks it was called for."""
+
+    def __init__(self, name: str, delay: float = 0):
+        self.name = name
+        self.delay = delay
+        self.tasks: List[str] = []
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        self.tasks.append("chat")
+        await asyncio.sleep(self.delay)
+        return response_model(text=self.name)
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        self.tasks.append("stream")
+        await asyncio.sleep(self.delay)
+        yield self.name
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        self.tasks.append("chat_with_image")
+        await asyncio.sleep(self.delay)
+        return response_model(text=self.name)
+
+
+def test_small_text_route_skips_images():
+    small, large = NamedLLM("small"), NamedLLM("large")
+    llm = RoutingLLM({"large": large, "small": small},
+                     [LLMRoute("small", tasks=TEXT_TASKS, max_tokens=1000), LLMRoute("large")])
+
+    async def run():
+        assert (await llm.chat("short", Answer)).text == "small"
+        assert (await llm.chat_with_image("short", b"png", "image/png", Answer)).text == "large"
+        assert [delta async for delta in llm.stream("short")] == ["small"]
+
+    asyncio.run(run())
+    assert small.tasks == ["chat", "stream"]
+    assert large.tasks == ["chat_with_image"]
+
+
+class GatedStreamLLM(NamedLLM):
+    """Streams its name once the gate opens, recording whether the stream was closed."""
+
+    def __init__(self, name: str, gate: asyncio.Event):
+        super().__init__(name)
+        self.gate = gate
+        self.closed = False
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        try:
+            await self.gate.wait()
+            yield self.name
+            yield " more"
+        finally:
+            self.closed = True
+
+
+def test_hedged_stream_closes_the_loser_finishing_at_once():
+    async def run():
+        gate = asyncio.Event()
+        primary, hedge = GatedStreamLLM("primary", gate), GatedStreamLLM("hedge", gate)
+        llm = RoutingLLM({"primary": primary, "hedge": hedge}, [LLMRoute("primary", hedge_llm="hedge")],
+                         RoutingLLMConfig(min_samples=1))
+        # Hedged right away, then both streams start in the same step
+        llm._record("primary", "stream", 0.001)
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        deltas = llm.stream("prompt")
+        first = await anext(deltas)
+        loser = hedge if first == "primary" else primary
+        assert loser.closed
+        assert "".join([first] + [delta async for delta in deltas]) == f"{first} more"
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from src.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+        # The key is free again once the call is done
+        assert await flights.do("key", work) == "result"
+        return results
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert len(calls) == 2
+
+
+def test_error_reaches_the_joined_callers():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    async def run():
+        flights = SingleFlight("test")
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_cancelled_leader_does_not_cancel_the_work():
+    async def run():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == "result"
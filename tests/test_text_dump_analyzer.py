@@ -0,0 +1,59 @@
+import asyncio
+import shutil
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Type
+
+from pydantic import BaseModel
+
+from batch_stand_in import fake_object
+from src.core.analyzer.extractor.content_extractor import ContentExtractor, ContentExtractorConfig
+from src.core.analyzer.extractor.content_pruner import ContentPruner, ContentPrunerConfig
+from src.core.analyzer.text_dump_analyzer import TextDumpAnalyzer
+from src.core.llm.base_llm import BaseLLM
+from src.core.storage.local_storage import LocalStorage
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+PAPER_ID = "38285791"
+
+
+class OrderedLLM(BaseLLM):
+    """Streams the summary after a delay, recording the calls and the summary start in order."""
+
+    def __init__(self):
+        self.events: List[str] = []
+
+    async def chat(self, prompt: str, response_model: Type[BaseModel], context: Optional[str] = None) -> BaseModel:
+        self.events.append("chat")
+        return response_model(**fake_object(response_model.model_json_schema()))
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        self.events.append("stream")
+        await asyncio.sleep(0.1)
+        self.events.append("summary started")
+        yield "A generated summary."
+
+    async def chat_with_image(self, prompt: str, image_data: bytes, mime_type: str,
+                              response_model: Type[BaseModel]) -> BaseModel:
+        self.events.append("chat_with_image")
+        return response_model(**fake_object(response_model.model_json_schema()))
+
+
+def test_table_is_asked_for_once_the_summary_has_cached_the_shared_context(tmp_path: Path):
+    storage = LocalStorage(tmp_path)
+    shutil.copy(DATA_DIR / "papers" / f"{PAPER_ID}.pdf", storage.papers_dir)
+    shutil.copy(DATA_DIR / "metadata" / f"{PAPER_ID}.json", storage.metadata_dir)
+    llm = OrderedLLM()
+    extractor = ContentExtractor(storage, ContentExtractorConfig(max_workers=1))
+    # Without budgets the summary and table prompts share the whole paper as their context
+    pruner = ContentPruner(ContentPrunerConfig(token_budgets={}))
+    analyzer = TextDumpAnalyzer(storage, extractor, llm, content_pruner=pruner)
+
+    try:
+        analysis = asyncio.run(analyzer.analyze_paper(PAPER_ID))
+    finally:
+        extractor.close()
+
+    assert analysis.summary == "A generated summary."
+    # No call warms the cache, the table calls follow the start of the summary
+    assert llm.events[:2] == ["stream", "summary started"]
+    assert "chat" in llm.events[2:]